@@ -0,0 +1,123 @@
+#===============================================================================
+#   Author: (c) 2024 Andrea Alberti
+#===============================================================================
+
+# Synthetic pane contents for the benchmarks, and the directory tree they
+# refer to. The contents are generated from a fixed seed, so that the same
+# corpus is scanned by every release. About half of the paths mentioned in
+# the contents exist in the tree; the other half lets the file scheme
+# reject candidates, as it does with most words in a real pane.
+
+import os
+import random
+from typing import Callable, Iterator
+
+# Directory tree: modules with C sources and headers, a Python package,
+# documents, and symbolic links
+MODULES = 40
+FILES_PER_MODULE = 25
+PYTHON_MODULES = 60
+
+def build_tree(root:str) -> None:
+    """Create the directory tree referred to by the corpora under `root`."""
+    for module in range(MODULES):
+        os.makedirs(os.path.join(root, "src", f"module_{module}"), exist_ok=True)
+        for file in range(FILES_PER_MODULE):
+            open(os.path.join(root, "src", f"module_{module}", f"file_{file}.c"), "w").close()
+    os.makedirs(os.path.join(root, "include"), exist_ok=True)
+    for module in range(MODULES):
+        open(os.path.join(root, "include", f"module_{module}.h"), "w").close()
+    os.makedirs(os.path.join(root, "pkg", "sub"), exist_ok=True)
+    for module in range(PYTHON_MODULES):
+        open(os.path.join(root, "pkg", f"mod_{module}.py"), "w").close()
+    os.makedirs(os.path.join(root, "docs"), exist_ok=True)
+    for name in ("README.md", "CHANGELOG.md", "notes.txt", "résumé.pdf"):
+        open(os.path.join(root, "docs", name), "w").close()
+    os.symlink("docs/README.md", os.path.join(root, "README.md"))
+    os.symlink("src/module_0", os.path.join(root, "current"))
+
+def _source_path(rng:random.Random) -> str:
+    # Half of the paths do not exist
+    module = rng.randrange(2 * MODULES)
+    return f"src/module_{module}/file_{rng.randrange(FILES_PER_MODULE)}.c"
+
+def compiler_output(rng:random.Random) -> Iterator[str]:
+    while True:
+        path = _source_path(rng)
+        line = rng.randrange(1, 2000)
+        column = rng.randrange(1, 80)
+        kind = rng.choice(("error", "warning", "note"))
+        yield f"In file included from include/module_{rng.randrange(2 * MODULES)}.h:{rng.randrange(1, 300)},"
+        yield f"{path}:{line}:{column}: {kind}: unused variable 'tmp_{rng.randrange(100)}' [-Wunused-variable]"
+        yield f"  {line:4d} |     int tmp_{rng.randrange(100)} = compute(buffer, size);"
+        yield "       |         ^~~~~"
+        if rng.random() < 0.2:
+            yield f"gcc -O2 -Wall -Iinclude -c {path} -o build/{os.path.basename(path)[:-2]}.o"
+
+def python_tracebacks(rng:random.Random) -> Iterator[str]:
+    while True:
+        yield "Traceback (most recent call last):"
+        for _ in range(rng.randrange(2, 6)):
+            module = rng.randrange(2 * PYTHON_MODULES)
+            yield f"  File \"pkg/mod_{module}.py\", line {rng.randrange(1, 900)}, in handler_{rng.randrange(50)}"
+            yield f"    result = process(item, options=config_{rng.randrange(20)})"
+        yield f"ValueError: invalid literal for int() with base 10: 'x{rng.randrange(1000)}'"
+        yield ""
+
+def ls_long(rng:random.Random) -> Iterator[str]:
+    names = [f"module_{module}" for module in range(2 * MODULES)] + ["README.md", "CHANGELOG.md", "notes.txt", "résumé.pdf", "current"]
+    while True:
+        yield f"total {rng.randrange(100, 9000)}"
+        for _ in range(rng.randrange(5, 30)):
+            name = rng.choice(names)
+            if name == "current":
+                yield f"lrwxrwxrwx  1 andrea staff    12 Jan 12 09:41 current -> src/module_0"
+            elif name.startswith("module_"):
+                yield f"drwxr-xr-x  {rng.randrange(2, 9)} andrea staff  4096 Mar  {rng.randrange(1, 29):2d} 14:{rng.randrange(60):02d} {name}"
+            else:
+                yield f"-rw-r--r--  1 andrea staff {rng.randrange(100, 99999):5d} Feb {rng.randrange(1, 29):2d} 10:{rng.randrange(60):02d} {name}"
+
+def access_log(rng:random.Random) -> Iterator[str]:
+    paths = ("/", "/index.html", "/api/v1/items", "/static/app.js", "/login", "/search?q=tmux+fzf")
+    agents = ("Mozilla/5.0 (X11; Linux x86_64)", "curl/8.4.0", "python-requests/2.31.0")
+    while True:
+        ip = f"{rng.randrange(1, 255)}.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(1, 255)}"
+        referrer = f"https://www.example{rng.randrange(40)}.com/page/{rng.randrange(500)}"
+        yield f"{ip} - - [10/Oct/2024:13:{rng.randrange(60):02d}:{rng.randrange(60):02d} +0000] \"GET {rng.choice(paths)} HTTP/1.1\" {rng.choice((200, 200, 304, 404, 500))} {rng.randrange(100, 50000)} \"{referrer}\" \"{rng.choice(agents)}\""
+        if rng.random() < 0.05:
+            yield f"upstream timed out while connecting to {rng.randrange(10, 11)}.0.{rng.randrange(256)}.{rng.randrange(1, 255)}:8080, see http://status.example.org/incidents/{rng.randrange(100)}"
+
+def git_remotes(rng:random.Random) -> Iterator[str]:
+    while True:
+        user = f"user{rng.randrange(200)}"
+        repo = f"project-{rng.randrange(500)}"
+        yield f"$ git remote -v"
+        yield f"origin\tgit@github.com:{user}/{repo}.git (fetch)"
+        yield f"origin\tgit@github.com:{user}/{repo}.git (push)"
+        yield f"upstream\thttps://github.com/org{rng.randrange(30)}/{repo}.git (fetch)"
+        yield f"upstream\thttps://github.com/org{rng.randrange(30)}/{repo}.git (push)"
+
+CORPORA:dict[str,Callable[[random.Random],Iterator[str]]] = {
+    "compiler": compiler_output,
+    "traceback": python_tracebacks,
+    "ls": ls_long,
+    "access_log": access_log,
+    "git_remote": git_remotes,
+}
+
+def mixed(rng:random.Random) -> Iterator[str]:
+    """Alternate blocks of lines from all other corpora, like a long-lived terminal."""
+    generators = [generator(rng) for generator in CORPORA.values()]
+    while True:
+        generator = rng.choice(generators)
+        for _ in range(rng.randrange(20, 200)):
+            yield next(generator)
+
+CORPORA["mixed"] = mixed
+
+def generate(corpus:str, lines:int, seed:int = 0) -> str:
+    """Return the content of a pane with the given number of lines."""
+    generator = CORPORA[corpus](random.Random(f"{corpus}-{seed}"))
+    return "\n".join(next(generator) for _ in range(lines))
+
+__all__ = ["CORPORA", "build_tree", "generate"]
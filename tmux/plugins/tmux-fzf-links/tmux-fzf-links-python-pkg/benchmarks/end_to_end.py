@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+
+#===============================================================================
+#   Author: (c) 2024 Andrea Alberti
+#===============================================================================
+
+# End-to-end latency of the plugin without a terminal, e.g., on a headless
+# machine. Stand-in `tmux`, `fzf` and editor executables are put first on
+# PATH; `fzf-links.tmux` is run as tmux would load it, and the key binding
+# it registers is run as tmux would when the key is pressed. The whole path
+# is timed: the shell of the key binding, the client of the daemon or the
+# interpreter start-up, `run`, `run_fzf`, and `spawn_daemon` launching the
+# editor or `TmuxDisplayHandler` showing a message.
+#
+# The stand-in tmux serves a synthetic pane (see `corpora.py`) whose current
+# path is a directory tree referred to by the pane, runs popups directly, and
+# records the time of each popup and message. The stand-in fzf selects the
+# first choice matching `--select`, as soon as it is received, and records
+# the time at which enter is pressed. The editor records its start.
+#
+# Scenarios:
+#   open     key to popup, enter to editor launched, enter to plugin exit
+#   no-link  key to message, for a pane without links
+# Modes are those of the key binding: `process` (default), `fast-start`
+# (`@fzf-links-fast-start`), and `daemon` (`@fzf-links-daemon`).
+#
+# Times are taken with the realtime clock, which is shared with the `date`
+# command used by the stand-ins written in shell (GNU `date` is required).
+#
+# Usage (from `tmux-fzf-links-python-pkg`):
+#   python3 benchmarks/end_to_end.py [--runs N] [--lines N] [--mode MODE]
+#       [--scenario SCENARIO] [--option NAME=VALUE] [--label NAME] [--output FILE]
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import re
+import math
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+PKG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+PLUGIN_DIR = os.path.join(PKG_DIR, "..")
+sys.path.insert(0, PKG_DIR)
+
+from corpora import build_tree, generate
+
+from tmux_fzf_links.client import stop_server
+from tmux_fzf_links.pane_context import PANE_FORMAT
+
+# Stand-in tmux; its state is kept in the files of `$FAKE_TMUX_DIR`:
+#   options/NAME  value of the global option NAME
+#   metadata      reply to `display -p` with the pane format
+#   content       reply to `capture-pane`
+#   binding       command of the last key binding
+#   events        time, event and argument of popups and messages
+#   log           log file of the plugin
+FAKE_TMUX = r"""#!/bin/sh
+state=$FAKE_TMUX_DIR
+record() { printf '%s\t%s\t%s\n' "$(date +%s%N)" "$1" "$2" >> "$state/events"; }
+for last; do :; done
+case "$1" in
+  show|show-options)
+    # show -gqv NAME
+    [ -f "$state/options/$last" ] && cat "$state/options/$last"
+    ;;
+  display|display-message)
+    if [ "$2" = "-p" ]; then
+      case "$3" in
+        '#{socket_path}') echo "$state/socket" ;;
+        '#{pid}') cat "$state/pid" ;;
+        *) cat "$state/metadata" ;;
+      esac
+      # display -p FORMAT ; capture-pane ...
+      case " $* " in *" capture-pane "*) cat "$state/content" ;; esac
+    else
+      record message "$last"
+    fi
+    ;;
+  capture-pane)
+    cat "$state/content"
+    ;;
+  popup|display-popup)
+    record popup ""
+    exec sh -c "$last"
+    ;;
+  bind-key|bind)
+    printf '%s' "$last" > "$state/binding"
+    ;;
+  *)
+    record command "$*"
+    ;;
+esac
+"""
+
+# Stand-in fzf: select the first choice matching the pattern, without
+# waiting for the remaining choices
+FAKE_FZF = r"""#!{python}
+import os, re, sys, time
+pattern = re.compile(os.environ["FAKE_FZF_SELECT"])
+ansi = re.compile(r"\x1b\[[0-9;]*m")
+# Like `--read0` and `--print0`, which the plugin passes
+separator = b"\0" if "--read0" in sys.argv else b"\n"
+def choices():
+    pending = b""
+    while (block := sys.stdin.buffer.read1(65536)):
+        *lines, pending = (pending + block).split(separator)
+        yield from lines
+    if pending:
+        yield pending
+for choice in choices():
+    # Like `--ansi`, which the plugin passes when colors are enabled
+    line = ansi.sub("", choice.decode())
+    if pattern.search(line):
+        break
+else:
+    sys.exit(130)
+with open(os.path.join(os.environ["FAKE_TMUX_DIR"], "events"), "a") as events:
+    events.write(f"{time.time_ns()}\tenter\t\n")
+end = "\0" if "--print0" in sys.argv else "\n"
+sys.stdout.write(f"OPEN{end}{line}{end}")
+"""
+
+FAKE_EDITOR = r"""#!/bin/sh
+printf '%s\t%s\t%s\n' "$(date +%s%N)" editor "$1" >> "$FAKE_TMUX_DIR/events"
+"""
+
+MODES = ("process", "fast-start", "daemon",)
+SCENARIOS = ("open", "no-link",)
+
+# Seconds to wait for the plugin or for the daemon
+TIMEOUT = 30
+
+def write_executable(path:str, text:str) -> None:
+    with open(path, "w") as file:
+        file.write(text)
+    os.chmod(path, 0o755)
+
+def pane_metadata(pane_id:str, current_path:str) -> str:
+    """Render the pane format of the plugin for a pane of 50 rows and 200 columns."""
+    values = {
+        "pane_id": pane_id,
+        "pane_height": "50",
+        "pane_width": "200",
+        "scroll_position": "",
+        "history_size": "1000",
+        "cursor_y": "49",
+        "pane_current_path": current_path,
+    }
+    return re.sub(r"#\{(\w+)\}", lambda match: values[match.group(1)], PANE_FORMAT) + "\n"
+
+class Harness:
+    """Stand-in tmux server with a single pane, and the plugin loaded in it."""
+
+    def __init__(self, root:str, lines:int):
+        self.state = os.path.join(root, "state")
+        self.bindir = os.path.join(root, "bin")
+        self.tree = os.path.join(root, "tree")
+        os.makedirs(os.path.join(self.state, "options"))
+        os.makedirs(self.bindir)
+        os.makedirs(self.tree)
+        build_tree(self.tree)
+
+        write_executable(os.path.join(self.bindir, "tmux"), FAKE_TMUX)
+        write_executable(os.path.join(self.bindir, "fzf"), FAKE_FZF.replace("{python}", sys.executable))
+        write_executable(os.path.join(self.bindir, "editor"), FAKE_EDITOR)
+
+        # The daemon terminates with the process of the tmux server
+        with open(os.path.join(self.state, "pid"), "w") as pid_file:
+            pid_file.write(str(os.getpid()))
+        with open(os.path.join(self.state, "metadata"), "w") as metadata_file:
+            metadata_file.write(pane_metadata("%1", self.tree))
+        self.set_content(generate("mixed", lines))
+
+        self.env = dict(os.environ)
+        self.env.pop("TMUX", None)
+        self.env.update({
+            "PATH": f"{self.bindir}:{os.environ['PATH']}",
+            "FAKE_TMUX_DIR": self.state,
+            "FAKE_FZF_SELECT": r"\[file\]",
+            "XDG_CACHE_HOME": os.path.join(root, "cache"),
+        })
+        self.daemon_socket = os.path.join(self.state, "socket-fzf-links.sock")
+
+    def set_content(self, content:str) -> None:
+        with open(os.path.join(self.state, "content"), "w") as content_file:
+            content_file.write(content)
+
+    def load_plugin(self, mode:str, loglevel_tmux:str, extra_options:dict[str,str]|None = None) -> None:
+        """Set the options and run `fzf-links.tmux`, as tmux does when loading the plugin."""
+        options = {
+            "@fzf-links-python": sys.executable,
+            "@fzf-links-editor-open-cmd": f"{os.path.join(self.bindir, 'editor')} '%file' %line",
+            "@fzf-links-loglevel-tmux": loglevel_tmux,
+            # Errors only; DEBUG messages would enable the accounting of the scheme costs
+            "@fzf-links-log-filename": os.path.join(self.state, "log"),
+            "@fzf-links-loglevel-file": "WARNING",
+            "@fzf-links-daemon": "on" if mode == "daemon" else "off",
+            "@fzf-links-fast-start": "on" if mode == "fast-start" else "off",
+            **(extra_options or {}),
+        }
+        for name in os.listdir(os.path.join(self.state, "options")):
+            os.unlink(os.path.join(self.state, "options", name))
+        for name, value in options.items():
+            with open(os.path.join(self.state, "options", name), "w") as option_file:
+                option_file.write(value + "\n")
+
+        stop_server(self.daemon_socket)
+        subprocess.run(["bash", os.path.join(PLUGIN_DIR, "fzf-links.tmux")], env=self.env, check=True)
+        if mode == "daemon":
+            deadline = time.monotonic() + TIMEOUT
+            while not os.path.exists(self.daemon_socket):
+                if time.monotonic() > deadline:
+                    sys.exit("the daemon did not start")
+                time.sleep(0.01)
+
+    def press_key(self) -> tuple[int,int,list[tuple[int,str,str]]]:
+        """Run the key binding; return the time of the key press and of the exit, and the events."""
+        with open(os.path.join(self.state, "binding")) as binding_file:
+            binding = binding_file.read()
+        # Formats expanded by `run-shell`
+        command = binding.replace("#{client_name}", "/dev/pts/0").replace("#{pane_id}", "%1")
+        open(os.path.join(self.state, "events"), "w").close()
+
+        key_ns = time.time_ns()
+        result = subprocess.run(["sh", "-c", command], env=self.env, cwd=self.tree, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, timeout=TIMEOUT)
+        exit_ns = time.time_ns()
+        if result.returncode != 0:
+            sys.exit(f"the key binding failed: {result.stderr}")
+        return (key_ns, exit_ns, self.events(),)
+
+    def events(self) -> list[tuple[int,str,str]]:
+        with open(os.path.join(self.state, "events")) as events_file:
+            return [(int(stamp), event, argument,) for stamp, event, argument in (line.rstrip("\n").split("\t", 2) for line in events_file)]
+
+    def wait_event(self, event:str) -> tuple[int,str,str]:
+        """Wait for an event recorded by a detached process, e.g., the editor."""
+        deadline = time.monotonic() + TIMEOUT
+        while True:
+            for recorded in self.events():
+                if recorded[1] == event:
+                    return recorded
+            if time.monotonic() > deadline:
+                sys.exit(f"no {event} event was recorded; see the log: {self.log()}")
+            time.sleep(0.001)
+
+    def log(self) -> str:
+        try:
+            with open(os.path.join(self.state, "log")) as log_file:
+                return log_file.read()
+        except FileNotFoundError:
+            return ""
+
+    def close(self) -> None:
+        stop_server(self.daemon_socket)
+
+def first(events:list[tuple[int,str,str]], event:str) -> tuple[int,str,str]:
+    for recorded in events:
+        if recorded[1] == event:
+            return recorded
+    sys.exit(f"no {event} event was recorded: {events}")
+
+def measure_open(harness:Harness) -> dict[str,float]:
+    key_ns, exit_ns, events = harness.press_key()
+    popup_ns = first(events, "popup")[0]
+    enter_ns = first(events, "enter")[0]
+    editor_ns, _, opened = harness.wait_event("editor")
+    assert os.path.exists(opened), opened
+    return {
+        "key_to_popup_ms": (popup_ns - key_ns) / 1e6,
+        "enter_to_editor_ms": (editor_ns - enter_ns) / 1e6,
+        "enter_to_exit_ms": (exit_ns - enter_ns) / 1e6,
+    }
+
+def measure_no_link(harness:Harness) -> dict[str,float]:
+    key_ns, exit_ns, events = harness.press_key()
+    message_ns, _, message = first(events, "message")
+    assert "no link found" in message, message
+    return {
+        "key_to_message_ms": (message_ns - key_ns) / 1e6,
+        "key_to_exit_ms": (exit_ns - key_ns) / 1e6,
+    }
+
+def summarize(samples:list[dict[str,float]]) -> dict[str,dict[str,float]]:
+    summary:dict[str,dict[str,float]] = {}
+    for metric in samples[0]:
+        values = sorted(sample[metric] for sample in samples)
+        summary[metric] = {
+            "min": values[0],
+            "median": statistics.median(values),
+            "p90": values[math.ceil(0.9 * len(values)) - 1], # nearest rank
+            "max": values[-1],
+        }
+    return summary
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--lines", type=int, default=1000, help="lines of the pane")
+    parser.add_argument("--mode", action="append", choices=MODES, help="mode of the key binding (repeatable; default: all)")
+    parser.add_argument("--scenario", action="append", choices=SCENARIOS, help="scenario (repeatable; default: all)")
+    parser.add_argument("--option", action="append", default=[], metavar="NAME=VALUE", help="option of the plugin, e.g. @fzf-links-panes=window (repeatable)")
+    parser.add_argument("--label", default="", help="label stored with the results, e.g. a revision")
+    parser.add_argument("--output", default="", help="JSON file (default: stdout)")
+    args = parser.parse_args()
+    extra_options = dict(option.split("=", 1) for option in args.option)
+
+    if subprocess.run(["date", "+%N"], stdout=subprocess.PIPE, text=True).stdout.strip() in ("", "N", "%N"):
+        sys.exit("GNU date is required to record the time with nanoseconds")
+
+    report:dict = {
+        "label": args.label,
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "runs": args.runs,
+        "lines": args.lines,
+        "options": extra_options,
+        "results": [],
+    }
+
+    with tempfile.TemporaryDirectory() as root:
+        harness = Harness(root, args.lines)
+        try:
+            for scenario in args.scenario or SCENARIOS:
+                if scenario == "open":
+                    harness.set_content(generate("mixed", args.lines))
+                else:
+                    # Words that are neither files nor links
+                    harness.set_content("\n".join(f"nothing to open here {idx}" for idx in range(args.lines)))
+                for mode in args.mode or MODES:
+                    harness.load_plugin(mode, "WARNING" if scenario == "open" else "INFO", extra_options)
+                    measure = measure_open if scenario == "open" else measure_no_link
+                    # The first run builds the bundle, starts the caches of the daemon, etc.
+                    measure(harness)
+                    samples = [measure(harness) for _ in range(args.runs)]
+                    summary = summarize(samples)
+                    report["results"].append({"scenario": scenario, "mode": mode, "metrics": summary, "samples": samples})
+                    print(
+                        f"{scenario:8s} {mode:11s} " + "  ".join(
+                            f"{metric[:-3]} {values['median']:7.1f} ms (p90 {values['p90']:7.1f})"
+                            for metric, values in summary.items()
+                        ),
+                        file=sys.stderr
+                    )
+        finally:
+            harness.close()
+
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(report, output_file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+
+#===============================================================================
+#   Author: (c) 2024 Andrea Alberti
+#===============================================================================
+
+# Micro-benchmark of the latency between the exit of fzf and the moment the
+# plugin knows the selected action, for the handoff of `run_fzf` and for the
+# previous one (a temporary directory with named pipes for stdout and
+# stderr, read one after the other, then waiting for the `tmux popup`
+# client to exit).
+#
+# A stand-in fzf records the time of its exit and selects the first choice.
+# By default, a stand-in `tmux` runs the popup command directly; with
+# `--tmux`, real popups are opened on the current tmux client, which also
+# accounts for the time taken by tmux to close the popup.
+#
+# Usage (from `tmux-fzf-links-python-pkg`):
+#   python3 benchmarks/result_channel.py [--runs N] [--tmux]
+
+import argparse
+import os
+import shlex
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from tmux_fzf_links.fzf_handler import run_fzf
+
+FAKE_FZF = """#!{python}
+import os, sys, time
+sys.stdin.read()
+sys.stdout.write("OPEN\\n   1 - [url] - https://example.com\\n")
+sys.stdout.flush()
+with open({stamp!r}, "w") as stamp:
+    stamp.write(str(time.monotonic_ns()))
+os._exit(0)
+"""
+
+# Runs the popup command, which is the last argument, like `tmux popup -E`
+FAKE_TMUX = """#!/bin/sh
+for command; do :; done
+exec sh -c "$command"
+"""
+
+CHOICES = [f"{idx:4d} - [url] - https://example.com/{idx}" for idx in range(1, 201)]
+
+def previous_handoff(fzf_path:str) -> str:
+    """Handoff used before the result pipe: stdout and stderr pipes read one after the other."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        stdout_pipe = os.path.join(tmpdir, 'fzf_stdout')
+        stderr_pipe = os.path.join(tmpdir, 'fzf_stderr')
+        os.mkfifo(stdout_pipe)
+        os.mkfifo(stderr_pipe)
+        fzf_command = (
+            f"echo \"{chr(10).join(CHOICES)}\" | {fzf_path} "
+            f"> {shlex.quote(stdout_pipe)} 2> {shlex.quote(stderr_pipe)}"
+        )
+        tmux_process = subprocess.Popen(["tmux", "popup", "-E", fzf_command])
+        with open(stdout_pipe) as stdout_file, open(stderr_pipe) as stderr_file:
+            stdout = stdout_file.read().strip()
+            stderr_file.read()
+        tmux_process.wait()
+    return stdout.splitlines()[0]
+
+# Size of the pane on which the popups are opened
+pane_size:tuple[int,int] = (50, 200,)
+
+def current_handoff(fzf_path:str) -> str:
+    return run_fzf(fzf_path, "", CHOICES, False, *pane_size)["action"]
+
+def measure(handoff, fzf_path:str, stamp_path:str, runs:int) -> list[float]:
+    """Return the latencies in milliseconds."""
+    latencies:list[float] = []
+    for _ in range(runs):
+        action = handoff(fzf_path)
+        done_ns = time.monotonic_ns()
+        assert action == "OPEN", action
+        with open(stamp_path) as stamp:
+            latencies.append((done_ns - int(stamp.read())) / 1e6)
+        # tmux does not open a popup on a client while another one is closing
+        time.sleep(0.1)
+    return latencies
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=30)
+    parser.add_argument("--tmux", action="store_true", help="open real popups on the current tmux client")
+    args = parser.parse_args()
+
+    global pane_size
+    if args.tmux:
+        if not os.environ.get("TMUX"):
+            sys.exit("--tmux requires running inside tmux")
+        height, width = subprocess.check_output(["tmux", "display", "-p", "#{pane_height} #{pane_width}"], text=True).split()
+        pane_size = (int(height), int(width),)
+
+    with tempfile.TemporaryDirectory() as bindir:
+        stamp_path = os.path.join(bindir, "fzf_exit")
+        fzf_path = os.path.join(bindir, "fzf")
+        with open(fzf_path, "w") as fzf_file:
+            fzf_file.write(FAKE_FZF.format(python=sys.executable, stamp=stamp_path))
+        os.chmod(fzf_path, 0o755)
+
+        if not args.tmux:
+            with open(os.path.join(bindir, "tmux"), "w") as tmux_file:
+                tmux_file.write(FAKE_TMUX)
+            os.chmod(os.path.join(bindir, "tmux"), 0o755)
+            os.environ["PATH"] = f"{bindir}:{os.environ['PATH']}"
+
+        print(f"fzf exit to action, {args.runs} runs, {'tmux popups' if args.tmux else 'stand-in tmux'}")
+        for name, handoff in (("previous (stdout/stderr pipes)", previous_handoff), ("current (result pipe)", current_handoff)):
+            latencies = sorted(measure(handoff, fzf_path, stamp_path, args.runs))
+            print(f"  {name:32s} median {statistics.median(latencies):7.2f} ms   p90 {latencies[int(0.9 * (len(latencies) - 1))]:7.2f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+
+#===============================================================================
+#   Author: (c) 2024 Andrea Alberti
+#===============================================================================
+
+# Benchmark of the scan engine on synthetic panes (see `corpora.py`): compiler
+# output, Python tracebacks, `ls -la` listings, access logs, `git remote -v`,
+# and a mix of them, from 1k to 1M lines. The panes refer to a directory tree
+# created in a temporary directory, which is the current path of the pane.
+#
+# Each stage of the pipeline of `run` is timed separately:
+#   normalize       NFC normalization of the content
+#   scan            walk of all regexes of all schemes (no pre_handler)
+#   regex           regexes of each scheme on their own
+#   pre_handlers    pre_handlers of each scheme, once per distinct text
+#   index           one item per text, sorted by last occurrence
+#   format          choices offered in fzf
+#   total           the stages above as chained by `run`
+# Each stage is run `--repeat` times and the best time is kept. The scheme
+# sets are the default schemes, and the default schemes with the sample
+# `user_schemes.py` shipped with the plugin. Colors are enabled with a fixed
+# LS_COLORS, so that the file scheme looks up the color of each file.
+#
+# The results are written as JSON to `--output` (or stdout), so that runs of
+# different revisions can be compared; a summary is printed to stderr.
+#
+# Usage (from `tmux-fzf-links-python-pkg`):
+#   python3 benchmarks/scan_engine.py [--sizes 1000,10000] [--corpus mixed]
+#       [--schemes default] [--repeat 3] [--label NAME] [--output FILE]
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import unicodedata
+from typing import Callable, Match
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from corpora import CORPORA, build_tree, generate
+
+from tmux_fzf_links.__main__ import load_schemes, number_items
+from tmux_fzf_links.candidate_store import Item
+from tmux_fzf_links.candidate_index import index_candidates
+from tmux_fzf_links.colors import colors
+from tmux_fzf_links.opener import PreHandledMatch, SchemeEntry
+from tmux_fzf_links.scan_cache import scan_candidates
+from tmux_fzf_links.scan_pool import pre_handle
+from tmux_fzf_links.scanner import Scanner, get_scanner
+from tmux_fzf_links.stat_cache import clear_stat_cache
+
+USER_SCHEMES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "user_schemes", "user_schemes.py")
+
+SCHEME_SETS:dict[str,str] = {
+    "default": "",
+    "default+user": USER_SCHEMES_PATH,
+}
+
+LS_COLORS = "rs=0:di=01;34:ln=01;36:ex=01;32:*.c=00;33:*.h=00;35:*.py=00;32:*.md=01;37:*.pdf=00;31"
+
+def best_of(repeat:int, function:Callable[[],object]) -> tuple[float,object]:
+    """Return the shortest time in milliseconds of `repeat` calls, and the result of the last call."""
+    best = float("inf")
+    result:object = None
+    for _ in range(repeat):
+        # Files are looked up again at each invocation of the plugin
+        clear_stat_cache()
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    return (best * 1e3, result,)
+
+def normalize(content:str) -> str:
+    if not content.isascii():
+        return unicodedata.normalize("NFC", content)
+    return content
+
+def scheme_lanes(scanner:Scanner) -> dict[int,set[int]]:
+    """Return the lanes of each scheme."""
+    lanes:dict[int,set[int]] = {}
+    for idx, (scheme_index, _) in enumerate(scanner.lane_owners):
+        lanes.setdefault(scheme_index, set()).add(idx)
+    return lanes
+
+def pre_handle_lanes(scanner:Scanner, matches:list[list[Match[str]]], lanes:set[int]) -> list[list[tuple[Match[str],PreHandledMatch]]]:
+    """Call the pre_handlers of the given lanes once per distinct text, as the scan does."""
+    accepted:list[list[tuple[Match[str],PreHandledMatch]]] = [[] for _ in matches]
+    for idx in lanes:
+        scheme = scanner.schemes[scanner.lane_owners[idx][0]]
+        memo:dict[str,PreHandledMatch|None] = {}
+        for match in matches[idx]:
+            text = match.group(0)
+            try:
+                pre_handled_match = memo[text]
+            except KeyError:
+                pre_handled_match = pre_handle(scheme, match)
+                memo[text] = pre_handled_match
+            if pre_handled_match:
+                accepted[idx].append((match, pre_handled_match,))
+    return accepted
+
+def max_len_tags(schemes:list[SchemeEntry]) -> int:
+    return max(len(tag) for scheme in schemes for tag in scheme["tags"])
+
+def benchmark(schemes:list[SchemeEntry], content:str, repeat:int) -> dict:
+    """Time each stage of the scan of a content."""
+    scanner = get_scanner(schemes)
+    result:dict = {"lines": content.count("\n") + 1, "chars": len(content)}
+
+    result["normalize_ms"], content = best_of(repeat, lambda: normalize(content))
+    result["scan_ms"], matches = best_of(repeat, lambda: scanner.scan_lanes(content))
+    result["matches"] = sum(len(lane) for lane in matches)
+
+    by_scheme:dict[str,dict] = {}
+    accepted:list[list[tuple[Match[str],PreHandledMatch]]] = [[] for _ in matches]
+    for scheme_index, lanes in scheme_lanes(scanner).items():
+        regex_ms, _ = best_of(repeat, lambda: scanner.scan_lanes(content, lanes=lanes))
+        pre_handlers_ms, scheme_accepted = best_of(repeat, lambda: pre_handle_lanes(scanner, matches, lanes))
+        for idx in lanes:
+            accepted[idx] = scheme_accepted[idx]
+        by_scheme["/".join(schemes[scheme_index]["tags"])] = {
+            "regex_ms": regex_ms,
+            "pre_handlers_ms": pre_handlers_ms,
+            "matches": sum(len(matches[idx]) for idx in lanes),
+            "accepted": sum(len(scheme_accepted[idx]) for idx in lanes),
+        }
+    result["schemes"] = by_scheme
+    result["regex_ms"] = sum(scheme["regex_ms"] for scheme in by_scheme.values())
+    result["pre_handlers_ms"] = sum(scheme["pre_handlers_ms"] for scheme in by_scheme.values())
+
+    candidates = [
+        (scanner.lane_owners[idx][0], match, pre_handled_match,)
+        for idx, lane in enumerate(accepted)
+        for match, pre_handled_match in lane
+    ]
+    def index():
+        items = [Item(text, indexed) for text, indexed in index_candidates(schemes, candidates).items()]
+        items.sort(key=lambda item: item.last_position, reverse=True)
+        return items
+    result["index_ms"], items = best_of(repeat, index)
+    result["items"] = len(items)
+
+    max_len_tag_names = max_len_tags(schemes)
+    result["format_ms"], _ = best_of(repeat, lambda: number_items(list(enumerate(items, 1)), max_len_tag_names))
+
+    def total():
+        normalized = normalize(content)
+        scanned = scan_candidates(scanner, normalized, "%0", os.getcwd())
+        items = [Item(text, indexed) for text, indexed in index_candidates(schemes, scanned).items()]
+        items.sort(key=lambda item: item.last_position, reverse=True)
+        return number_items(list(enumerate(items, 1)), max_len_tag_names)
+    result["total_ms"], _ = best_of(repeat, total)
+    return result
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="1000,10000,100000,1000000", help="comma-separated numbers of lines")
+    parser.add_argument("--corpus", action="append", choices=list(CORPORA), help="corpus to scan (repeatable; default: all)")
+    parser.add_argument("--schemes", action="append", choices=list(SCHEME_SETS), help="scheme set (repeatable; default: all)")
+    parser.add_argument("--repeat", type=int, default=3, help="keep the best of this many runs")
+    parser.add_argument("--label", default="", help="label stored with the results, e.g. a revision")
+    parser.add_argument("--output", default="", help="JSON file (default: stdout)")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    corpora = args.corpus or list(CORPORA)
+    scheme_sets = args.schemes or list(SCHEME_SETS)
+
+    colors.enable_colors(True)
+    colors.configure_ls_colors_from_str(LS_COLORS)
+
+    report:dict = {
+        "label": args.label,
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "repeat": args.repeat,
+        "results": [],
+    }
+
+    with tempfile.TemporaryDirectory() as tree:
+        build_tree(tree)
+        os.chdir(tree)
+        for scheme_set in scheme_sets:
+            schemes, _ = load_schemes(SCHEME_SETS[scheme_set])
+            for corpus in corpora:
+                for lines in sizes:
+                    content = generate(corpus, lines)
+                    result = {"schemes_set": scheme_set, "corpus": corpus, **benchmark(schemes, content, args.repeat)}
+                    report["results"].append(result)
+                    print(
+                        f"{scheme_set:13s} {corpus:11s} {lines:8d} lines  "
+                        f"scan {result['scan_ms']:9.1f}  pre_handlers {result['pre_handlers_ms']:9.1f}  "
+                        f"index {result['index_ms']:8.1f}  format {result['format_ms']:8.1f}  "
+                        f"total {result['total_ms']:9.1f} ms  ({result['items']} items)",
+                        file=sys.stderr
+                    )
+
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(report, output_file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+if __name__ == "__main__":
+    main()
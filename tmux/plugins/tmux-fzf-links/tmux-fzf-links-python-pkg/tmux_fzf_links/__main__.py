@@ -4,18 +4,18 @@
 #   Author: (c) 2024 Andrea Alberti
 #===============================================================================
 
+# Modules only needed on some code paths (e.g., `subprocess`, `pathlib`,
+# `importlib.util`, `unicodedata`, `default_schemes`, `fzf_handler`, and
+# those of the optional features) are imported where they are used to keep
+# the start-up time low
+
 import os
-import re
-import subprocess
 import sys
+import time
 import logging
-import importlib.util
-import pathlib
-import unicodedata
 
-from tmux_fzf_links.fzf_handler import FzfReturnType, run_fzf
 from tmux_fzf_links.logging import set_up_logger
-from typing import Generator, Match
+from typing import TYPE_CHECKING, Callable, Generator, Hashable
 from .colors import colors
 from .configs import configs
 
@@ -27,11 +27,27 @@ elif sys.version_info < (3, 12):  # For Python 3.8 and older
         return method
         
 from .opener import OpenerType, PreHandledMatch, PostHandledMatch, open_link, SchemeEntry
+from .pane_context import PaneContext, fetch_pane_context, fetch_panes_context, fetch_panes_metadata
+from .tmux_transport import set_transport
+from .scanner import get_scanner
+from .scan_cache import scan_candidates
+from .candidate_index import index_candidates
+from .candidate_store import Item
+from .stat_cache import absolute_path, clear_stat_cache, set_current_directory
+from .tracing import add_span, span, span_steps, start_tracing, write_trace
+from .scheme_costs import cost_accounting_enabled, report_scheme_costs, scheme_cost, start_cost_accounting
+from .scan_guard import report_skipped_schemes, skipped_schemes, start_scan_guard
 from .errors_types import FailedTmuxPaneSize, CommandFailed, FailedChDir, FileLoggingNotAllow, FzfError, FzfNotFound, FzfUserInterrupt, MissingPostHandler, NoBrowserConfigured, NoEditorConfigured, NoSuitableAppFound, PatternNotMatching, LsColorsNotConfigured
-from .default_schemes import default_schemes
+
+if TYPE_CHECKING:
+    from .result_cache import CachedResult
+    from .validation import Validation
 
 def load_user_module(file_path: str) -> tuple[list[SchemeEntry],list[str]]:
     """Dynamically load a Python module from the given file path."""
+    import importlib.util
+    import pathlib
+
     try:
         # Ensure the file path is absolute
         file_path = str(pathlib.Path(file_path).resolve())
@@ -64,10 +80,99 @@ def load_user_module(file_path: str) -> tuple[list[SchemeEntry],list[str]]:
     except Exception as e:
         raise ImportError(f"failed to load user module: {e}")
 
+# Merged schemes cached by user schemes path and modification time, so that
+# a long-lived process (see `server.py`) does not reload the user module
+# on every invocation
+_schemes_cache:dict[tuple[str,int],tuple[list[SchemeEntry],dict[str,int]]] = {}
+
+def load_schemes(user_schemes_path:str) -> tuple[list[SchemeEntry],dict[str,int]]:
+    """Merge user and default schemes, giving precedence to user schemes.
+
+    Return the list of schemes and the dictionary mapping tags to indexes.
+    """
+
+    mtime_ns:int = 0
+    if user_schemes_path:
+        try:
+            mtime_ns = os.stat(user_schemes_path).st_mtime_ns
+        except OSError:
+            # Let `load_user_module` report the error
+            pass
+    cache_key = (user_schemes_path,mtime_ns,)
+    if cache_key in _schemes_cache:
+        return _schemes_cache[cache_key]
+
+    from .default_schemes import default_schemes
+
+    # Load user schemes
+    user_schemes:list[SchemeEntry]
+    rm_default_schemes:list[str]
+    if user_schemes_path:
+        loaded_user_module = load_user_module(user_schemes_path)
+        user_schemes = loaded_user_module[0]
+        for user_scheme in user_schemes:
+            # Translation for backward compatibility
+            if user_scheme["opener"] == OpenerType.CUSTOM:
+                user_scheme["opener"] = OpenerType.CUSTOM_OPEN
+        rm_default_schemes = loaded_user_module[1]
+    else:
+        user_schemes = []
+        rm_default_schemes = []
+    
+    # Merge both schemes giving precedence to user schemes
+
+    # Set of schemes of already checked out
+    schemes:list[SchemeEntry] = []
+    checked:set[str] = set()
+    for scheme in user_schemes + default_schemes:
+        # if none of the tags is already present in 'checked'
+        if all(tag not in checked and tag not in rm_default_schemes for tag in scheme["tags"]):
+            schemes.append(scheme)
+    del checked
+
+    # Create the new dictionary mapping tags to indexes
+    tag_to_index = {
+        tag: index
+        for index, scheme in enumerate(schemes)
+        for tag in scheme.get("tags", [])
+    }
+
+    # Only keep the most recent version of the user schemes
+    _schemes_cache.clear()
+    _schemes_cache[cache_key] = (schemes,tag_to_index,)
+
+    return (schemes,tag_to_index,)
+
 def trim_str(s:str) -> str:
     """Trim leading and trailing spaces from a string."""
     return s.strip()
 
+def number_items(numbered_items:list[tuple[int,Item]], max_len_tag_names:int, max_len_counts:int|None = None, pane_labels:list[str]|None = None) -> list[str]:
+    """Format the items with the given indexes as the choices offered in fzf.
+
+    With `max_len_counts`, the number of occurrences is shown in a column
+    of that many digits. With `pane_labels`, the label of the pane of each
+    item is shown in a column of its own. Each choice starts with the index
+    and the scheme of its item, which fzf does not show.
+    """
+    from .fzf_handler import CHOICE_DELIMITER
+
+    counts:list[str]
+    if max_len_counts is not None:
+        counts = [f"{colors.dash_color}{('×'+str(item.count)).ljust(max_len_counts+1)}{colors.reset_color} " for _, item in numbered_items]
+    else:
+        counts = ["" for _ in numbered_items]
+    labels:list[str]
+    if pane_labels is not None:
+        max_len_labels = max(len(label) for label in pane_labels)
+        labels = [f"{colors.index_color}{pane_labels[item.pane_index].ljust(max_len_labels)}{colors.reset_color} {colors.dash_color}-{colors.reset_color} " for _, item in numbered_items]
+    else:
+        labels = ["" for _ in numbered_items]
+    return [f"{idx}{CHOICE_DELIMITER}{item.scheme_index}{CHOICE_DELIMITER}{colors.index_color}{idx:4d}{colors.reset_color} {count}{colors.dash_color}-{colors.reset_color} {label}" \
+        f"{colors.tag_color}{('['+item.tag+']').ljust(max_len_tag_names+2)}{colors.reset_color} {colors.dash_color}-{colors.reset_color} " \
+        # add 2 character because of `[` and `]` \
+        f"{item.display_text}" for (idx, item), count, label in zip(numbered_items, counts, labels)]
+
 def run(
         history_lines:str,
         editor_open_cmd:str,
@@ -82,8 +187,22 @@ def run(
         use_ls_colors_str:str,
         ls_colors_filename:str,
         hide_fzf_header:str,
+        tmux_transport:str="subprocess",
+        scan_processes:str="0",
+        occurrences:str="off",
+        async_validation:str="off",
+        trace_filename:str="",
+        scheme_time_budget:str="0",
+        scan_timeout:str="0",
+        scheme_timeout:str="0",
+        panes:str="current",
+        result_cache_ttl:str="0",
+        streaming_capture:str="off",
+        preview:str="off",
     ):
 
+    from .fzf_handler import CHOICE_DELIMITER, HIDDEN_FIELDS, FzfReturnType, run_fzf
+
     # First thing: set up the logger
     logger, tmux_log_handler, file_log_handler = set_up_logger(loglevel_tmux,loglevel_file,log_filename)
 
@@ -99,7 +218,29 @@ def run(
         user_schemes_path,
         use_ls_colors_str,
         ls_colors_filename,
-        hide_fzf_header)    
+        hide_fzf_header,
+        tmux_transport,
+        scan_processes,
+        occurrences,
+        async_validation,
+        trace_filename,
+        scheme_time_budget,
+        scan_timeout,
+        scheme_timeout,
+        panes,
+        result_cache_ttl,
+        streaming_capture,
+        preview)
+
+    # Time the stages of this invocation
+    start_tracing(configs.trace_filename)
+
+    # Account the cost of each scheme if it is logged or checked against a budget
+    start_cost_accounting(configs.scheme_time_budget > 0 or (file_log_handler is not None and file_log_handler.level <= logging.DEBUG))
+
+    # Select how tmux commands are run; in the resident server, the
+    # control-mode connection is kept open across requests
+    set_transport(configs.tmux_transport).set_target(os.environ.get("TMUX_PANE"))
 
     # Add extra path if provided
     if path_extension and path_extension not in os.environ["PATH"]:
@@ -118,210 +259,374 @@ def run(
         else:
             colors.configure_ls_colors_from_env()
 
-    # Retrieve the current pane size
-    try:
-        pane_size_str:str = subprocess.check_output(
-            ('tmux', 'display', '-p', '#{pane_height},#{pane_width},#{scroll_position},',),
-            shell=False,
-            text=True,
-        )
-        pane_size_list = pane_size_str.split(',')
-        pane_height = int(pane_size_list[0])
-        pane_width = int(pane_size_list[1])
-
-        scroll_position:int
-        if pane_size_list[2]:
-            scroll_position = int(pane_size_list[2])
+    # Load user schemes and merge them with the default ones
+    with span("load_schemes"):
+        schemes, _ = load_schemes(user_schemes_path)
+
+    with span("get_scanner"):
+        scanner = get_scanner(schemes)
+
+    # Links offered the last time, if the panes have not changed since then
+    # (see `result_cache.py`); with asynchronous validation, the links are
+    # only known once fzf exits
+    cache_key:Hashable|None = None
+    cached:CachedResult|None = None
+    use_result_cache:bool = False
+    if configs.result_cache_ttl > 0 and not configs.async_validation:
+        from .result_cache import result_cache_enabled
+        use_result_cache = result_cache_enabled()
+
+    # Read the content in chunks while scanning it (see `capture_stream.py`)
+    streaming_capture:bool = configs.streaming_capture and configs.panes == "current" and not configs.async_validation
+
+    # Retrieve the pane size, its current path, and its content; with
+    # `@fzf-links-panes`, also those of the other panes, the current one first
+    with span("fetch_pane_context", history_lines=configs.history_lines, panes=configs.panes) as fetch_span:
+        pane_contexts:list[PaneContext]
+        if use_result_cache:
+            from .pane_context import capture_panes
+            from .result_cache import get_result, result_key
+            # The content is only captured if the links are not cached
+            pane_contexts = fetch_panes_metadata(configs.panes)
+            cache_key = result_key(pane_contexts, scanner, configs.history_lines, configs.occurrences, *colors.state())
+            cached = get_result(cache_key)
+            if cached is None and not streaming_capture:
+                capture_panes(pane_contexts, configs.history_lines)
+            fetch_span.set(cached=cached is not None)
+        elif streaming_capture:
+            pane_contexts = fetch_panes_metadata(configs.panes)
+        elif configs.panes == "current":
+            pane_contexts = [fetch_pane_context(configs.history_lines)]
         else:
-            scroll_position = 0
-        
-    except Exception as e:
-        raise FailedTmuxPaneSize(f"tmux pane size could not be determined: {e}")
-
-    # Capture tmux content
-    capture_str:list[str]=[
-        'tmux', 'capture-pane',
-        '-J',
-        '-p',
-        '-S', f'{-scroll_position-configs.history_lines}',
-        '-E', f'{pane_height-scroll_position-1}']
-
-    content = subprocess.check_output(
-            capture_str,
-            shell=False,
-            text=True,
-        )
-
-    # To deal with two different forms of handling diactrics, we normalize the string
-    content = unicodedata.normalize("NFC", content)
-    
-    # Load user schemes
-    user_schemes:list[SchemeEntry]
-    rm_default_schemes:list[str]
-    if user_schemes_path:
-        loaded_user_module = load_user_module(user_schemes_path)
-        user_schemes = loaded_user_module[0]
-        for user_scheme in user_schemes:
-            # Translation for backward compatibility
-            if user_scheme["opener"] == OpenerType.CUSTOM:
-                user_scheme["opener"] = OpenerType.CUSTOM_OPEN
-        rm_default_schemes = loaded_user_module[1]
-        # print(rm_default_schemes)
-    else:
-        user_schemes = []
-        rm_default_schemes = []
-    
-    # Merge both schemes giving precedence to user schemes
-
-    # Set of schemes of already checked out
-    schemes:list[SchemeEntry] = []
-    checked:set[str] = set()
-    for scheme in user_schemes + default_schemes:
-        # if none of the tags is already present in 'checked'
-        if all(tag not in checked and tag not in rm_default_schemes for tag in scheme["tags"]):
-            schemes.append(scheme)
-    del checked
-
-    # Create the new dictionary mapping tags to indexes
-    tag_to_index = {
-        tag: index
-        for index, scheme in enumerate(schemes)
-        for tag in scheme.get("tags", [])
-    }
+            pane_contexts = fetch_panes_context(configs.history_lines, configs.panes)
+        fetch_span.set(chars=sum(len(context["content"]) for context in pane_contexts))
+    pane_context = pane_contexts[0]
+    pane_height = pane_context["pane_height"]
+    pane_width = pane_context["pane_width"]
+
+    # To deal with two different forms of handling diactrics, we normalize the string;
+    # pure ASCII content is already normalized
+    for context in pane_contexts:
+        if not context["content"].isascii():
+            import unicodedata
+            with span("normalize"):
+                context["content"] = unicodedata.normalize("NFC", context["content"])
+    content = pane_context["content"]
+
+    # Labels of the panes, shown if there are several
+    pane_labels:list[str]|None = [context["label"] for context in pane_contexts] if len(pane_contexts) > 1 else None
 
     try:
-        # Find pane current path
-        current_path = subprocess.check_output(
-            ('tmux', 'display', '-p', '#{pane_current_path}',),
-            shell=False,
-            text=True,
-        ).strip()
-        # Set current directory to pane current path
-        os.chdir(current_path)
+        # Set current directory to pane current path; the candidates of the
+        # other panes are resolved against their own (see `stat_cache.py`)
+        os.chdir(pane_context["current_path"])
     except Exception as e:
         raise FailedChDir(f"current directory could not be changed: {e}")
 
-    # We use the unique set as an expedient to sort over
-    # pre_handled_text while keeping the original text
-    seen:set[str] = set()
-    items:list[tuple[PreHandledMatch,str,int,Match[str]]] = []
-
-    # Process each scheme
-    for scheme in schemes:
-        # Use regex.finditer to iterate over all matches
-        for regex in scheme["regex"]:
-            for match in regex.finditer(content):
-            
-                entire_match:str = match.group(0)
-                match_start:int = match.start()
-                
-                # Extract and process the matching string
-                pre_handled_match:PreHandledMatch | None
-                if scheme["pre_handler"]:
-                    pre_handled_match = scheme["pre_handler"](match)
-                else:
-                    # fallback case when no pre_handler is provided for the scheme
-                    pre_handled_match = {
-                        "display_text": entire_match,
-                        "tag": scheme["tags"][0]
-                    }
-
-                # Validate the current match
-                if pre_handled_match:
-                    
-                    # Skip matches for which the pre_handler returns None
-                    # Skip matches for texts that has already been processed by a previous scheme
-                    if entire_match not in seen:
-                        if pre_handled_match["tag"] not in scheme["tags"]:
-                            logger.warning(f"the tag returned dynamically '{pre_handled_match['tag']}' is not included in: {scheme['tags']}")
-                            continue
-
-                        seen.add(entire_match)
-                        # We keep a copy of the original matched text for later
-                        items.append((pre_handled_match,entire_match,match_start,match,))
-    # Clean up no longer needed variables
-    del seen
+    # Files may have changed since the previous invocation
+    clear_stat_cache()
+
+    # Skip the schemes whose scan exceeds the time budgets
+    start_scan_guard(configs.scan_timeout, configs.scheme_timeout)
+
+    items:list[Item]
+
+    # Width of the column of the tags, not needed for the cached links
+    max_len_tag_names:int = 0
+
+    # Sort items, those of the current pane first, then from the most recent
+    # first occurrence; with the occurrences shown, from the most recent
+    # last occurrence, or the most frequent first
+    def sort_key(item:Item) -> tuple[int,...]:
+        if configs.occurrences == "sort":
+            return (-item.pane_index,item.count,item.last_position,)
+        if configs.occurrences == "show":
+            return (-item.pane_index,item.last_position,)
+        return (-item.pane_index,item.first_position,)
+
+    # Batches of items after the first one, which are sent to fzf while it runs
+    more_items:Generator[list[Item],None,None]|None = None
+
+    # Candidates whose pre_handlers are called while fzf runs
+    validation:Validation|None = None
+
+    # Whether the matches of the slow schemes are offered before their
+    # pre_handlers have validated them
+    deferred_validation:bool = False
+    if configs.async_validation and cached is None:
+        from .validation import slow_lanes
+        deferred_validation = bool(slow_lanes(scanner))
+
+    # Whether the capture is long enough to be scanned in chunks while fzf runs
+    stream_scan:bool = False
+    if configs.occurrences == "off" and cached is None and not streaming_capture and pane_labels is None:
+        from .candidate_stream import STREAM_MIN_LINES
+        stream_scan = content.count("\n") >= STREAM_MIN_LINES
+
+    if cached is not None:
+        items = cached["items"]
+    elif streaming_capture:
+        from .capture_stream import read_capture_chunks, scan_capture_chunks
+        # Capture and scan the content chunk by chunk, keeping only the items
+        with span("scan", streaming=True, processes=configs.scan_processes) as scan_span:
+            items = scan_capture_chunks(schemes, scanner, read_capture_chunks(pane_context, configs.history_lines), pane_context["pane_id"], pane_context["current_path"], configs.scan_processes)
+            scan_span.set(items=len(items))
+
+        with span("sort"):
+            items.sort(key=sort_key,reverse=True)
+
+        if items:
+            max_len_tag_names = max([len(item.tag) for item in items])
+    elif pane_labels is not None:
+        # Scan each pane in full, resolving the paths of its candidates against
+        # its own current path; the same text found in several panes is
+        # offered once per pane
+        items = []
+        for pane_index, context in enumerate(pane_contexts):
+            set_current_directory(context["current_path"])
+            with span("scan", pane=context["pane_id"], processes=configs.scan_processes) as scan_span:
+                candidates = scan_candidates(scanner, context["content"], context["pane_id"], context["current_path"], configs.scan_processes)
+                scan_span.set(candidates=len(candidates))
+            with span("index", pane=context["pane_id"]) as index_span:
+                pane_items = [
+                    Item(entire_match, indexed, pane_index)
+                    for entire_match, indexed in index_candidates(schemes, candidates).items()
+                ]
+                index_span.set(items=len(pane_items))
+            items.extend(pane_items)
+            del candidates
+        set_current_directory(None)
+
+        with span("sort"):
+            items.sort(key=sort_key,reverse=True)
+
+        if items:
+            max_len_tag_names = max([len(item.tag) for item in items])
+    elif deferred_validation:
+        from . import validation as validation_module
+        # Offer the matches of the slow schemes before their pre_handlers
+        # have validated them
+        with span("scan", deferred_lanes=len(validation_module.slow_lanes(scanner))):
+            validation = validation_module.Validation(schemes, scanner, content, pane_context["pane_id"], pane_context["current_path"], configs.scan_processes)
+        items = [
+            Item(entire_match, indexed)
+            for entire_match in validation.texts
+            if (indexed := validation.resolve(entire_match)) is not None
+        ]
+        items.sort(key=sort_key,reverse=True)
+
+        # The tags of the validated items are not known yet
+        max_len_tag_names = max(len(tag) for scheme in schemes for tag in scheme["tags"])
+    elif stream_scan:
+        from .candidate_stream import stream_candidates
+        # Scan long captures in chunks from the most recent lines, so that
+        # fzf shows the first items while the rest is being scanned; the
+        # number of occurrences is not known until the end
+        def stream_items() -> Generator[list[Item],None,None]:
+            for found in span_steps("scan_chunk", stream_candidates(schemes, scanner, content, pane_context["pane_id"], pane_context["current_path"], configs.scan_processes)):
+                yield [Item(entire_match, indexed) for entire_match, indexed in found]
+
+        more_items = stream_items()
+        # Open fzf with the first items found
+        items = next((batch for batch in more_items if batch), [])
+
+        # The tags of later items are not known yet
+        max_len_tag_names = max(len(tag) for scheme in schemes for tag in scheme["tags"])
+    else:
+        # Scan the content for all schemes at once; candidates are produced in
+        # the order of the schemes and of their regexes, and only include the
+        # matches for which the pre_handler does not return None. The
+        # pre_handlers run once per distinct text matched by each regex
+        with span("scan", processes=configs.scan_processes) as scan_span:
+            candidates = scan_candidates(scanner, content, pane_context["pane_id"], pane_context["current_path"], configs.scan_processes)
+            scan_span.set(candidates=len(candidates))
+
+        # Keep one item per text, the one found by the first scheme, along with
+        # the positions of its first and last occurrences and the number of
+        # occurrences
+        with span("index") as index_span:
+            items = [
+                Item(entire_match, indexed)
+                for entire_match, indexed in index_candidates(schemes, candidates).items()
+            ]
+            index_span.set(items=len(items))
+        # Clean up no longer needed variables
+        del candidates
+
+        with span("sort"):
+            items.sort(key=sort_key,reverse=True)
+
+        if items:
+            # Find the maximum length in characters of the display text
+            max_len_tag_names = max([len(item.tag) for item in items])
     
+    # Keep the links found for the next key presses, unless a scheme was
+    # skipped; links served from the cache are not kept again, so that they
+    # expire on time
+    def cache_result(choices:list[str]) -> None:
+        if cache_key is not None and cached is None and not skipped_schemes():
+            from .result_cache import store_result
+            store_result(cache_key, items, choices, configs.result_cache_ttl)
+
     if items == []:
+        cache_result([])
         logger.info('no link found')
         return
 
-    # Sort items
-    items.sort(key=lambda x: x[2],reverse=True)
+    # Column with the number of occurrences, e.g., `×12`
+    max_len_counts:int|None = len(f"{max(item.count for item in items)}") if configs.occurrences != "off" else None
 
-    # Find the maximum length in characters of the display text
-    max_len_tag_names:int = max([len(item[0]["tag"]) for item in items])
-        
-    # Number the items
-    numbered_choices = [f"{colors.index_color}{idx:4d}{colors.reset_color} {colors.dash_color}-{colors.reset_color} " \
-        f"{colors.tag_color}{('['+item[0]['tag']+']').ljust(max_len_tag_names+2)}{colors.reset_color} {colors.dash_color}-{colors.reset_color} " \
-        # add 2 character because of `[` and `]` \
-        f"{item[0]['display_text']}" for idx, item in enumerate(items, 1)]
+    if cached is not None:
+        numbered_choices = cached["choices"]
+    else:
+        with span("format", items=len(items)):
+            numbered_choices = number_items(list(enumerate(items, 1)), max_len_tag_names, max_len_counts, pane_labels)
+        if more_items is None:
+            cache_result(numbered_choices)
+
+    more_choices:Generator[list[str],None,None]|None = None
+    if more_items is not None:
+        def stream_choices(more_items:Generator[list[Item],None,None]) -> Generator[list[str],None,None]:
+            # The links are only cached once all of them have been found
+            all_choices = list(numbered_choices)
+            try:
+                for batch in more_items:
+                    first_idx = len(items) + 1
+                    items.extend(batch)
+                    choices = number_items(list(enumerate(batch, first_idx)), max_len_tag_names, max_len_counts)
+                    all_choices.extend(choices)
+                    yield choices
+                cache_result(all_choices)
+            finally:
+                # Stop scanning when fzf exits
+                more_items.close()
+        more_choices = stream_choices(more_items)
+
+    reloaded_choices:Generator[list[str],None,None]|None = None
+    if validation is not None:
+        def validate_choices(validation:"Validation") -> Generator[list[str],None,None]:
+            # Items keep their index, and are validated from the most recent
+            item_indexes = {item.text: idx for idx, item in enumerate(items, 1)}
+            for _ in span_steps("validate_batch", validation.validate_batches(list(item_indexes))):
+                numbered_items = [
+                    (idx, Item(entire_match, indexed),)
+                    for entire_match, idx in item_indexes.items()
+                    if (indexed := validation.resolve(entire_match)) is not None
+                ]
+                numbered_items.sort(key=lambda x: sort_key(x[1]),reverse=True)
+                yield number_items(numbered_items, max_len_tag_names, max_len_counts)
+        reloaded_choices = validate_choices(validation)
+
+    preview_item:Callable[[int,int],str]|None = None
+    if configs.preview:
+        from .preview import render_preview
+
+        def render_item_preview(idx:int, height:int) -> str:
+            # Called from the thread serving the previews while fzf runs
+            if not 1 <= idx <= len(items):
+                return ""
+            item = items[idx-1]
+            preview_handler = schemes[item.scheme_index].get("preview_handler")
+            if preview_handler is None:
+                return ""
+            if item.pane_index:
+                # The other panes are only scanned before fzf starts
+                set_current_directory(pane_contexts[item.pane_index]["current_path"])
+            try:
+                target = preview_handler(item.match())
+            finally:
+                if item.pane_index:
+                    set_current_directory(None)
+            return render_preview(target, height) if target is not None else ""
+        preview_item = render_item_preview
 
     # Run fzf and get selected items
     try:
         # Run fzf and get selected items
-        fzf_result:FzfReturnType = run_fzf(configs.fzf_path,configs.fzf_display_options,numbered_choices,colors.enabled,pane_height,pane_width)
+        with span("run_fzf"):
+            fzf_result:FzfReturnType = run_fzf(configs.fzf_path,configs.fzf_display_options,numbered_choices,colors.enabled,pane_height,pane_width,more_choices,reloaded_choices,preview_item)
     except FzfUserInterrupt as e:
-        sys.exit(0)
+        return
 
     # Disable colors; this is relevant when producing the pre_handled_match
     colors.enable_colors(False)
 
-    # Regular expression to parse the selected item from the fzf options
-    # Each line is in the format {four-digit number, two spaces <scheme type>, two spaces, <link>
-    selected_item_pattern = r"\s*(?P<idx>\d+)\s*-\s*\[(?P<type>.+?)\]\s*-\s*(?P<link>.+)"
-
     # Array of strings to be copied to clipboard
     clipboard:list[str] = []
     
     # Process selected items
     for selected_choice in fzf_result["selection"]:
-        fzf_match = re.match(selected_item_pattern, selected_choice)
-        if fzf_match:
-            idx_str:str = fzf_match.group("idx")
-            scheme_type:str = fzf_match.group("type")
-            # displayed text created by the prehandler
-            pre_handled_match_text:str = fzf_match.group("link")
-            
-            try:
-                idx:int=int(idx_str,10)
-                # pick the original item to be searched again
-                # before passing the `fzf_match` object to the post handler
-                selected_item=items[idx-1]
-            except:
-                logger.error(f"error: malformed selection: {selected_choice}")
-                continue
-            
-            index_scheme = tag_to_index.get(scheme_type,None)
-            
-            if index_scheme is None:
+        # The index and the scheme of the item precede the text shown (see `number_items`)
+        fields = selected_choice.split(CHOICE_DELIMITER, HIDDEN_FIELDS)
+        if len(fields) > HIDDEN_FIELDS and fields[0].isdecimal() and fields[1].isdecimal():
+            idx:int = int(fields[0])
+            index_scheme:int = int(fields[1])
+            if not (1 <= idx <= len(items) and index_scheme < len(schemes)):
                 logger.error(f"error: malformed selection: {selected_choice}")
                 continue
 
-            scheme=schemes[index_scheme]
+            # pick the original item to be searched again
+            # before passing the match object to the post handler
+            selected_item = items[idx-1]
+
+            if validation is not None:
+                # The item may have been selected before being validated
+                validation.validate(selected_item.text)
+                indexed = validation.resolve(selected_item.text)
+                if indexed is None:
+                    logger.warning(f"warning: the selected choice is not a valid link: {selected_item.text}")
+                    continue
+                selected_item = Item(selected_item.text, indexed)
+                index_scheme = indexed["scheme_index"]
 
-            selected_match=selected_item[3]
+            scheme=schemes[index_scheme]
 
             if fzf_result["action"] == "COPY_TO_CLIPBOARD":
-                # Copy to clipboard the result of the pre handler.
-                clipboard.append(pre_handled_match_text)
+                # Copy to clipboard the result of the pre handler, as shown by fzf
+                clipboard.append(colors.strip_colors(selected_item.display_text))
                 # Skip the rest
                 continue
                 
+            # The opener may be overridden by the action; never modify the scheme
+            # itself, which is reused across invocations in daemon mode
+            opener:OpenerType = scheme["opener"]
+
             # Get the post_handler, which applies after the user selection
             post_handler = scheme.get("post_handler",None)
+
+            # Resolve the paths against the current path of the pane of the item
+            selected_pane = pane_contexts[selected_item.pane_index]
+            set_current_directory(selected_pane["current_path"])
+
+            # The match of the first occurrence of the selected text
+            try:
+                selected_match = selected_item.match()
+            except PatternNotMatching as e:
+                logger.error(f"error: {e}")
+                continue
             
             # Process the rematch with the post handler
             post_handled_link: PostHandledMatch
             if post_handler:
-                post_handled_link = post_handler(selected_match)
+                with span("post_handler", tag=scheme["tags"][0]):
+                    if cost_accounting_enabled():
+                        cost = scheme_cost(scheme)
+                        start = time.perf_counter()
+                        post_handled_link = post_handler(selected_match)
+                        cost["post_handler_seconds"] += time.perf_counter() - start
+                        cost["post_handler_calls"] += 1
+                    else:
+                        post_handled_link = post_handler(selected_match)
                 if post_handled_link is None:
                     continue
             else:
-                if scheme["opener"] == OpenerType.EDITOR:
-                    post_handled_link = {'file':selected_match.group(0)}
-                elif scheme["opener"] == OpenerType.BROWSER:
+                if opener == OpenerType.EDITOR:
+                    file = selected_match.group(0)
+                    if selected_pane is not pane_context:
+                        # The editor is started in the current path of the current pane
+                        file = absolute_path(os.path.expanduser(file))
+                    post_handled_link = {'file':file}
+                elif opener == OpenerType.BROWSER:
                     post_handled_link = {'url':selected_match.group(0)}
                 else:
                     raise MissingPostHandler(f"scheme with tags {scheme['tags']} configured as custom opener but missing post handler")
@@ -330,7 +635,7 @@ def run(
                 case "REVEAL":
                     if "file" in post_handled_link:
                         # When the match yields file
-                        scheme["opener"] = OpenerType.REVEAL;
+                        opener = OpenerType.REVEAL
                         post_handled_link = {'file': post_handled_link['file']}
                     else:
                         # Display warning and the skip this selected item
@@ -339,7 +644,7 @@ def run(
                 case "SYSTEM_OPEN":
                     if "file" in post_handled_link:
                         # When the match yields file
-                        scheme["opener"] = OpenerType.SYSTEM_OPEN;
+                        opener = OpenerType.SYSTEM_OPEN
                         post_handled_link = {'file': post_handled_link['file']}
                     else:
                         # Display warning and the skip this selected item
@@ -347,7 +652,7 @@ def run(
                         continue                        
             
             try:
-                open_link(post_handled_link,editor_open_cmd,browser_open_cmd,schemes[index_scheme]["opener"])
+                open_link(post_handled_link,editor_open_cmd,browser_open_cmd,opener)
             except (NoSuitableAppFound, PatternNotMatching, CommandFailed, NoEditorConfigured, NoBrowserConfigured) as e:
                 logger.error(f"error: {e}")
                 continue
@@ -374,9 +679,24 @@ def run(
             logger.error(f"error: unexpected error: {e}")
             return
 
-if __name__ == "__main__":
+def main(argv:list[str]|None=None, fast_exit:bool=False):
+    """Run the plugin and report errors over the configured loggers.
+
+    With `fast_exit`, the process terminates without the interpreter teardown
+    as soon as the selected links have been handed over to their openers.
+    """
+
+    if argv is None:
+        argv = sys.argv[1:]
+
+    if argv[:1] == ["--startup-report"]:
+        from .startup_report import print_startup_report
+        print_startup_report(argv[1] if len(argv) > 1 else None)
+        return
+
+    start_ns = time.monotonic_ns()
     try:
-        run(*sys.argv[1:])
+        run(*argv)
     except KeyboardInterrupt:
         logging.info("script interrupted")
     except (FzfError,FzfNotFound,FileLoggingNotAllow,FailedChDir,MissingPostHandler,) as e:
@@ -384,4 +704,25 @@ if __name__ == "__main__":
     except Exception as e:
         logging.error(f"unexpected runtime error: {e}")
 
+    # Costs and spans are only recorded if enabled by `run`
+    report_scheme_costs(configs.scheme_time_budget)
+    start_cost_accounting(False)
+    report_skipped_schemes()
+    start_scan_guard(0, 0)
+    add_span("run", start_ns, time.monotonic_ns())
+    try:
+        write_trace()
+    except OSError as e:
+        logging.warning(f"the trace could not be written: {e}")
+
+    if fast_exit:
+        # The openers run as detached processes; only flush what is pending
+        logging.shutdown()
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(0)
+
+if __name__ == "__main__":
+    main()
+
 __all__ = []
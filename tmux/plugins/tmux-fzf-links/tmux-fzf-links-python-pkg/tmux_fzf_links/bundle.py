@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+
+#===============================================================================
+#   Author: (c) 2024 Andrea Alberti
+#===============================================================================
+
+# Build a zipapp with the package precompiled to bytecode. The bundle is
+# meant to be run with `python -S -I bundle.pyz <args>`, which skips the
+# `site` module and the search of the source and cache directories.
+#
+# The bundle lists the sources it was built from, with their modification
+# time and size; it is rebuilt when a source is added, removed, or changed.
+
+import hashlib
+import importlib.util
+import marshal
+import os
+import sys
+import zipfile
+
+# Entry point of the bundle; `PYTHONPATH` is ignored in isolated mode (-I),
+# hence its entries are appended manually so that user schemes can still
+# import modules from `@fzf-links-python-path`
+BUNDLE_MAIN = '''\
+import os
+import sys
+sys.path.extend(path for path in os.environ.get("PYTHONPATH", "").split(os.pathsep) if path)
+from tmux_fzf_links.__main__ import main
+main(fast_exit=True)
+'''
+
+# Name of the list of the sources in the bundle
+MANIFEST_NAME = "MANIFEST"
+
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def bundle_path(cache_dir:str) -> str:
+    """Return the path of the bundle for the running interpreter and the package.
+
+    The bytecode is specific to the Python version, which is therefore part
+    of the name, as is a hash of the package directory, so that several
+    checkouts of the plugin sharing the cache directory do not run each
+    other's bundle.
+    """
+    package_hash = hashlib.sha256(PACKAGE_DIR.encode()).hexdigest()[:16]
+    return os.path.join(cache_dir, f"tmux_fzf_links.{sys.implementation.cache_tag}.{package_hash}.pyz")
+
+def compile_to_pyc(source:str, filename:str, mtime:int) -> bytes:
+    code = compile(source, filename, "exec", dont_inherit=True)
+    # Header of timestamp-based pyc files: magic number, flags, mtime, and source size
+    return (importlib.util.MAGIC_NUMBER
+        + (0).to_bytes(4, "little")
+        + (mtime & 0xFFFFFFFF).to_bytes(4, "little")
+        + (len(source.encode()) & 0xFFFFFFFF).to_bytes(4, "little")
+        + marshal.dumps(code))
+
+def read_manifest(path:str) -> str|None:
+    """Return the list of the sources of a bundle, or None if there is no valid bundle."""
+    try:
+        with zipfile.ZipFile(path) as bundle:
+            return bundle.read(MANIFEST_NAME).decode()
+    except (OSError, KeyError, zipfile.BadZipFile):
+        return None
+
+def build_bundle(output_path:str) -> bool:
+    """Build the bundle unless it is up to date with the package sources.
+
+    Return True if the bundle was (re)built.
+    """
+    package_name = os.path.basename(PACKAGE_DIR)
+    sources = sorted(entry.path for entry in os.scandir(PACKAGE_DIR) if entry.name.endswith(".py"))
+
+    # Name, modification time, and size of each source
+    manifest = ""
+    for source_path in sources:
+        metadata = os.stat(source_path)
+        manifest += f"{os.path.basename(source_path)}\t{metadata.st_mtime_ns}\t{metadata.st_size}\n"
+    if read_manifest(output_path) == manifest:
+        return False
+
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    tmp_path = f"{output_path}.{os.getpid()}.tmp"
+
+    # Modules are stored uncompressed to avoid decompressing them at start-up
+    with zipfile.ZipFile(tmp_path, "w", zipfile.ZIP_STORED) as bundle:
+        for source_path in sources:
+            with open(source_path, "r", encoding="utf-8") as file:
+                source = file.read()
+            module_name = os.path.basename(source_path)[:-3]
+            mtime = int(os.stat(source_path).st_mtime)
+            # Keep the original file name in the code objects for meaningful tracebacks
+            bundle.writestr(f"{package_name}/{module_name}.pyc", compile_to_pyc(source, source_path, mtime))
+        bundle.writestr("__main__.pyc", compile_to_pyc(BUNDLE_MAIN, "__main__.py", 0))
+        bundle.writestr(MANIFEST_NAME, manifest)
+
+    # Atomically replace the previous bundle
+    os.replace(tmp_path, output_path)
+    return True
+
+def main(argv:list[str]):
+    # Print the path of the bundle so that the caller (`fzf-links.tmux`) can use it
+    output_path = bundle_path(argv[0])
+    build_bundle(output_path)
+    print(output_path)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
+
+__all__ = ["build_bundle", "bundle_path"]
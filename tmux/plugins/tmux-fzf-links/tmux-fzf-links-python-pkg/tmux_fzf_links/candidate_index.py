@@ -0,0 +1,55 @@
+#===============================================================================
+#   Author: (c) 2024 Andrea Alberti
+#===============================================================================
+
+# Index of the candidates by matched text. A link printed many times (e.g., a
+# path in a build log) is offered once; the index keeps the scheme and the
+# match of its first occurrence, in the order of the schemes and of their
+# regexes, and the positions of all its occurrences.
+
+import logging
+from typing import Match, TypedDict
+
+from .opener import PreHandledMatch, SchemeEntry
+
+class IndexedCandidate(TypedDict):
+    scheme_index: int
+    pre_handled_match: PreHandledMatch
+    match: Match[str] # first occurrence
+    position: int # start of the first occurrence
+    positions: set[int] # start of every occurrence
+
+def index_candidates(schemes:list[SchemeEntry], candidates:list[tuple[int,Match[str],PreHandledMatch]], index:dict[str,IndexedCandidate]|None = None, offset:int = 0) -> dict[str,IndexedCandidate]:
+    """Index the candidates by matched text, keeping the first one whose tag is valid.
+
+    The candidates are added to `index` if given; new texts are appended.
+    The positions are shifted by `offset`, the position of the scanned
+    string in the capture when the capture is scanned in pieces.
+    """
+    logger = logging.getLogger()
+    if index is None:
+        index = {}
+    for scheme_index, match, pre_handled_match in candidates:
+        entire_match:str = match.group(0)
+
+        indexed = index.get(entire_match)
+        if indexed is not None:
+            # Overlapping regexes may find the same occurrence several times
+            indexed["positions"].add(offset + match.start())
+            continue
+
+        scheme = schemes[scheme_index]
+        if pre_handled_match["tag"] not in scheme["tags"]:
+            logger.warning(f"the tag returned dynamically '{pre_handled_match['tag']}' is not included in: {scheme['tags']}")
+            continue
+
+        index[entire_match] = {
+            "scheme_index": scheme_index,
+            "pre_handled_match": pre_handled_match,
+            "match": match,
+            "position": offset + match.start(),
+            "positions": {offset + match.start()},
+        }
+    return index
+
+__all__ = ["IndexedCandidate", "index_candidates"]
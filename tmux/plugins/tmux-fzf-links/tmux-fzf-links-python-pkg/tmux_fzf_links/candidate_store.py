@@ -0,0 +1,102 @@
+#===============================================================================
+#   Author: (c) 2024 Andrea Alberti
+#===============================================================================
+
+# Compact items offered in fzf. A match refers to the whole content where it
+# was found; the items of a long capture, which outlive the scan while fzf
+# runs and in the cache of the resident server (see `result_cache.py`),
+# would keep the capture alive. An item only keeps its text, its interned
+# tag and display text, and the tail of the line where it was first found,
+# from which the match passed to the post_handler is rebuilt on demand.
+#
+# The matches of the regexes with a line context (see `line_context` in
+# `prefilter.py`) only depend on their line and on the characters before it
+# inspected by the lookbehinds; matching the regex where it was found in the
+# tail of the line, preceded by a newline unless it starts the content,
+# yields the same match with the same groups. Its positions are those in the
+# tail, which is the `string` of the match. The matches of the other
+# regexes, which may depend on other lines, are kept as they are.
+
+import sys
+from typing import Match, Pattern
+
+from .candidate_index import IndexedCandidate
+from .errors_types import PatternNotMatching
+from .prefilter import line_context
+
+# Number of regexes whose line context is kept; the regexes of previous
+# versions of the user schemes are forgotten when there are more
+MAX_LINE_CONTEXTS = 256
+
+_line_contexts:dict[Pattern[str],int|None] = {}
+
+def regex_line_context(regex:Pattern[str]) -> int|None:
+    try:
+        return _line_contexts[regex]
+    except KeyError:
+        pass
+    if len(_line_contexts) >= MAX_LINE_CONTEXTS:
+        _line_contexts.clear()
+    reach = _line_contexts[regex] = line_context(regex)
+    return reach
+
+class Item:
+    """Link offered in fzf."""
+
+    __slots__ = ("text", "scheme_index", "tag", "display_text", "first_position", "last_position", "count", "pane_index", "_regex", "_tail", "_start", "_match",)
+
+    def __init__(self, text:str, indexed:IndexedCandidate, pane_index:int = 0):
+        pre_handled_match = indexed["pre_handled_match"]
+        display_text = pre_handled_match["display_text"]
+
+        self.text:str = text
+        self.scheme_index:int = indexed["scheme_index"]
+        self.tag:str = sys.intern(pre_handled_match["tag"])
+        # Without colors, the display text is usually the text itself
+        self.display_text:str = text if display_text == text else display_text
+        self.first_position:int = indexed["position"]
+        self.last_position:int = max(indexed["positions"])
+        self.count:int = len(indexed["positions"])
+        self.pane_index:int = pane_index
+
+        match = indexed["match"]
+        regex = match.re
+        start = match.start()
+        self._regex:Pattern[str] = regex
+        reach = regex_line_context(regex)
+        if reach is None:
+            self._match:Match[str]|None = match
+            self._tail:str = ""
+            self._start:int = start
+            return
+
+        # Characters inspected before the match: those of the lookbehinds,
+        # and the one before them for `\b` and `^`; none before the line
+        # besides those of the lookbehinds
+        content = match.string
+        line_start = content.rfind("\n", 0, start) + 1
+        line_end = content.find("\n", start)
+        line_end = len(content) if line_end < 0 else line_end + 1
+        tail_start = max(line_start - reach, start - reach - 1, 0)
+        # A match starting the tail is only preceded by a newline, and `^`
+        # and `\A` must not match there
+        prefix = "\n" if tail_start > 0 else ""
+        self._tail:str = prefix + content[tail_start:line_end]
+        self._start = start - tail_start + len(prefix)
+        self._match = None
+
+    def add_occurrences(self, positions:set[int]) -> None:
+        """Count the occurrences found in a later part of the capture."""
+        self.last_position = max(self.last_position, *positions)
+        self.count += len(positions)
+
+    def match(self) -> Match[str]:
+        """Return the match of the first occurrence of the text, as found by the scan."""
+        if self._match is not None:
+            return self._match
+        match = self._regex.match(self._tail, self._start)
+        if match is None or match.group(0) != self.text:
+            raise PatternNotMatching(f"the link could not be matched again: {self.text}")
+        return match
+
+__all__ = ["Item"]
@@ -0,0 +1,80 @@
+#===============================================================================
+#   Author: (c) 2024 Andrea Alberti
+#===============================================================================
+
+# Scan of long captures in chunks, from the most recent lines to the oldest
+# ones, so that fzf can show the first links while the rest of the capture
+# is being scanned (see `run_fzf`). The chunks start small and grow, so that
+# the first links are found quickly while the cost of splitting the scan
+# remains low.
+#
+# The lanes whose matches in a line only depend on that line (see
+# `line_context` in `prefilter.py`) are scanned chunk by chunk. The other
+# lanes are scanned over the whole capture before the first chunk, and their
+# candidates are distributed among the chunks. A text is offered with the
+# scheme that finds it first in the most recent chunk where it occurs; when
+# several schemes find the same text, this may differ from the scheme chosen
+# by scanning the whole capture at once, where the order of the schemes
+# always prevails.
+
+from bisect import bisect_left
+from itertools import islice
+from typing import Iterator, Match
+
+from .candidate_index import IndexedCandidate, index_candidates
+from .opener import PreHandledMatch, SchemeEntry
+from .scanner import Scanner
+from .scan_cache import scan_lane_candidates
+
+# Captures with fewer lines are scanned at once
+STREAM_MIN_LINES = 5000
+
+# Size in characters of the first chunk, and of the largest ones
+FIRST_CHUNK_CHARS = 16 * 1024
+MAX_CHUNK_CHARS = 1024 * 1024
+
+def chunks_from_end(content:str) -> Iterator[tuple[int,int]]:
+    """Yield line-aligned ranges covering the content, from its end to its start."""
+    chunk_chars = FIRST_CHUNK_CHARS
+    endpos = len(content)
+    while endpos > 0:
+        # Start after the last newline preceding the chunk, if any
+        pos = content.rfind("\n", 0, max(endpos - chunk_chars, 0)) + 1
+        yield (pos, endpos,)
+        endpos = pos
+        chunk_chars = min(2 * chunk_chars, MAX_CHUNK_CHARS)
+
+def stream_candidates(schemes:list[SchemeEntry], scanner:Scanner, content:str, pane_id:str, current_path:str, processes:int = 0) -> Iterator[list[tuple[str,IndexedCandidate]]]:
+    """Yield, for each chunk, the texts found for the first time and their indexed candidate.
+
+    The texts of each chunk are sorted from the most recent occurrence.
+    """
+    line_lanes = {idx for idx, reach in enumerate(scanner.line_contexts) if reach is not None}
+    other_lanes = set(range(len(scanner.lane_owners))) - line_lanes
+
+    others:list[list[tuple[int,Match[str],PreHandledMatch]]] = []
+    others_starts:list[list[int]] = []
+    if other_lanes:
+        others = scan_lane_candidates(scanner, content, pane_id, current_path, processes, lanes=other_lanes)
+        others_starts = [[start for start, _, _ in candidates] for candidates in others]
+
+    index:dict[str,IndexedCandidate] = {}
+    for pos, endpos in chunks_from_end(content):
+        lanes = scan_lane_candidates(scanner, content, pane_id, current_path, processes, pos, endpos, line_lanes)
+        for idx in other_lanes:
+            starts = others_starts[idx]
+            lanes[idx] = others[idx][bisect_left(starts, pos):bisect_left(starts, endpos)]
+
+        indexed_texts = len(index)
+        index_candidates(schemes, [
+            (scanner.lane_owners[idx][0], match, pre_handled_match,)
+            for idx, candidates in enumerate(lanes)
+            for _, match, pre_handled_match in candidates
+        ], index)
+
+        # The occurrences of a new text are all in this chunk or in older ones
+        found = list(islice(index.items(), indexed_texts, None))
+        found.sort(key=lambda item: max(item[1]["positions"]), reverse=True)
+        yield found
+
+__all__ = ["STREAM_MIN_LINES", "stream_candidates"]
@@ -0,0 +1,121 @@
+#===============================================================================
+#   Author: (c) 2024 Andrea Alberti
+#===============================================================================
+
+# Capture of long histories in chunks (see `@fzf-links-streaming-capture`).
+# Capturing a pane at once holds its whole history in memory several times:
+# as the output of `capture-pane`, decoded, and normalized. Instead, the
+# output of `capture-pane` is read while tmux writes it, in chunks of whole
+# lines; each chunk is decoded, normalized, and scanned, then dropped. Only
+# the items are kept, which only keep the tail of a line each (see
+# `candidate_store.py`), so that the memory used does not grow with the
+# number of lines captured but with the number of links found.
+#
+# Each chunk is preceded by the end of the previous one, with the characters
+# inspected by the lookbehinds of the regexes with a line context (see
+# `line_context` in `prefilter.py`), so that they find the same matches as
+# over the whole capture. The regexes without a line context are also
+# matched chunk by chunk: their matches spanning two chunks are not found,
+# and their items keep the chunk where they were found. A text found by
+# several schemes is offered with the scheme that finds it first in the
+# oldest chunk where it occurs; this may differ from the scheme chosen by
+# scanning the whole capture at once, where the order of the schemes always
+# prevails.
+
+import subprocess
+import unicodedata
+from typing import Iterable, Iterator
+
+from .candidate_index import index_candidates
+from .candidate_store import Item
+from .errors_types import FailedTmuxPaneSize
+from .opener import SchemeEntry
+from .pane_context import PaneContext, capture_args
+from .scanner import Scanner
+from .scan_cache import scan_lane_candidates
+
+# Size in bytes of the output of `capture-pane` read at once; a chunk
+# extends to the end of its last line
+CHUNK_BYTES = 1024 * 1024
+
+def read_capture_chunks(context:PaneContext, history_lines:int) -> Iterator[str]:
+    """Capture the pane and yield its content in normalized chunks of whole lines.
+
+    The content is read from `capture-pane` while tmux writes it; the
+    command is run as a subprocess whatever the transport, because the
+    control-mode transport only returns whole outputs.
+    """
+    args = [*capture_args(history_lines, context["pane_height"], context["scroll_position"]), '-t', context["pane_id"]]
+    try:
+        process = subprocess.Popen(['tmux', *args], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except OSError as e:
+        raise FailedTmuxPaneSize(f"tmux pane could not be captured: {e}")
+    assert process.stdout is not None and process.stderr is not None
+
+    try:
+        pending = b""
+        while True:
+            block = process.stdout.read(CHUNK_BYTES)
+            if block:
+                pending += block
+                end = pending.rfind(b"\n") + 1
+                if end == 0:
+                    # A line longer than a chunk
+                    continue
+            else:
+                end = len(pending)
+                if end == 0:
+                    break
+            # Whole lines never split a character, nor its combining characters
+            chunk = pending[:end].decode("utf-8", errors="replace")
+            pending = pending[end:]
+            yield chunk if chunk.isascii() else unicodedata.normalize("NFC", chunk)
+
+        stderr = process.stderr.read()
+        if process.wait() != 0:
+            raise FailedTmuxPaneSize(f"tmux pane could not be captured: {stderr.decode(errors='replace').strip()}")
+    finally:
+        # The consumer may stop before the end, e.g., on an error
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        process.stdout.close()
+        process.stderr.close()
+
+def scan_capture_chunks(schemes:list[SchemeEntry], scanner:Scanner, chunks:Iterable[str], pane_id:str, current_path:str, processes:int = 0) -> list[Item]:
+    """Scan the chunks of a capture in order and return an item per text, in the order in which the texts are first found.
+
+    The positions of the items are those in the whole capture.
+    """
+    lane_owners = scanner.lane_owners
+    # Characters of a chunk inspected when scanning the next one: those of the
+    # lookbehinds, and the newline before the first line for `\b` and `^`
+    carried_chars = max((reach for reach in scanner.line_contexts if reach is not None), default=0) + 1
+
+    items:dict[str,Item] = {}
+    carried = ""
+    offset = 0 # position of the chunk in the capture
+    for chunk in chunks:
+        content = carried + chunk
+        lanes = scan_lane_candidates(scanner, content, pane_id, current_path, processes, len(carried))
+        index = index_candidates(schemes, [
+            (lane_owners[idx][0], match, pre_handled_match,)
+            for idx, candidates in enumerate(lanes)
+            for _, match, pre_handled_match in candidates
+        ], offset=offset - len(carried))
+        del lanes
+
+        for text, indexed in index.items():
+            item = items.get(text)
+            if item is None:
+                items[text] = Item(text, indexed)
+            else:
+                item.add_occurrences(indexed["positions"])
+        del index
+
+        offset += len(chunk)
+        carried = content[-carried_chars:]
+
+    return list(items.values())
+
+__all__ = ["read_capture_chunks", "scan_capture_chunks"]
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+
+#===============================================================================
+#   Author: (c) 2024 Andrea Alberti
+#===============================================================================
+
+# Tiny client forwarding a key press to the resident server (see `server.py`).
+# It deliberately imports only a few standard modules and nothing else from
+# the package, so that the key binding pays the least possible start-up time.
+
+import io
+import json
+import os
+import socket
+import sys
+
+# Environment variables forwarded to the server with each request, so that
+# the server sees the same environment as a freshly started process would
+FORWARDED_ENV_VARS = ("TMUX", "PATH", "LS_COLORS", "EDITOR", "BROWSER", "FZF_LINKS_CLIENT")
+
+# Seconds to wait for the server to accept a request; a server busy with
+# another request, e.g., while its popup is open, is not waited for
+ACCEPT_TIMEOUT = 1
+
+def send_message(sock:socket.socket, message:dict) -> None:
+    sock.sendall(json.dumps(message).encode() + b"\n")
+
+def recv_message(reader:io.BufferedIOBase) -> dict:
+    line = reader.readline()
+    return json.loads(line) if line else {}
+
+def connect(socket_path:str) -> socket.socket:
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+def stop_server(socket_path:str) -> bool:
+    """Ask a running server to terminate; return False if none is listening."""
+    try:
+        with connect(socket_path) as sock, sock.makefile("rb") as reader:
+            sock.settimeout(ACCEPT_TIMEOUT)
+            send_message(sock, {"command": "stop"})
+            recv_message(reader)
+    except socket.timeout:
+        # Busy with a request; the server reads the command and terminates
+        # once the request is complete
+        return True
+    except OSError:
+        return False
+    return True
+
+def run_in_process(pane_id:str, run_args:list[str]):
+    """Fallback when no server is listening: run the plugin in a new interpreter."""
+    os.environ["TMUX_PANE"] = pane_id
+    os.execv(sys.executable, [sys.executable, "-m", "tmux_fzf_links", *run_args])
+
+def main(argv:list[str]):
+    socket_path, pane_id, *run_args = argv
+
+    request = {
+        "command": "run",
+        "pane_id": pane_id,
+        "env": {name: os.environ[name] for name in FORWARDED_ENV_VARS if name in os.environ},
+        "args": run_args,
+    }
+
+    try:
+        sock = connect(socket_path)
+    except OSError:
+        run_in_process(pane_id, run_args)
+        return
+
+    with sock, sock.makefile("rb") as reader:
+        sock.settimeout(ACCEPT_TIMEOUT)
+        try:
+            send_message(sock, request)
+            accepted = recv_message(reader).get("status") == "accepted"
+        except OSError:
+            accepted = False
+        if accepted:
+            # Wait for the server to complete the request; errors are
+            # reported by the server itself over tmux and the log file
+            sock.settimeout(None)
+            recv_message(reader)
+            return
+
+    # The server is busy with another request; closing the connection keeps
+    # it from running this one later
+    run_in_process(pane_id, run_args)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
+
+__all__ = []
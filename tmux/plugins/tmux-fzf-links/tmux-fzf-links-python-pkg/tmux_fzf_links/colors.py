@@ -6,16 +6,26 @@
 
 from pathlib import Path
 from .errors_types import LsColorsNotConfigured
+from .stat_cache import cached_stat, path_mode
 import os
+import re
+import stat
 
 DEFAULT_TAG_COLOR = [130,130,130]
 DEFAULT_INDEX_COLOR = [0,255,0]
 DEFAULT_DASH_COLOR = [160,160,160]
 
+# Color codes, e.g., those of LS_COLORS
+COLOR_CODE_PATTERN = re.compile(r"\033\[[0-9;]*m")
+
 class ColorsSingletonCls:
     _instance = None
 
     _color_mapping:dict[str,str] = {} # dictionary storing LS_COLORS
+    _ls_colors:str = "" # LS_COLORS string from which _color_mapping was parsed
+    _tag_rgb:list[int] = DEFAULT_TAG_COLOR
+    _index_rgb:list[int] = DEFAULT_INDEX_COLOR
+    _dash_rgb:list[int] = DEFAULT_DASH_COLOR
     enabled:bool = False # whether to use colors
     tag_color:str = ""  # fallback case
     index_color:str = ""  # fallback case
@@ -33,9 +43,9 @@ class ColorsSingletonCls:
         if state:
             self.enabled = True
             self.reset_color = "\033[0m"
-            self.tag_color = self.rgb_color(*DEFAULT_TAG_COLOR)
-            self.index_color = self.rgb_color(*DEFAULT_INDEX_COLOR)
-            self.dash_color = self.rgb_color(*DEFAULT_DASH_COLOR)
+            self.tag_color = self.rgb_color(*self._tag_rgb)
+            self.index_color = self.rgb_color(*self._index_rgb)
+            self.dash_color = self.rgb_color(*self._dash_rgb)
         else:
             self.enabled = False
             self.reset_color = ""
@@ -43,13 +53,19 @@ class ColorsSingletonCls:
             self.index_color = ""
             self.dash_color = ""
 
+    # The RGB values are stored so that they survive `enable_colors`,
+    # which is called again for every invocation in daemon mode
+
     def set_tag_color(self, R:int, G:int, B:int) -> None:
+        self._tag_rgb = [R,G,B]
         self.tag_color = self.rgb_color(R,G,B)
 
     def set_index_color(self, R:int, G:int, B:int) -> None:
+        self._index_rgb = [R,G,B]
         self.index_color = self.rgb_color(R,G,B)
 
     def set_dash_color(self, R:int, G:int, B:int) -> None:
+        self._dash_rgb = [R,G,B]
         self.dash_color = self.rgb_color(R,G,B)
 
     def rgb_color(self,R:int,G:int,B:int):
@@ -58,9 +74,23 @@ class ColorsSingletonCls:
         else:
             return ""
 
+    def strip_colors(self, text:str) -> str:
+        """Remove the color codes from a text, as fzf does with `--ansi`."""
+        return COLOR_CODE_PATTERN.sub("", text) if "\033" in text else text
+
+    def state(self) -> tuple[bool,str]:
+        """Return the settings on which the colored texts depend."""
+        return (self.enabled, self._ls_colors,)
+
     def configure_ls_colors_from_str(self,ls_colors:str):
         """Parse the LS_COLORS into a dictionary."""
 
+        if ls_colors == self._ls_colors:
+            # Already parsed by a previous invocation
+            return
+
+        self._color_mapping = {}
+        self._ls_colors = ls_colors
         for item in ls_colors.split(':'):
             if '=' in item:
                 key, value = item.split('=')
@@ -88,20 +118,26 @@ class ColorsSingletonCls:
         if not self._color_mapping:
             return ""
 
+        # The metadata is shared with the resolution of the path
+        metadata = cached_stat(filepath)
+        mode = metadata.st_mode if metadata is not None else 0
+        is_symlink = stat.S_ISLNK(path_mode(filepath, follow_symlinks=False))
+
         # Handle specific file types
-        if filepath.is_dir():
+        if stat.S_ISDIR(mode):
             return self._color_mapping.get('di', "")  # Directory
-        elif filepath.is_symlink():
+        elif is_symlink:
             return self._color_mapping.get('ln', "")  # Symbolic link
-        elif filepath.is_block_device():
+        elif stat.S_ISBLK(mode):
             return self._color_mapping.get('bd', "")  # Block device
-        elif filepath.is_char_device():
+        elif stat.S_ISCHR(mode):
             return self._color_mapping.get('cd', "")  # Character device
-        elif filepath.is_fifo():
+        elif stat.S_ISFIFO(mode):
             return self._color_mapping.get('pi', "")  # Named pipe (FIFO)
-        elif filepath.is_socket():
+        elif stat.S_ISSOCK(mode):
             return self._color_mapping.get('so', "")  # Socket
-        elif filepath.is_file() and os.access(filepath, os.X_OK):
+        elif stat.S_ISREG(mode) and mode & 0o111 and os.access(filepath, os.X_OK):
+            # Without any execute bit, the file is not executable for anybody
             return self._color_mapping.get('ex', "")  # Executable file
 
         # Check for file extension mapping
@@ -117,13 +153,13 @@ class ColorsSingletonCls:
             return self._color_mapping.get('mh', "")  # Multi-hard link
         elif file_name.endswith('~'):
             return self._color_mapping.get('ow', "")  # Other writable file
-        elif not filepath.exists():
+        elif metadata is None:
             return self._color_mapping.get('mi', "")  # Missing file
-        elif filepath.is_symlink() and not filepath.exists():
+        elif is_symlink and metadata is None:
             return self._color_mapping.get('or', "")  # Orphan symbolic link
-        elif filepath.is_symlink() and filepath.is_dir():
+        elif is_symlink and stat.S_ISDIR(mode):
             return self._color_mapping.get('tw', "")  # Sticky and other-writable dir
-        elif filepath.is_file():
+        elif stat.S_ISREG(mode):
             return self._color_mapping.get('fi', "")  # Regular file
 
         # Fallback strategy for unknown types
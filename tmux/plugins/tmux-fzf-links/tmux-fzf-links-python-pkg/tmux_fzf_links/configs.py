@@ -5,6 +5,7 @@
 #===============================================================================
 
 import logging
+import os
 
 class ConfigurationManager:
     """Parse the configurations and assert their validity"""
@@ -35,6 +36,18 @@ class ConfigurationManager:
             self.use_ls_colors_str = ""
             self.ls_colors_filename = ""
             self.hide_fzf_header:bool = False
+            self.tmux_transport:str = "subprocess"
+            self.scan_processes:int = 0
+            self.occurrences:str = "off"
+            self.async_validation:bool = False
+            self.trace_filename:str = ""
+            self.scheme_time_budget:float = 0 # seconds; 0 if disabled
+            self.scan_timeout:float = 0 # seconds; 0 if disabled
+            self.scheme_timeout:float = 0 # seconds; 0 if disabled
+            self.panes:str = "current"
+            self.result_cache_ttl:float = 0 # seconds; 0 if disabled
+            self.streaming_capture:bool = False
+            self.preview:bool = False
 
             # Root logger
             self.logger:logging.Logger = logging.getLogger()
@@ -52,7 +65,19 @@ class ConfigurationManager:
             user_schemes_path:str,
             use_ls_colors_str:str,
             ls_colors_filename:str,
-            hide_fzf_header:str
+            hide_fzf_header:str,
+            tmux_transport:str,
+            scan_processes:str,
+            occurrences:str,
+            async_validation:str,
+            trace_filename:str,
+            scheme_time_budget:str,
+            scan_timeout:str,
+            scheme_timeout:str,
+            panes:str,
+            result_cache_ttl:str,
+            streaming_capture:str,
+            preview:str
         ):
 
         try:
@@ -89,6 +114,102 @@ class ConfigurationManager:
             self.logger.warning(f"Input parameter '@fzf-links-hide-fzf_header' must either be 'on' or 'off', while it was provided: '{hide_fzf_header}'")
             self.hide_fzf_header = False # default
 
+        if tmux_transport in ('subprocess', 'control'):
+            self.tmux_transport = tmux_transport
+        else:
+            self.logger.warning(f"Input parameter '@fzf-links-tmux-transport' must either be 'subprocess' or 'control', while it was provided: '{tmux_transport}'")
+            self.tmux_transport = "subprocess" # default
+
+        if scan_processes == 'auto':
+            self.scan_processes = os.cpu_count() or 1
+        else:
+            try:
+                self.scan_processes = int(scan_processes)
+                if self.scan_processes < 0:
+                    raise ValueError(f"negative number of processes: {self.scan_processes}")
+            except ValueError as e:
+                self.logger.warning(f"Input parameter '@fzf-links-scan-processes' must be 'auto' or a non-negative integer: {e}")
+                self.scan_processes = 0 # default
+
+        if occurrences in ('off', 'show', 'sort'):
+            self.occurrences = occurrences
+        else:
+            self.logger.warning(f"Input parameter '@fzf-links-occurrences' must either be 'off', 'show', or 'sort', while it was provided: '{occurrences}'")
+            self.occurrences = "off" # default
+
+        if async_validation == 'on':
+            self.async_validation = True
+        elif async_validation == 'off':
+            self.async_validation = False
+        else:
+            self.logger.warning(f"Input parameter '@fzf-links-async-validation' must either be 'on' or 'off', while it was provided: '{async_validation}'")
+            self.async_validation = False # default
+
+        self.trace_filename = trace_filename
+
+        try:
+            budget_ms = int(scheme_time_budget)
+            if budget_ms < 0:
+                raise ValueError(f"negative time budget: {budget_ms}")
+            self.scheme_time_budget = budget_ms / 1000
+        except ValueError as e:
+            self.logger.warning(f"Input parameter '@fzf-links-scheme-time-budget' must be a non-negative integer: {e}")
+            self.scheme_time_budget = 0 # default
+
+        try:
+            timeout_ms = int(scan_timeout)
+            if timeout_ms < 0:
+                raise ValueError(f"negative timeout: {timeout_ms}")
+            self.scan_timeout = timeout_ms / 1000
+        except ValueError as e:
+            self.logger.warning(f"Input parameter '@fzf-links-scan-timeout' must be a non-negative integer: {e}")
+            self.scan_timeout = 0 # default
+
+        try:
+            timeout_ms = int(scheme_timeout)
+            if timeout_ms < 0:
+                raise ValueError(f"negative timeout: {timeout_ms}")
+            self.scheme_timeout = timeout_ms / 1000
+        except ValueError as e:
+            self.logger.warning(f"Input parameter '@fzf-links-scheme-timeout' must be a non-negative integer: {e}")
+            self.scheme_timeout = 0 # default
+
+        if panes in ('current', 'window', 'session'):
+            self.panes = panes
+        else:
+            self.logger.warning(f"Input parameter '@fzf-links-panes' must either be 'current', 'window', or 'session', while it was provided: '{panes}'")
+            self.panes = "current" # default
+
+        # The other panes are scanned in full before fzf starts, hence their
+        # matches are never validated while fzf runs
+        if self.panes != "current":
+            self.async_validation = False
+
+        try:
+            ttl_ms = int(result_cache_ttl)
+            if ttl_ms < 0:
+                raise ValueError(f"negative time: {ttl_ms}")
+            self.result_cache_ttl = ttl_ms / 1000
+        except ValueError as e:
+            self.logger.warning(f"Input parameter '@fzf-links-result-cache-ttl' must be a non-negative integer: {e}")
+            self.result_cache_ttl = 0 # default
+
+        if streaming_capture == 'on':
+            self.streaming_capture = True
+        elif streaming_capture == 'off':
+            self.streaming_capture = False
+        else:
+            self.logger.warning(f"Input parameter '@fzf-links-streaming-capture' must either be 'on' or 'off', while it was provided: '{streaming_capture}'")
+            self.streaming_capture = False # default
+
+        if preview == 'on':
+            self.preview = True
+        elif preview == 'off':
+            self.preview = False
+        else:
+            self.logger.warning(f"Input parameter '@fzf-links-preview' must either be 'on' or 'off', while it was provided: '{preview}'")
+            self.preview = False # default
+
 # Instantiate the singleton class
 configs = ConfigurationManager()
 
@@ -5,9 +5,9 @@
 #===============================================================================
 
 import re
+import stat
 import sys
-import shlex
-from .export import OpenerType, SchemeEntry, PreHandledMatch, PostHandledMatch, colors, heuristic_find_file, configs
+from .export import OpenerType, SchemeEntry, PreHandledMatch, PostHandledMatch, PreviewTarget, colors, heuristic_find_file, configs, path_mode
 from .errors_types import NotSupportedPlatform, FailedResolvePath
 
 # >>> GIT SCHEME >>>
@@ -70,13 +70,22 @@ def code_error_post_handler(match:re.Match[str]) -> PostHandledMatch:
 
     line=match.group('line')
 
-    return {'file':str(resolved_path.resolve()), 'line':line}
+    # `heuristic_find_file` already returns the resolved path
+    return {'file':str(resolved_path), 'line':line}
+
+def code_error_preview_handler(match:re.Match[str]) -> PreviewTarget | None:
+    resolved_path = heuristic_find_file(match.group('file'))
+    if resolved_path is None:
+        return None
+    return {'file':str(resolved_path), 'line':int(match.group('line'))}
 
 code_error_scheme:SchemeEntry = {
             "tags": ("code err.","Python"),
             "opener": OpenerType.EDITOR,
             "post_handler": code_error_post_handler,
             "pre_handler": code_error_pre_handler,
+            "preview_handler": code_error_preview_handler,
+            "slow": True, # resolves paths
             "regex": [re.compile(r"File \"(?P<file>...*?)\"\, line (?P<line>[0-9]+)")]
         }
 
@@ -121,7 +130,7 @@ def file_pre_handler(match: re.Match[str]) -> PreHandledMatch | None:
     if resolved_path == None:
         return None 
     
-    tag="dir" if resolved_path.is_dir() else "file"
+    tag="dir" if stat.S_ISDIR(path_mode(resolved_path)) else "file"
     if colors.enabled:
         color_code=colors.get_file_color(resolved_path)
         display_text = f"\033[{color_code}m{file_path}\033[0m"
@@ -147,7 +156,7 @@ def file_post_handler(match:re.Match[str]) -> PostHandledMatch:
 
     resolved_path_str = str(resolved_path)
 
-    if resolved_path.is_file():
+    if stat.S_ISREG(path_mode(resolved_path)):
         # If file, check whether it is a binary file. Open the file in binary mode and read a portion of it:
         with resolved_path.open('rb') as file:
             chunk = file.read(4096)  # Read the first 1024 bytes
@@ -158,6 +167,7 @@ def file_post_handler(match:re.Match[str]) -> PostHandledMatch:
 
         if not is_binary and configs.editor_open_cmd:
             # If not binary, open the the file with configured editor
+            import shlex
             args = shlex.split(configs.editor_open_cmd.replace(f"%file",resolved_path_str).replace(f"%line",line))
             return {'cmd': args[0], 'args':args[1:], 'file': resolved_path_str}
         else:
@@ -166,12 +176,21 @@ def file_post_handler(match:re.Match[str]) -> PostHandledMatch:
     else:
          # If directory, then cd into the selected directory
         return {'cmd': 'tmux', 'args': ['send-keys', f'cd "{resolved_path_str}"', 'C-m'], 'file':resolved_path_str}
+
+def file_preview_handler(match:re.Match[str]) -> PreviewTarget | None:
+    resolved_path = heuristic_find_file(match.group("link"))
+    if resolved_path is None:
+        return None
+    line:str|None = match.group("line")
+    return {'file':str(resolved_path), 'line':int(line) if line else 1}
     
 file_scheme:SchemeEntry = {
         "tags": ("file","dir",),
         "opener": OpenerType.CUSTOM_OPEN,
         "post_handler": file_post_handler,
         "pre_handler": file_pre_handler,
+        "preview_handler": file_preview_handler,
+        "slow": True, # resolves paths and looks up their colors
         "regex": [
             re.compile(r"(?P<link>^[^<>:\"\\|?*\x00-\x1F]+)(\:(?P<line>\d+))?",re.MULTILINE), # filename with spaces, starting at the line beginning
             re.compile(r"\'(?P<link>[^:\'\"|?*\x00-\x1F]+)\'(\:(?P<line>\d+))?"), # filename with spaces, quoted
@@ -2,9 +2,11 @@
 #   Author: (c) 2024 Andrea Alberti
 #===============================================================================
 
-from .opener import OpenerType, SchemeEntry, PreHandledMatch, PostHandledMatch
+from .opener import OpenerType, SchemeEntry, PreHandledMatch, PostHandledMatch, PreviewTarget
 from .schemes import heuristic_find_file
 from .configs import configs
 from .colors import colors
+from .stat_cache import cached_lstat, cached_realpath, cached_stat, path_mode
+from .scheme_costs import SchemeCost, get_scheme_costs
 
-__all__ = ["OpenerType", "SchemeEntry", "colors", "configs", "heuristic_find_file", "PreHandledMatch", "PostHandledMatch"]
+__all__ = ["OpenerType", "SchemeEntry", "colors", "configs", "heuristic_find_file", "PreHandledMatch", "PostHandledMatch", "PreviewTarget", "cached_stat", "cached_lstat", "cached_realpath", "path_mode", "SchemeCost", "get_scheme_costs"]
@@ -2,15 +2,25 @@
 #   Author: (c) 2024 Andrea Alberti
 #===============================================================================
 
-import shlex
-import subprocess
-import tempfile
 import os
 import sys
-from typing import TypedDict, Literal, TypeGuard, get_args
+from itertools import chain
+from typing import Callable, Generator, TypedDict, Literal, TypeGuard, get_args
 
 from .errors_types import FailedParsingUserOption, FzfError, FzfNotFound, FzfUserInterrupt, FzfWrongAction
 from .configs import configs
+from .tmux_transport import CLIENT_ENV_VAR
+from .tracing import span
+
+# Number of characters of the error output of fzf that are reported
+MAX_ERROR_CHARS = 500
+
+# Each choice starts with fields that fzf does not show, from which the
+# selected item is found without parsing the text shown (see `number_items`
+# in `__main__.py`); the choices, and the selection, are separated by NUL
+# characters, so that a choice may contain any other character
+CHOICE_DELIMITER = "\x1f"
+HIDDEN_FIELDS = 2
 
 ActionType = Literal["OPEN","SYSTEM_OPEN","REVEAL","COPY_TO_CLIPBOARD"]
 def is_valid_action_type(value: str) -> TypeGuard[ActionType]:
@@ -52,11 +62,136 @@ def parse_int_option(option_arg:str|None,ref_value:int|None) -> int|None:
     return int_value
 
 
-def run_fzf(fzf_path:str, fzf_display_options: str, choices: list[str], use_ls_colors: bool, pane_height:int, pane_width:int) -> FzfReturnType:
-    """Run fzf within a tmux popup with the given options and handle output via mkfifo."""
+def write_choices(stdin_file, choices:list[str], more_choices:Generator[list[str],None,None]|None) -> None:
+    """Write the choices to fzf, then the further ones as soon as they are produced."""
+    try:
+        for batch in ([choices] if more_choices is None else chain([choices], more_choices)):
+            if batch:
+                stdin_file.write("".join(f"{choice}\0" for choice in batch))
+                # Show the choices written so far while the next ones are produced
+                stdin_file.flush()
+    except BrokenPipeError:
+        # fzf has exited, e.g., an item was selected before all of them were written
+        pass
+    finally:
+        if more_choices is not None:
+            # Stop producing choices that cannot be selected any more
+            more_choices.close()
+        try:
+            stdin_file.close()
+        except BrokenPipeError:
+            pass
+
+def post_fzf_action(port:int, api_key:str, action:str) -> bool:
+    """Send an action to fzf listening on a local port; return whether fzf accepted it."""
+    import http.client
+
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+    try:
+        connection.request("POST", "/", body=action.encode(), headers={"x-api-key": api_key})
+        return connection.getresponse().status == 200
+    except OSError:
+        return False
+    finally:
+        connection.close()
+
+def reload_choices(fzf_running:Callable[[],bool], reloads:Generator[list[str],None,None], port:int, api_key:str, choices_path:str) -> None:
+    """Replace the choices shown by fzf with each list produced, until fzf exits."""
+    import shlex
+    import time
+
+    try:
+        # Stop producing choices as soon as fzf exits
+        while fzf_running():
+            choices = next(reloads, None)
+            if choices is None:
+                break
+
+            # fzf may still be reading the previous list
+            with open(f"{choices_path}.tmp", "w", encoding="utf-8") as choices_file:
+                choices_file.write("".join(f"{choice}\0" for choice in choices))
+            os.replace(f"{choices_path}.tmp", choices_path)
+
+            action = f"reload-sync(cat {shlex.quote(choices_path)})"
+            # fzf may not be listening yet right after starting
+            deadline = time.monotonic() + 1
+            while not post_fzf_action(port, api_key, action):
+                if not fzf_running() or time.monotonic() >= deadline:
+                    configs.logger.debug(f"fzf did not accept the action: {action}")
+                    break
+                time.sleep(0.02)
+    finally:
+        reloads.close()
+
+def open_fifo_writer(path:str, fzf_running:Callable[[],bool]) -> int|None:
+    """Open a named pipe for writing once fzf opens it for reading.
+
+    Return None if fzf exits, or the popup fails, before opening it.
+    """
+    import errno
+    import time
+
+    while True:
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_NONBLOCK)
+        except OSError as e:
+            # No reader yet
+            if e.errno != errno.ENXIO:
+                raise
+            if not fzf_running():
+                return None
+            time.sleep(0.001)
+            continue
+        os.set_blocking(fd, True)
+        return fd
+
+def read_result(result_fd:int, marker:str, tmux_process) -> tuple[str,str,int]|None:
+    """Read the output, the error output, and the exit status of fzf from the result pipe.
+
+    Return None if the popup exits without fzf reporting its exit status.
+    """
+    import select
+
+    data = bytearray()
+    separator = f"\n{marker}\n".encode()
+    status_prefix = f"\n{marker} ".encode()
+    while True:
+        if select.select([result_fd], [], [], 0.05)[0]:
+            data += os.read(result_fd, 65536)
+            # The exit status is the last line
+            status_start = data.rfind(status_prefix)
+            if status_start >= 0 and data.endswith(b"\n") and data.find(b"\n", status_start + 1) == len(data) - 1:
+                break
+        elif tmux_process.poll() is not None and not select.select([result_fd], [], [], 0)[0]:
+            return None
+
+    output_end = data.find(separator)
+    stdout = data[:output_end].decode("utf-8", errors="replace").strip()
+    stderr = data[output_end + len(separator):status_start].decode("utf-8", errors="replace").strip()
+    return (stdout, stderr, int(data[status_start + len(status_prefix):-1]),)
+
+def run_fzf(fzf_path:str, fzf_display_options: str, choices: list[str], use_ls_colors: bool, pane_height:int, pane_width:int, more_choices:Generator[list[str],None,None]|None = None, reloads:Generator[list[str],None,None]|None = None, preview:Callable[[int,int],str]|None = None) -> FzfReturnType:
+    """Run fzf within a tmux popup with the given options and handle its input and output via mkfifo.
+
+    The choices are written to fzf through a named pipe; `more_choices`, if
+    given, produces batches of further choices, which are written while fzf
+    is already running. `reloads`, if given, produces lists of choices that
+    replace the ones shown by fzf, using its `--listen` server. `preview`, if
+    given, returns the preview of the choice with the given index for the
+    given height (see `preview.py`).
+    """
+
+    import secrets
+    import select
+    import shlex
+    import subprocess
+    import tempfile
 
     # Parse user options into a list
     cmd_user_args: list[str] = shlex.split(fzf_display_options)
+    if preview is not None:
+        # The default options disable the preview
+        cmd_user_args = [arg for arg in cmd_user_args if arg != '--no-preview']
 
     VER_BORDER = 4 + (0 if configs.hide_fzf_header else 1)  # number of characters taken by vertical border
     HOR_BORDER = 2 # number of characters taken by horizontal border
@@ -67,6 +202,11 @@ def run_fzf(fzf_path:str, fzf_display_options: str, choices: list[str], use_ls_c
         "-E",  # Ensure the command runs interactively
     ]
 
+    # Show the popup on the client where the key was pressed, and not on any
+    # control-mode client connected to the same session
+    if (client := os.environ.get(CLIENT_ENV_VAR)):
+        tmux_popup_command.extend(["-c", client])
+
     # Set the x offset of the popup
     try:
         x_str = extract_option(cmd_user_args,'-x')
@@ -109,10 +249,13 @@ def run_fzf(fzf_path:str, fzf_display_options: str, choices: list[str], use_ls_c
     if height:
         # Force at least one line
         height = max(height,1)
-    else:
+    elif more_choices is None:
         # If height is not specified in the options, the plugin dynamically
         # computes the necessary popup height to fit all items
         height = len(choices)  # Number of lines
+    else:
+        # The number of items is not known in advance
+        height = pane_height
 
     # Get the maximum number of matches to be displayed at once
     try:
@@ -128,7 +271,7 @@ def run_fzf(fzf_path:str, fzf_display_options: str, choices: list[str], use_ls_c
     tmux_popup_command.extend(["-h", f"{fzf_height}"])
 
     # Base fzf arguments
-    fzf_args = ['--no-sort','--bind','ctrl-c:print(COPY_TO_CLIPBOARD)+accept', '--bind', 'ctrl-r:print(REVEAL)+accept', '--bind', 'ctrl-d:print(SYSTEM_OPEN)+accept', '--bind', 'enter:print(OPEN)+accept']
+    fzf_args = ['--no-sort','--read0','--print0','--delimiter',CHOICE_DELIMITER,'--with-nth',f'{HIDDEN_FIELDS+1}..','--bind','ctrl-c:print(COPY_TO_CLIPBOARD)+accept', '--bind', 'ctrl-r:print(REVEAL)+accept', '--bind', 'ctrl-d:print(SYSTEM_OPEN)+accept', '--bind', 'enter:print(OPEN)+accept']
     if use_ls_colors:
         fzf_args.append('--ansi')
 
@@ -149,62 +292,120 @@ def run_fzf(fzf_path:str, fzf_display_options: str, choices: list[str], use_ls_c
     # Combine fzf arguments, giving user options higher priority
     cmd_args = fzf_args + cmd_user_args
 
-    # Create a temporary directory for the named pipes
+    # Create a private temporary directory for the named pipes; the popup is
+    # started by the tmux server, so it cannot inherit a pipe from the plugin
     with tempfile.TemporaryDirectory() as tmpdir:
         # Paths for the named pipes
-        stdout_pipe = os.path.join(tmpdir, 'fzf_stdout')
-        stderr_pipe = os.path.join(tmpdir, 'fzf_stderr')
+        stdin_pipe = os.path.join(tmpdir, 'fzf_stdin')
+        result_pipe = os.path.join(tmpdir, 'fzf_result')
 
-        # Create named pipes for stdout and stderr
-        os.mkfifo(stdout_pipe)
-        os.mkfifo(stderr_pipe)
+        # Create named pipes for the choices and for the result
+        os.mkfifo(stdin_pipe)
+        os.mkfifo(result_pipe)
 
-        # Choices → [stdin] → fzf (interactive UI on /dev/tty)
-        #           → [stdout] → Named Pipe (stdout_pipe)
-        #           → [stderr] → Named Pipe (stderr_pipe)
+        # Choices → Named Pipe (stdin_pipe) → [stdin] → fzf (interactive UI on /dev/tty)
+        #           → [stdout], [stderr], exit status → Named Pipe (result_pipe)
         
-        # Prepare the fzf command to run inside the tmux popup
-        fzf_command = (
-            f"echo \"{chr(10).join(choices)}\" | "
-            f"{fzf_path} {' '.join(shlex.quote(arg) for arg in cmd_args)} "
-            f"> {shlex.quote(stdout_pipe)} 2> {shlex.quote(stderr_pipe)}"
+        fzf_env = ""
+        if reloads is not None:
+            import socket
+
+            # fzf accepts actions over HTTP on a local port; the key keeps
+            # other users from sending actions, and it is passed through a
+            # private file as the command line of processes is public
+            api_key = secrets.token_hex(16)
+            api_key_path = os.path.join(tmpdir, 'fzf_api_key')
+            with open(api_key_path, 'w') as api_key_file:
+                api_key_file.write(api_key)
+            fzf_env = f"FZF_API_KEY=\"$(cat {shlex.quote(api_key_path)})\" "
+
+            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as probe:
+                probe.bind(("127.0.0.1", 0))
+                listen_port:int = probe.getsockname()[1]
+            cmd_args = [f"--listen=127.0.0.1:{listen_port}"] + cmd_args
+
+        preview_server = None
+        if preview is not None:
+            from .preview import PreviewServer
+            preview_server = PreviewServer(preview, os.path.join(tmpdir, 'preview_key'))
+            cmd_args = ['--preview', preview_server.command()] + cmd_args
+
+        # Prepare the fzf command to run inside the tmux popup; the choices
+        # are not part of the command, which is limited in size and would
+        # be interpreted by the shell. The output of fzf is followed by its
+        # error output and its exit status, which are separated by a random
+        # marker; the shell collects the error output, so that no output
+        # can block fzf while the plugin waits for another one. The script
+        # is run by `sh` whatever the default shell of tmux is
+        marker = secrets.token_hex(8)
+        fzf_script = (
+            f"{{ fzf_error=$({fzf_env}{fzf_path} {' '.join(shlex.quote(arg) for arg in cmd_args)} 2>&1 >&3 < {shlex.quote(stdin_pipe)}); "
+            f"fzf_status=$?; printf '\\n%s\\n%s\\n%s %s\\n' {marker} \"$fzf_error\" {marker} \"$fzf_status\" >&3; }} "
+            f"3> {shlex.quote(result_pipe)}"
         )
 
-        tmux_popup_command.append(fzf_command)
+        tmux_popup_command.append(f"sh -c {shlex.quote(fzf_script)}")
 
+        # Open the result pipe before starting the popup, along with a
+        # writer of our own, so that neither side waits for the other to
+        # open it and reading only returns once data is available
+        result_fd = os.open(result_pipe, os.O_RDONLY | os.O_NONBLOCK)
+        result_writer_fd = os.open(result_pipe, os.O_WRONLY | os.O_NONBLOCK)
         try:
             # Start the tmux popup process
-            tmux_process = subprocess.Popen(tmux_popup_command, shell=False)
-
-            # Open the named pipes for reading
-            with open(stdout_pipe, 'r') as stdout_file, open(stderr_pipe, 'r') as stderr_file:
-                # Read stdout and stderr in parallel
-                stdout = stdout_file.read().strip()
-                stderr = stderr_file.read().strip()
-
-            # Wait for the tmux popup to complete
-            tmux_process.wait()
-
-            # Handle errors or user cancellation
-            if tmux_process.returncode == 0:
-
-                # Split the lines from fzf
-                results = stdout.splitlines()
-
-                # The first line is special and tells us what key was pressed / action was chosen by the user
-                selected_action = results[0]
-                if not is_valid_action_type(selected_action):
-                    raise FzfWrongAction(f"Action selected with fzf is not supported: {selected_action}")
-
-                return {"action":selected_action, "selection":results[1:]}
-            elif tmux_process.returncode == 130:
-                raise FzfUserInterrupt("User canceled selection")
-            elif tmux_process.returncode == 127:
-                raise FzfNotFound(f"fzf command not found: {fzf_path}. Make sure fzf command is installed and reachable in the $PATH")
-            else:
-                raise FzfError(f"fzf failed with exit code {tmux_process.returncode}: {stderr}")
-
+            with span("popup"):
+                tmux_process = subprocess.Popen(tmux_popup_command, shell=False)
+
+            def fzf_running() -> bool:
+                # fzf only writes to the result pipe when it exits
+                return tmux_process.poll() is None and not select.select([result_fd], [], [], 0)[0]
+
+            # Until fzf opens its input
+            with span("fzf_startup"):
+                stdin_fd = open_fifo_writer(stdin_pipe, fzf_running)
+            if stdin_fd is not None:
+                # Feed fzf; it only prints the selection once it exits
+                with span("write_choices", choices=len(choices), streamed=more_choices is not None):
+                    write_choices(open(stdin_fd, 'w', encoding='utf-8'), choices, more_choices)
+                if reloads is not None:
+                    with span("reload_choices"):
+                        reload_choices(fzf_running, reloads, listen_port, api_key, os.path.join(tmpdir, 'fzf_choices'))
+
+            # Until the user selects the links
+            with span("fzf_selection"):
+                result = read_result(result_fd, marker, tmux_process)
         finally:
-            # Named pipes are automatically cleaned up with the TemporaryDirectory
-            pass
-
+            os.close(result_fd)
+            os.close(result_writer_fd)
+            if preview_server is not None:
+                preview_server.close()
+
+    if result is None:
+        # The popup exited without running fzf, e.g., tmux could not open it;
+        # wait for tmux to report the error
+        tmux_process.wait()
+        raise FzfError(f"the tmux popup failed with exit code {tmux_process.returncode}")
+
+    # The selection is handled without waiting for the tmux popup client to
+    # exit; the process is reaped by `subprocess` later
+    stdout, stderr, returncode = result
+
+    # Handle errors or user cancellation
+    if returncode == 0:
+
+        # Split the entries printed by fzf, each followed by a NUL character
+        results = stdout.split("\0")[:-1]
+
+        # The first line is special and tells us what key was pressed / action was chosen by the user
+        selected_action = results[0] if results else ""
+        if not is_valid_action_type(selected_action):
+            raise FzfWrongAction(f"Action selected with fzf is not supported: {selected_action}")
+
+        return {"action":selected_action, "selection":results[1:]}
+    elif returncode == 130:
+        raise FzfUserInterrupt("User canceled selection")
+    elif returncode == 127:
+        raise FzfNotFound(f"fzf command not found: {fzf_path}. Make sure fzf command is installed and reachable in the $PATH")
+    else:
+        # Only the end of a long error output fits in a tmux message
+        raise FzfError(f"fzf failed with exit code {returncode}: {stderr[-MAX_ERROR_CHARS:]}")
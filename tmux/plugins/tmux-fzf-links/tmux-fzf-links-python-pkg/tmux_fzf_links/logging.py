@@ -13,7 +13,6 @@ elif sys.version_info < (3, 12):  # For Python 3.8 and older
         return method
 
 import logging
-import subprocess
 
 from .errors_types import FileLoggingNotAllow
 
@@ -22,9 +21,11 @@ class TmuxDisplayHandler(logging.Handler):
     def emit(self, record:logging.LogRecord):
         # Format the log message
         message = self.format(record)
+        # Imported here, as most invocations log nothing
+        from .tmux_transport import run_tmux
         try:
             # Determine the display command options based on the log level
-            display_options = ["tmux", "display-message"]
+            display_options = ["display-message"]
             if record.levelno >= logging.WARNING:
                 display_options.extend(["-d", "0"])  # Pause the message for warnings and errors
 
@@ -32,13 +33,7 @@ class TmuxDisplayHandler(logging.Handler):
             display_options.append(message)
 
             # Use tmux display-message to show the log
-            _ = subprocess.run(
-                display_options,
-                check=True,
-                shell=False,
-                stdout=subprocess.DEVNULL,
-                stderr=subprocess.DEVNULL,
-            )
+            _ = run_tmux(display_options)
         except Exception as e:
             # Fallback to console if tmux command fails
             print(f"Failed to display message in tmux: {e}")
@@ -53,6 +48,13 @@ def set_up_logger(loglevel_tmux:str,loglevel_file:str,log_filename:str) -> tuple
     # Allow all log messages to pass through; we control the level using handlers
     logger.setLevel(0)
 
+    # Remove the handlers installed by a previous invocation in the same
+    # process (e.g., when running as a daemon)
+    for handler in list(logger.handlers):
+        if isinstance(handler,(TmuxDisplayHandler,logging.FileHandler)):
+            logger.removeHandler(handler)
+            handler.close()
+
     # Set up tmux log handler
     tmux_handler = setup_tmux_log_handler()
     tmux_handler.setLevel(validate_log_level(loglevel_tmux))
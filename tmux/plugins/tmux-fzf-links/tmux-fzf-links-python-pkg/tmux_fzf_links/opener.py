@@ -2,10 +2,8 @@
 #   Author: (c) 2024 Andrea Alberti
 #===============================================================================
 
-import shutil
 import re
 import os
-import subprocess
 from enum import Enum
 import sys
 from typing import Callable, TypedDict, TypeGuard
@@ -13,9 +11,10 @@ if sys.version_info >= (3, 11):  # For Python 3.11 and newer
     from typing import NotRequired
 elif sys.version_info < (3, 11):  # For Python 3.10
     pass
-import shlex
 
 from .errors_types import CommandFailed, NoBrowserConfigured, NoEditorConfigured, NoSuitableAppFound
+from .tmux_transport import get_transport
+from .tracing import span
 
 class OpenerType(Enum):
     EDITOR = 0
@@ -74,21 +73,39 @@ def isValidPostHandledMatchCustomType(value:PostHandledMatchDefinite) -> TypeGua
         return False
 
 # Pre and post handler types
+class PreviewTarget(TypedDict):
+    file: str # file or directory shown in the preview
+    line: int # line of the file highlighted in the preview, starting from 1
+
 PreHandler = Callable[[re.Match[str]], PreHandledMatch | None] | None
 PostHandler = Callable[[re.Match[str]], PostHandledMatch] | None
+PreviewHandler = Callable[[re.Match[str]], PreviewTarget | None]
 
 # Define the structure of each scheme entry
-class SchemeEntry(TypedDict):
-    tags: tuple[str,...]
-    opener: OpenerType
-    pre_handler: PreHandler  # A function that takes a string and returns a string
-    post_handler: PostHandler  # A function that takes a string and returns a string
-    regex: list[re.Pattern[str]]            # A compiled regex pattern
+if sys.version_info >= (3, 11):
+    class SchemeEntry(TypedDict):
+        tags: tuple[str,...]
+        opener: OpenerType
+        pre_handler: PreHandler  # A function that takes a string and returns a string
+        post_handler: PostHandler  # A function that takes a string and returns a string
+        regex: list[re.Pattern[str]]            # A compiled regex pattern
+        literals: NotRequired[tuple[str,...]] # if provided, every match contains at least one of these strings
+        slow: NotRequired[bool] # if True, the pre_handler is expensive (e.g., it accesses the file system) and may run while fzf is displayed
+        preview_handler: NotRequired[PreviewHandler] # if provided, the file shown in the preview of a match
+else:
+    class SchemeEntry(TypedDict):
+        tags: tuple[str,...]
+        opener: OpenerType
+        pre_handler: PreHandler  # A function that takes a string and returns a string
+        post_handler: PostHandler  # A function that takes a string and returns a string
+        regex: list[re.Pattern[str]]            # A compiled regex pattern
+        # In Python < 3.11, we can't mark 'literals', 'slow' and 'preview_handler' as NotRequired, so they are omitted
 
 xdg_open_util: str | None = None
 def get_xdg_open_util() -> str | None:
     # Find xdg_open for Linux; if nothing is found, None is returned
     global xdg_open_util
+    import shutil
     if xdg_open_util is None:
         xdg_open_util = shutil.which("xdg-open")
     return xdg_open_util
@@ -96,6 +113,7 @@ def get_xdg_open_util() -> str | None:
 system_open_util: str | None = None
 def get_system_open_util() -> str | None:
     global system_open_util
+    import shutil
     if system_open_util is None:
         if sys.platform == "darwin":
             cmd = shutil.which("open")
@@ -117,6 +135,7 @@ reveal_util: str | None = None
 def get_reveal_util() -> str | None:
     # Find open for macOS; if nothing is found, None is returned
     global reveal_util
+    import shutil
     if reveal_util is None:
         if sys.platform == "darwin":
             cmd = shutil.which("open")
@@ -137,6 +156,7 @@ def get_reveal_util() -> str | None:
 def cmd_from_template(template:str,post_handled_match:PostHandledMatchUrlType | PostHandledMatchFileType ):
     # The keys in the dictionary represent the placeholders
     # to be replaced in the template with the corresponding values
+    import shlex
     cmd_str = template
     for key,value in post_handled_match.items():
         if isinstance(value,str):
@@ -149,6 +169,7 @@ def spawn_daemon(cmd_plus_args: list[str]):
     - On Unix, uses double-fork daemonization; see double-fork magic, see Stevens' "Advanced Programming in the UNIX Environment" for details (ISBN 0201563177)
     - On Windows, uses DETACHED_PROCESS and CREATE_NEW_PROCESS_GROUP.
     """
+    import subprocess
     if sys.platform == "win32":
         DETACHED_PROCESS = subprocess.DETACHED_PROCESS
         CREATE_NEW_PROCESS_GROUP = subprocess.CREATE_NEW_PROCESS_GROUP
@@ -169,6 +190,9 @@ def spawn_daemon(cmd_plus_args: list[str]):
     try:
         pid = os.fork()
         if pid > 0:
+            # Reap the first child, which exits right after the second fork;
+            # this avoids leaving zombies behind in long-lived processes
+            os.waitpid(pid, 0)
             return  # Exit parent
     except OSError as e:
         raise CommandFailed(f"First fork failed: {e}", file=sys.stderr)
@@ -194,6 +218,7 @@ def spawn_daemon(cmd_plus_args: list[str]):
 
 def open_link(post_handled_match:PostHandledMatchDefinite, editor_open_cmd:str, browser_open_cmd:str, opener:OpenerType):
     """Open a link using the appropriate handler."""
+    import shlex
 
     # contains the arguments for subprocess.Popen, including the process to start
     cmd_plus_args:list[str]
@@ -251,7 +276,18 @@ def open_link(post_handled_match:PostHandledMatchDefinite, editor_open_cmd:str,
                 raise NoSuitableAppFound("no suitable app was found to open the link")
 
     try:
-        spawn_daemon(cmd_plus_args)
+        # tmux commands return immediately; when a persistent connection to
+        # tmux is available, they are sent over it instead of spawning tmux
+        transport = get_transport()
+        if cmd_plus_args[0] == "tmux" and transport.can_pipeline(cmd_plus_args[1:]):
+            with span("tmux", command=cmd_plus_args[1]):
+                transport.run(cmd_plus_args[1:])
+        else:
+            with span("spawn_daemon", command=cmd_plus_args[0]):
+                spawn_daemon(cmd_plus_args)
+
+    except CommandFailed:
+        raise
 
     except FileNotFoundError as e:
         raise CommandFailed(f'could not find "{cmd_plus_args[0]}" in the path')
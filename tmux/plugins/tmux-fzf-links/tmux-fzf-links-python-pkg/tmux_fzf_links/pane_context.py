@@ -0,0 +1,158 @@
+#===============================================================================
+#   Author: (c) 2024 Andrea Alberti
+#===============================================================================
+
+import os
+from typing import TypedDict
+
+from .errors_types import FailedTmuxPaneSize
+from .tmux_transport import run_tmux, run_tmux_many
+
+class PaneContext(TypedDict):
+    pane_id: str
+    pane_height: int
+    pane_width: int
+    scroll_position: int # number of lines scrolled up in copy mode; 0 otherwise
+    history_size: int
+    cursor_y: int
+    current_path: str
+    content: str # captured text, not normalized
+    label: str # e.g., `1.2` for the second pane of the first window
+
+# Separator of the fields in the output of `display`; the current path
+# comes last because it is the only field that can contain any character
+FIELD_SEPARATOR = "\x1f"
+
+# Marks the end of the metadata of a pane, followed by the newline of
+# `display`: the current path may contain newlines, so that the end of its
+# line does not tell where the metadata ends
+RECORD_SEPARATOR = "\x1e"
+METADATA_END = f"{RECORD_SEPARATOR}\n"
+
+PANE_FORMAT = FIELD_SEPARATOR.join([
+    "#{pane_id}",
+    "#{pane_height}",
+    "#{pane_width}",
+    "#{scroll_position}",
+    "#{history_size}",
+    "#{cursor_y}",
+    "#{pane_current_path}",
+]) + RECORD_SEPARATOR
+
+# Format of the panes listed with `list-panes`, preceded by their label
+LABELED_PANE_FORMAT = FIELD_SEPARATOR.join(["#{window_index}.#{pane_index}", PANE_FORMAT])
+
+# Panes scanned for each value of `@fzf-links-panes`, as flags of `list-panes`
+PANE_SCOPES:dict[str,list[str]] = {
+    "window": [],
+    "session": ["-s"],
+}
+
+def capture_args(history_lines:int, pane_height:int|None = None, scroll_position:int = 0) -> list[str]:
+    """Return the arguments of `capture-pane` for the visible lines plus `history_lines`.
+
+    Without `pane_height`, the capture extends to the end of the visible pane,
+    which is correct as long as the pane is not scrolled.
+    """
+    end = f"{pane_height-scroll_position-1}" if pane_height is not None else "-"
+    return ['capture-pane', '-J', '-p', '-S', f'{-scroll_position-history_lines}', '-E', end]
+
+def parse_pane_metadata(metadata:str) -> PaneContext:
+    """Parse the metadata of a pane, without `METADATA_END`."""
+    try:
+        fields = metadata.split(FIELD_SEPARATOR, 6)
+        return {
+            "pane_id": fields[0],
+            "pane_height": int(fields[1]),
+            "pane_width": int(fields[2]),
+            # `scroll_position` is empty when the pane is not in copy mode
+            "scroll_position": int(fields[3]) if fields[3] else 0,
+            "history_size": int(fields[4]),
+            "cursor_y": int(fields[5]),
+            "current_path": fields[6],
+            "content": "",
+            "label": "",
+        }
+    except (IndexError, ValueError) as e:
+        raise FailedTmuxPaneSize(f"tmux pane size could not be determined: {e}")
+
+def fetch_pane_context(history_lines:int) -> PaneContext:
+    """Retrieve the pane metadata and its content in a single call to tmux.
+
+    The metadata and the content are requested in the same command sequence
+    assuming that the pane is not scrolled. Only when the pane turns out to
+    be in copy mode and scrolled, the content is captured again.
+    """
+
+    try:
+        output = run_tmux(['display', '-p', PANE_FORMAT, ';', *capture_args(history_lines)])
+    except Exception as e:
+        raise FailedTmuxPaneSize(f"tmux pane size could not be determined: {e}")
+
+    metadata, end, content = output.partition(METADATA_END)
+    if not end:
+        raise FailedTmuxPaneSize(f"tmux pane size could not be determined: unexpected output {metadata!r}")
+    context = parse_pane_metadata(metadata)
+
+    if context["scroll_position"]:
+        content = run_tmux(capture_args(history_lines, context["pane_height"], context["scroll_position"]))
+
+    context["content"] = content
+    return context
+
+def fetch_panes_metadata(scope:str) -> list[PaneContext]:
+    """Retrieve the metadata of the current pane, or of the panes of the current window or session.
+
+    The current pane comes first; the content of the panes is not captured.
+    """
+
+    if scope == "current":
+        try:
+            metadata = run_tmux(['display', '-p', PANE_FORMAT])
+        except Exception as e:
+            raise FailedTmuxPaneSize(f"tmux pane size could not be determined: {e}")
+        return [parse_pane_metadata(metadata.removesuffix(METADATA_END))]
+
+    # The window or session of the pane where the key was pressed
+    pane_id = os.environ.get("TMUX_PANE")
+    target = ['-t', pane_id] if pane_id else []
+
+    try:
+        output = run_tmux(['display', '-p', *target, '#{pane_id}', ';', 'list-panes', *PANE_SCOPES[scope], *target, '-F', LABELED_PANE_FORMAT])
+        current_pane_id, _, output = output.partition("\n")
+        *records, rest = output.split(METADATA_END)
+        if rest:
+            raise ValueError(f"unexpected output {rest!r}")
+        contexts:list[PaneContext] = []
+        for record in records:
+            label, _, metadata = record.partition(FIELD_SEPARATOR)
+            context = parse_pane_metadata(metadata)
+            context["label"] = label
+            contexts.append(context)
+    except Exception as e:
+        raise FailedTmuxPaneSize(f"tmux panes could not be listed: {e}")
+
+    # The current pane first, the others in the order of tmux
+    contexts.sort(key=lambda context: context["pane_id"] != current_pane_id)
+    return contexts
+
+def capture_panes(contexts:list[PaneContext], history_lines:int) -> None:
+    """Capture the content of the panes, concurrently or pipelined over the control-mode connection."""
+    try:
+        contents = run_tmux_many([
+            [*capture_args(history_lines, context["pane_height"], context["scroll_position"]), '-t', context["pane_id"]]
+            for context in contexts
+        ])
+    except Exception as e:
+        raise FailedTmuxPaneSize(f"tmux panes could not be captured: {e}")
+
+    for context, content in zip(contexts, contents):
+        context["content"] = content
+
+def fetch_panes_context(history_lines:int, scope:str) -> list[PaneContext]:
+    """Retrieve the metadata and the content of the panes of the current window or session, the current pane first."""
+    contexts = fetch_panes_metadata(scope)
+    capture_panes(contexts, history_lines)
+    return contexts
+
+__all__ = ["PaneContext", "PANE_SCOPES", "capture_panes", "fetch_pane_context", "fetch_panes_context", "fetch_panes_metadata"]
@@ -0,0 +1,259 @@
+#===============================================================================
+#   Author: (c) 2024 Andrea Alberti
+#===============================================================================
+
+# Literal prefilter: most lines of a capture cannot match most regexes, e.g.,
+# a URL needs `http` and a Python traceback needs `File "`. For regexes whose
+# matches always contain one of a few literals and never span several lines,
+# one search for all literals picks the candidate lines, and the regexes run
+# on those lines only. The literals are either declared by the scheme
+# (`"literals"` entry) or derived from the parsed pattern.
+
+import re
+from typing import Match, Pattern
+try:
+    from re import _parser as sre_parse # Python 3.11 and newer
+except ImportError:
+    import sre_parse
+
+# A lane is prefiltered only if its literals occur on few lines; otherwise
+# going through the candidate lines costs more than scanning everything
+MAX_CANDIDATE_RATIO = 0.125
+
+# Character categories including the newline
+NEWLINE_CATEGORIES = {
+    sre_parse.CATEGORY_SPACE,
+    sre_parse.CATEGORY_NOT_DIGIT,
+    sre_parse.CATEGORY_NOT_WORD,
+    sre_parse.CATEGORY_LINEBREAK,
+}
+
+REPEATS = {sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT}
+if hasattr(sre_parse, "POSSESSIVE_REPEAT"):
+    REPEATS.add(sre_parse.POSSESSIVE_REPEAT)
+
+def _set_has_newline(items:list) -> bool:
+    negate = False
+    contains = False
+    for op, av in items:
+        if op is sre_parse.NEGATE:
+            negate = True
+        elif op is sre_parse.LITERAL:
+            contains = contains or av == 10
+        elif op is sre_parse.RANGE:
+            contains = contains or av[0] <= 10 <= av[1]
+        elif op is sre_parse.CATEGORY:
+            contains = contains or av in NEWLINE_CATEGORIES
+        else:
+            # Unknown set item: assume the worst
+            return True
+    return contains != negate
+
+def spans_lines(items, dotall:bool) -> bool:
+    """Whether a match may extend over a newline or depend on text after the end of its line.
+
+    The analysis is conservative: unknown constructs are assumed to do so.
+    """
+    for op, av in items:
+        if op is sre_parse.LITERAL:
+            if av == 10:
+                return True
+        elif op is sre_parse.NOT_LITERAL:
+            if av != 10:
+                return True
+        elif op is sre_parse.ANY:
+            if dotall:
+                return True
+        elif op is sre_parse.IN:
+            if _set_has_newline(av):
+                return True
+        elif op is sre_parse.SUBPATTERN:
+            _, add_flags, del_flags, sub = av
+            sub_dotall = (dotall or bool(add_flags & re.DOTALL)) and not del_flags & re.DOTALL
+            if spans_lines(sub, sub_dotall):
+                return True
+        elif op is sre_parse.BRANCH:
+            if any(spans_lines(branch, dotall) for branch in av[1]):
+                return True
+        elif op in REPEATS:
+            if spans_lines(av[2], dotall):
+                return True
+        elif op is getattr(sre_parse, "ATOMIC_GROUP", None):
+            if spans_lines(av, dotall):
+                return True
+        elif op in (sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+            # Lookbehinds see the actual text before the line; lookaheads
+            # could look past the end of the line
+            direction, sub = av
+            if direction >= 0 or spans_lines(sub, dotall):
+                return True
+        elif op is sre_parse.AT:
+            # `$` and `\Z` depend on where the text ends
+            if av in (sre_parse.AT_END, sre_parse.AT_END_STRING):
+                return True
+        else:
+            # E.g., backreferences and conditional groups
+            return True
+    return False
+
+def _lookbehind_reach(items) -> int:
+    """Return how many characters before the start of a match the lookbehinds may inspect."""
+    reach = 0
+    for op, av in items:
+        if op is sre_parse.SUBPATTERN:
+            reach += _lookbehind_reach(av[3])
+        elif op is sre_parse.BRANCH:
+            reach += max((_lookbehind_reach(branch) for branch in av[1]), default=0)
+        elif op in REPEATS:
+            reach += _lookbehind_reach(av[2])
+        elif op is getattr(sre_parse, "ATOMIC_GROUP", None):
+            reach += _lookbehind_reach(av)
+        elif op in (sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+            direction, sub = av
+            if direction < 0:
+                # Lookbehinds have a fixed width; nested ones reach further
+                reach += sub.getwidth()[1] + _lookbehind_reach(sub)
+    return reach
+
+def line_context(regex:Pattern[str]) -> int|None:
+    """Return the number of characters before a line that the regex may inspect, or None.
+
+    None means that the matches in a line may depend on other lines. Matches of such a regex
+    never cross a newline, hence the matches in a range of whole lines are
+    the same as in the whole content. Besides, `^` without `re.MULTILINE`
+    and `\A` only match in the first line.
+    """
+    if not isinstance(regex.pattern, str):
+        return None
+    try:
+        parsed = sre_parse.parse(regex.pattern, regex.flags)
+        min_width, _ = parsed.getwidth()
+    except (re.error, AttributeError):
+        return None
+
+    # Empty matches at the boundary between two lines would be found twice
+    if min_width == 0 or spans_lines(parsed, bool(regex.flags & re.DOTALL)):
+        return None
+    return _lookbehind_reach(parsed)
+
+def _required(items, ignorecase:bool) -> frozenset[str]|None:
+    """Return a set of literals, one of which is contained in any match, or None."""
+    candidates:list[frozenset[str]] = []
+    run:list[str] = []
+
+    for op, av in items:
+        if op is sre_parse.LITERAL and not ignorecase:
+            run.append(chr(av))
+            continue
+        if run:
+            candidates.append(frozenset(("".join(run),)))
+            run = []
+
+        required:frozenset[str]|None = None
+        if op is sre_parse.SUBPATTERN:
+            _, add_flags, del_flags, sub = av
+            sub_ignorecase = (ignorecase or bool(add_flags & re.IGNORECASE)) and not del_flags & re.IGNORECASE
+            required = _required(sub, sub_ignorecase)
+        elif op is sre_parse.BRANCH:
+            alternatives = [_required(branch, ignorecase) for branch in av[1]]
+            if all(alternatives):
+                required = frozenset().union(*alternatives) # type: ignore[arg-type]
+        elif op in REPEATS:
+            if av[0] >= 1:
+                required = _required(av[2], ignorecase)
+        elif op is getattr(sre_parse, "ATOMIC_GROUP", None):
+            required = _required(av, ignorecase)
+        if required:
+            candidates.append(required)
+
+    if run:
+        candidates.append(frozenset(("".join(run),)))
+
+    if not candidates:
+        return None
+    # The most selective set is the one with the longest shortest literal
+    return max(candidates, key=lambda literals: (min(len(literal) for literal in literals), -len(literals)))
+
+def lane_literals(regex:Pattern[str], declared:tuple[str,...]|None = None) -> tuple[str,...]|None:
+    """Return the literals of a regex if it can be prefiltered by line, or None."""
+    if not isinstance(regex.pattern, str):
+        return None
+    try:
+        parsed = sre_parse.parse(regex.pattern, regex.flags)
+    except (re.error, AttributeError):
+        return None
+
+    if spans_lines(parsed, bool(regex.flags & re.DOTALL)):
+        return None
+
+    if declared:
+        if any(not literal or "\n" in literal for literal in declared):
+            return None
+        return tuple(declared)
+
+    # The regex engine already skips quickly to the occurrences of a literal
+    # prefix; the prefilter pays off for the other regexes (e.g., those with
+    # an optional prefix or starting with a character class)
+    if len(parsed) and parsed[0][0] is sre_parse.LITERAL and not regex.flags & re.IGNORECASE:
+        return None
+
+    literals = _required(parsed, bool(regex.flags & re.IGNORECASE))
+    if not literals or "" in literals:
+        return None
+    return tuple(sorted(literals))
+
+def select_prefiltered(content:str, lane_literals:dict[int,tuple[str,...]], pos:int = 0, endpos:int|None = None) -> dict[int,tuple[str,...]]:
+    """Keep the lanes whose literals are rare enough in the content to be worth prefiltering."""
+    if endpos is None:
+        endpos = len(content)
+    max_occurrences = (content.count("\n", pos, endpos) + 1) * MAX_CANDIDATE_RATIO
+    counts:dict[str,int] = {}
+    selected:dict[int,tuple[str,...]] = {}
+    for idx, literals in lane_literals.items():
+        occurrences = 0
+        for literal in literals:
+            if literal not in counts:
+                counts[literal] = content.count(literal, pos, endpos)
+            occurrences += counts[literal]
+        if occurrences <= max_occurrences:
+            selected[idx] = literals
+    return selected
+
+def scan_candidate_lines(content:str, lanes:dict[int,tuple[Pattern[str],tuple[str,...]]], pos:int = 0, endpos:int|None = None) -> dict[int,list[Match[str]]]:
+    """Run each regex on the lines containing one of its literals.
+
+    The result of each lane is identical to `finditer` over the whole content,
+    because its matches are confined to the lines containing its literals.
+    The range `[pos, endpos)`, if given, must start and end at line boundaries.
+    """
+    matches:dict[int,list[Match[str]]] = {idx: [] for idx in lanes}
+    if not lanes:
+        return matches
+
+    # Lanes owning each literal
+    owners:dict[str,list[int]] = {}
+    for idx, (_, literals) in lanes.items():
+        for literal in literals:
+            owners.setdefault(literal, []).append(idx)
+    all_literals = sorted(owners, key=len, reverse=True)
+    search = re.compile("|".join(re.escape(literal) for literal in all_literals)).search
+
+    if endpos is None:
+        endpos = len(content)
+    position = pos
+    while (hit := search(content, position, endpos)) is not None:
+        line_start = content.rfind("\n", pos, hit.start()) + 1 or pos
+        line_end = content.find("\n", hit.end(), endpos)
+        # Include the newline, which some regexes check (e.g., with `\b`)
+        line_end = endpos if line_end < 0 else line_end + 1
+
+        found = owners[hit.group()]
+        for idx, (regex, literals) in lanes.items():
+            if idx in found or any(content.find(literal, line_start, line_end) >= 0 for literal in literals):
+                matches[idx].extend(regex.finditer(content, line_start, line_end))
+
+        position = line_end
+
+    return matches
+
+__all__ = ["line_context", "lane_literals", "select_prefiltered", "scan_candidate_lines"]
@@ -0,0 +1,217 @@
+#===============================================================================
+#   Author: (c) 2024 Andrea Alberti
+#===============================================================================
+
+# Previews of the links shown by fzf (see `@fzf-links-preview`). fzf runs
+# the preview command on every move of the cursor; a command starting an
+# interpreter, or reading whole files, cannot keep up with fast scrolling.
+# Instead, the plugin process, which waits for fzf anyway, serves the
+# previews from a thread over a local port. The preview command is a short
+# `bash` script, which sends the index of the link and the height of the
+# preview over `/dev/tcp` and prints the reply with `cat`; the key sent
+# along keeps other users from reading the previews, and it is passed
+# through a private file as the command line of processes is public.
+#
+# The file or directory shown for a link is given by the `preview_handler`
+# of its scheme. Only the lines shown are read, from the closest of the
+# positions of every few lines found so far. The positions are kept for the
+# most recently previewed files, e.g., when moving across several errors in
+# the same file, and in the resident server (see `server.py`) across key
+# presses, as long as the files do not change.
+
+import os
+import secrets
+import shlex
+import socket
+import stat
+import threading
+from collections import OrderedDict
+from itertools import islice
+from typing import Callable, TypedDict
+
+from .configs import configs
+from .opener import PreviewTarget
+
+# Number of files whose checkpoints are kept, and number of lines between
+# two checkpoints, i.e., positions from which a file is read
+MAX_CACHED_FILES = 32
+CHECKPOINT_LINES = 256
+
+# Number of characters kept of each line, and of bytes read at the
+# beginning of a file to tell whether it is binary
+MAX_LINE_CHARS = 1000
+BINARY_CHECK_BYTES = 4096
+
+# Number of entries of a directory that are listed at most
+MAX_LISTED_ENTRIES = 1000
+
+# Seconds to wait for a preview command to send its request
+REQUEST_TIMEOUT = 1
+
+# Marks the line of the link
+HIGHLIGHT = "\033[7m"
+RESET = "\033[0m"
+
+class CachedFile(TypedDict):
+    state: tuple[int,int] # modification time and size
+    checkpoints: list[int] # positions in bytes of the lines 1, 1 + CHECKPOINT_LINES, 1 + 2 * CHECKPOINT_LINES, ...
+    binary: bool
+
+_files:OrderedDict[str,CachedFile] = OrderedDict()
+
+def read_window(path:str, first:int, count:int) -> list[str]|None:
+    """Return up to `count` lines of a file from the line `first`, or None if the file is binary.
+
+    The file is read from the last known checkpoint before the first line.
+    """
+    metadata = os.stat(path)
+    state = (metadata.st_mtime_ns, metadata.st_size,)
+    cached = _files.get(path)
+    if cached is None or cached["state"] != state:
+        cached = {"state": state, "checkpoints": [], "binary": False}
+        _files[path] = cached
+    _files.move_to_end(path)
+    while len(_files) > MAX_CACHED_FILES:
+        _files.popitem(last=False)
+
+    if cached["binary"]:
+        return None
+
+    checkpoints = cached["checkpoints"]
+    window:list[str] = []
+    with open(path, "rb") as file:
+        if not checkpoints:
+            if b"\0" in file.read(BINARY_CHECK_BYTES):
+                cached["binary"] = True
+                return None
+            checkpoints.append(0)
+
+        index = min((first - 1) // CHECKPOINT_LINES, len(checkpoints) - 1)
+        number = index * CHECKPOINT_LINES + 1 # number of the next line
+        file.seek(checkpoints[index])
+        max_bytes = 4 * MAX_LINE_CHARS
+        while len(window) < count:
+            line = file.readline(max_bytes)
+            if not line:
+                break
+            if number >= first:
+                window.append(line.rstrip(b"\r\n").decode("utf-8", errors="replace")[:MAX_LINE_CHARS])
+            # Skip the rest of a long line
+            while len(line) == max_bytes and not line.endswith(b"\n"):
+                line = file.readline(max_bytes)
+            if number % CHECKPOINT_LINES == 0 and number // CHECKPOINT_LINES == len(checkpoints):
+                checkpoints.append(file.tell())
+            number += 1
+    return window
+
+def list_directory(path:str, height:int) -> str:
+    with os.scandir(path) as entries:
+        names = [f"{entry.name}/" if entry.is_dir() else entry.name for entry in islice(entries, MAX_LISTED_ENTRIES)]
+    names.sort(key=str.lower)
+    return "".join(f"{name}\n" for name in names[:height])
+
+def render_preview(target:PreviewTarget, height:int) -> str:
+    """Return the lines around the line of a file, or the entries of a directory, fitting the height of the preview."""
+    path = target["file"]
+    try:
+        mode = os.stat(path).st_mode
+        if stat.S_ISDIR(mode):
+            return list_directory(path, height)
+        if not stat.S_ISREG(mode):
+            return ""
+        # The line of the link in the upper third
+        first = max(target["line"] - height // 3, 1)
+        shown = read_window(path, first, height)
+    except OSError as e:
+        return f"{e}\n"
+
+    if shown is None:
+        return "binary file\n"
+    width = len(f"{first + len(shown) - 1}")
+    return "".join(
+        f"{HIGHLIGHT}{number:>{width}}{RESET} {text}\n" if number == target["line"] else f"{number:>{width}} {text}\n"
+        for number, text in enumerate(shown, first)
+    )
+
+class PreviewServer:
+    """Serve the previews of the links while fzf runs.
+
+    `preview` returns the preview of the link with the given index for the
+    given height.
+    """
+
+    def __init__(self, preview:Callable[[int,int],str], key_path:str):
+        self._preview = preview
+        self._key = secrets.token_hex(16)
+        # The file is in a private directory
+        with open(key_path, "w") as key_file:
+            key_file.write(f"{self._key}\n")
+        self._key_path = key_path
+
+        self._socket = socket.create_server(("127.0.0.1", 0))
+        self.port:int = self._socket.getsockname()[1]
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+
+    def command(self) -> str:
+        """Return the preview command of fzf, for the index in the first field of the choices."""
+        script = (
+            f'read -r key < "$0" && exec 3<>/dev/tcp/127.0.0.1/{self.port} && '
+            'printf "%s %s %s\\n" "$key" "$1" "${FZF_PREVIEW_LINES:-40}" >&3 && '
+            # `read` would read the reply one byte at a time
+            'exec cat <&3'
+        )
+        return f"bash -c {shlex.quote(script)} {shlex.quote(self._key_path)} {{1}}"
+
+    def _serve(self) -> None:
+        while not self._closed.is_set():
+            try:
+                connection, _ = self._socket.accept()
+            except OSError:
+                return
+            with connection:
+                if self._closed.is_set():
+                    return
+                try:
+                    self._reply(connection)
+                except OSError:
+                    # fzf stopped the preview command, e.g., the cursor moved on
+                    pass
+
+    def _reply(self, connection:socket.socket) -> None:
+        connection.settimeout(REQUEST_TIMEOUT)
+        request = b""
+        while not request.endswith(b"\n"):
+            data = connection.recv(256)
+            if not data or len(request) > 256:
+                return
+            request += data
+
+        fields = request.decode(errors="replace").split()
+        if len(fields) != 3 or not secrets.compare_digest(fields[0].encode(), self._key.encode()):
+            return
+        try:
+            idx, height = int(fields[1]), int(fields[2])
+        except ValueError:
+            return
+
+        try:
+            text = self._preview(idx, height)
+        except Exception as e:
+            configs.logger.debug(f"the preview of link {idx} failed: {e}")
+            text = ""
+        connection.sendall(text.encode("utf-8", errors="replace"))
+
+    def close(self) -> None:
+        self._closed.set()
+        # Closing the socket does not wake up `accept` on every platform
+        try:
+            socket.create_connection(("127.0.0.1", self.port), timeout=REQUEST_TIMEOUT).close()
+        except OSError:
+            pass
+        # Do not wait for a preview command that does not send its request
+        self._thread.join(REQUEST_TIMEOUT)
+        self._socket.close()
+
+__all__ = ["PreviewServer", "render_preview"]
@@ -0,0 +1,82 @@
+#===============================================================================
+#   Author: (c) 2024 Andrea Alberti
+#===============================================================================
+
+# Cache of the links offered in fzf, used by the resident server (see
+# `server.py`). When the key is pressed again shortly after the popup was
+# closed, e.g., to open another link, the pane usually has not changed: its
+# size, its cursor, the size of its history, its scroll position, and its
+# current path are the same. The links offered the last time are then
+# offered again without capturing the pane, scanning it, or calling the
+# pre_handlers (see `@fzf-links-result-cache-ttl`).
+#
+# A full-screen application may change the content of a pane without moving
+# the cursor, and files may be created or deleted; the results are therefore
+# only kept for a short time. They are kept in the memory of the server
+# rather than on disk, so that the content of the panes is never written to
+# disk and the matches passed to the post_handlers are kept as they are.
+
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, TypedDict
+
+from .pane_context import PaneContext
+
+# Number of results kept, e.g., for as many panes
+MAX_CACHED_RESULTS = 8
+
+class CachedResult(TypedDict):
+    items: list[Any] # items offered in fzf (see `Item` in `candidate_store.py`)
+    choices: list[str] # items formatted as fzf choices
+    expires: float # monotonic time
+
+_enabled:bool = False
+_results:OrderedDict[Hashable,CachedResult] = OrderedDict()
+
+def enable_result_cache(state:bool = True) -> None:
+    """Enable the cache; it only pays off in a process serving several invocations."""
+    global _enabled
+    _enabled = state
+    if not state:
+        _results.clear()
+
+def result_cache_enabled() -> bool:
+    return _enabled
+
+def result_key(pane_contexts:list[PaneContext], *fingerprint:Hashable) -> Hashable:
+    """Return the key of the results for the state of the panes and a fingerprint of the schemes and options."""
+    return (
+        tuple(
+            (context["pane_id"], context["pane_height"], context["pane_width"], context["scroll_position"],
+             context["history_size"], context["cursor_y"], context["current_path"],)
+            for context in pane_contexts
+        ),
+        *fingerprint,
+    )
+
+def get_result(key:Hashable) -> CachedResult|None:
+    """Return the results stored with the key, unless they expired."""
+    now = time.monotonic()
+    # Drop the expired results, which are never used again
+    for expired in [cached_key for cached_key, cached in _results.items() if cached["expires"] <= now]:
+        del _results[expired]
+
+    result = _results.get(key)
+    if result is not None:
+        _results.move_to_end(key)
+    return result
+
+def store_result(key:Hashable, items:list[Any], choices:list[str], ttl:float) -> None:
+    """Keep the results for `ttl` seconds."""
+    if not _enabled or ttl <= 0:
+        return
+    _results[key] = {
+        "items": items,
+        "choices": choices,
+        "expires": time.monotonic() + ttl,
+    }
+    _results.move_to_end(key)
+    while len(_results) > MAX_CACHED_RESULTS:
+        _results.popitem(last=False)
+
+__all__ = ["CachedResult", "enable_result_cache", "get_result", "result_cache_enabled", "result_key", "store_result"]
@@ -0,0 +1,219 @@
+#===============================================================================
+#   Author: (c) 2024 Andrea Alberti
+#===============================================================================
+
+# Per-line cache of the scan results, used by the resident server (see
+# `server.py`). When the key is pressed several times on the same pane, the
+# capture mostly consists of the same lines. For the lanes whose matches in a
+# line only depend on that line (see `line_context` in `prefilter.py`), the
+# candidates of each line, i.e., the offsets of the matches and the results
+# of the pre_handlers, are cached by the text of the line. Only the ranges of
+# lines missing from the cache are scanned; the matches of the cached lines
+# are rebuilt by matching the regex at the cached offset, which is cheap and
+# does not keep previous captures alive. The other lanes are always scanned.
+#
+# The pre_handlers depend on the current path of the pane (e.g., to check
+# whether a file exists) and on the colors; the cache of a pane is dropped
+# when the current path, its modification time, the schemes, the cached
+# lanes, or the colors change. The cache also keeps the directories in which
+# the pre_handlers looked up paths (see `stat_cache.py`), e.g., those of
+# relative paths in subdirectories and of absolute paths, and is dropped
+# when one of them is modified, i.e., when a file is created or deleted in
+# it. Only the paths looked up through `heuristic_find_file` and the other
+# functions of `stat_cache.py` are tracked.
+
+import os
+from bisect import bisect_right
+from collections import OrderedDict
+from typing import Any, Match
+
+from .colors import colors
+from .opener import PreHandledMatch
+from .scanner import Scanner
+from .scan_guard import guarded_scan_ranges, skipped_schemes
+from .stat_cache import directory_state, looked_up_directories, track_directories
+
+# Number of panes whose lines are cached
+MAX_CACHED_PANES = 8
+
+# Number of lines cached per pane, at least, and relative to the number of
+# lines of the last capture; the cache must hold a whole capture, otherwise
+# evicting the least recently used lines would evict every line before
+# it is looked up again
+MIN_CACHED_LINES = 10000
+CACHED_LINES_FACTOR = 2
+
+# Number of directories tracked per pane; when there are more, the lines are
+# scanned again, so that only the directories of the last scan are tracked
+MAX_TRACKED_DIRECTORIES = 20000
+
+# Key of a line: the text inspected by lookbehinds before the line, the line
+# with its newline, and whether it is the first line
+LineKey = tuple[str,str,bool]
+
+# Candidate of a line: lane, start and end of the match relative to the
+# start of the line, and result of the pre_handler
+LineCandidate = tuple[int,int,int,PreHandledMatch]
+
+class PaneScanCache:
+    def __init__(self, state:tuple[Any,...]):
+        self.state = state
+        self.lines:OrderedDict[LineKey,tuple[LineCandidate,...]] = OrderedDict()
+        # Modification time of the directories looked up by the pre_handlers
+        self.directories:dict[str,int|None] = {}
+
+_enabled:bool = False
+_panes:OrderedDict[str,PaneScanCache] = OrderedDict()
+
+def enable_scan_cache(state:bool = True) -> None:
+    """Enable the cache; it only pays off in a process serving several invocations."""
+    global _enabled
+    _enabled = state
+    track_directories(state)
+    if not state:
+        _panes.clear()
+
+def get_pane_cache(pane_id:str, current_path:str, scanner:Scanner, cached_lanes:set[int]) -> PaneScanCache:
+    try:
+        path_mtime_ns:int|None = os.stat(current_path).st_mtime_ns
+    except OSError:
+        path_mtime_ns = None
+    # The lines only hold the candidates of the lanes cached when they were scanned
+    state = (current_path, path_mtime_ns, scanner, frozenset(cached_lanes), *colors.state(),)
+
+    cache = _panes.get(pane_id)
+    if cache is None or cache.state != state or any(directory_state(directory) != mtime_ns for directory, mtime_ns in cache.directories.items()):
+        cache = PaneScanCache(state)
+        _panes[pane_id] = cache
+    _panes.move_to_end(pane_id)
+    while len(_panes) > MAX_CACHED_PANES:
+        _panes.popitem(last=False)
+    return cache
+
+def scan_lane_candidates(scanner:Scanner, content:str, pane_id:str, current_path:str, processes:int = 0, pos:int = 0, endpos:int|None = None, lanes:set[int]|None = None) -> list[list[tuple[int,Match[str],PreHandledMatch]]]:
+    """Return, for each lane, `(start, match, pre_handled_match)` for the matches accepted by the pre_handlers.
+
+    The matches of each lane are in the order of the content. The range
+    `[pos, endpos)` must start and end at line boundaries; unless it covers
+    the whole content, the lanes without a line context only find the
+    matches that do not depend on the text outside the range.
+    """
+    if endpos is None:
+        endpos = len(content)
+    if lanes is None:
+        lanes = set(range(len(scanner.lane_owners)))
+    cached_lanes = {idx for idx in lanes if scanner.line_contexts[idx] is not None}
+
+    if not _enabled or not cached_lanes:
+        return guarded_scan_ranges(scanner, content, [(pos, endpos,)], lanes, processes)
+
+    candidates = guarded_scan_ranges(scanner, content, [(pos, endpos,)], lanes - cached_lanes)
+    scan_cached_lanes(scanner, content, get_pane_cache(pane_id, current_path, scanner, cached_lanes), cached_lanes, candidates, processes, pos, endpos)
+    for idx in cached_lanes:
+        candidates[idx].sort(key=lambda candidate: candidate[0])
+    return candidates
+
+def scan_candidates(scanner:Scanner, content:str, pane_id:str, current_path:str, processes:int = 0) -> list[tuple[int,Match[str],PreHandledMatch]]:
+    """Return `(scheme_index, match, pre_handled_match)` for the matches accepted by the pre_handlers.
+
+    The candidates are in the same order as the matches of `Scanner.scan`.
+    With more than one process, long captures are scanned in parallel.
+    """
+    lane_owners = scanner.lane_owners
+    return [
+        (lane_owners[idx][0], match, pre_handled_match,)
+        for idx, candidates in enumerate(scan_lane_candidates(scanner, content, pane_id, current_path, processes))
+        for _, match, pre_handled_match in candidates
+    ]
+
+def scan_cached_lanes(scanner:Scanner, content:str, cache:PaneScanCache, cached_lanes:set[int], lanes:list[list[tuple[int,Match[str],PreHandledMatch]]], processes:int = 0, pos:int = 0, endpos:int|None = None) -> None:
+    """Add the candidates of the cached lanes in a range of lines, scanning only the lines missing from the cache."""
+    lane_owners = scanner.lane_owners
+    reach = max(scanner.line_contexts[idx] or 0 for idx in cached_lanes)
+    if endpos is None:
+        endpos = len(content)
+
+    range_lines = content[pos:endpos].split("\n")
+    if endpos < len(content):
+        # The range ends with a newline, which is not followed by a line of the range
+        range_lines.pop()
+
+    # Start and end of each line, the end including the newline
+    starts:list[int] = []
+    ends:list[int] = []
+    keys:list[LineKey] = []
+    start = pos
+    for line in range_lines:
+        end = min(start + len(line) + 1, endpos)
+        starts.append(start)
+        ends.append(end)
+        keys.append((content[max(start - reach, 0):start] if reach else "", content[start:end], start == 0,))
+        start = end
+
+    lines = cache.lines
+    missing:list[int] = []
+    for line_index, key in enumerate(keys):
+        entry = lines.get(key)
+        if entry is None:
+            missing.append(line_index)
+            continue
+        lines.move_to_end(key)
+
+        line_start = starts[line_index]
+        line_end = ends[line_index]
+        rebuilt:list[tuple[int,Match[str],PreHandledMatch]] = []
+        for idx, match_start, match_end, pre_handled_match in entry:
+            match = lane_owners[idx][1].match(content, line_start + match_start, line_end)
+            if match is None or match.end() != line_start + match_end:
+                # Not expected; scan the line again
+                break
+            rebuilt.append((idx, match, pre_handled_match,))
+        else:
+            for idx, match, pre_handled_match in rebuilt:
+                lanes[idx].append((match.start(), match, pre_handled_match,))
+            continue
+        missing.append(line_index)
+
+    # Scan the runs of consecutive missing lines
+    runs:list[tuple[int,int]] = []
+    run_first = 0
+    while run_first < len(missing):
+        run_last = run_first
+        while run_last + 1 < len(missing) and missing[run_last + 1] == missing[run_last] + 1:
+            run_last += 1
+        runs.append((starts[missing[run_first]], ends[missing[run_last]],))
+        run_first = run_last + 1
+
+    found:dict[int,list[LineCandidate]] = {}
+    for idx, candidates in enumerate(guarded_scan_ranges(scanner, content, runs, cached_lanes, processes)):
+        for match_start, match, pre_handled_match in candidates:
+            lanes[idx].append((match_start, match, pre_handled_match,))
+            line_index = bisect_right(starts, match_start) - 1
+            line_start = starts[line_index]
+            found.setdefault(line_index, []).append((idx, match_start - line_start, match.end() - line_start, pre_handled_match,))
+
+    # The candidates of the lines are incomplete if a scheme was skipped
+    skipped = skipped_schemes()
+    if skipped and any(lane_owners[idx][0] in skipped for idx in cached_lanes):
+        return
+
+    # The lines are valid as long as the directories looked up are not
+    # modified; a directory modified since its first lookup invalidates them
+    # at the next invocation
+    directories = cache.directories
+    for directory, mtime_ns in looked_up_directories().items():
+        directories.setdefault(directory, mtime_ns)
+    if len(directories) > MAX_TRACKED_DIRECTORIES:
+        lines.clear()
+        directories.clear()
+        return
+
+    for line_index in missing:
+        lines[keys[line_index]] = tuple(found.get(line_index, ()))
+
+    # A range is usually part of a capture that is scanned in pieces
+    capacity = max(MIN_CACHED_LINES, CACHED_LINES_FACTOR * (len(keys) if pos == 0 and endpos == len(content) else content.count("\n") + 1))
+    while len(lines) > capacity:
+        lines.popitem(last=False)
+
+__all__ = ["enable_scan_cache", "scan_lane_candidates", "scan_candidates"]
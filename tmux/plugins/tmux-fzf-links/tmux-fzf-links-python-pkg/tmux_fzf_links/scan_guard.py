@@ -0,0 +1,248 @@
+#===============================================================================
+#   Author: (c) 2024 Andrea Alberti
+#===============================================================================
+
+# Time budgets of the scan (see `@fzf-links-scan-timeout` and
+# `@fzf-links-scheme-timeout`). A regex may backtrack for minutes on a long
+# line, and a pre_handler may block, e.g., on an unreachable network file
+# system; neither can be interrupted from the plugin process. With a budget,
+# the schemes are scanned one after the other by a forked worker, which
+# sends the results of each scheme as soon as they are ready. A worker that
+# exceeds the budget of a scheme is killed, the scheme is skipped, and a new
+# worker continues with the next schemes; when the total budget is exceeded,
+# the remaining schemes are skipped. The links found by the other schemes
+# are shown, and a single warning names the skipped schemes.
+#
+# Without a budget, the scan runs in the plugin process (see `scan_pool.py`).
+# With a budget, `@fzf-links-scan-processes` is not used, and the schemes no
+# longer share the walk of the scanner. The modules used to talk to the
+# worker are only imported with a budget.
+
+import logging
+import os
+import time
+from bisect import bisect_right
+from typing import Iterator, Match
+
+from .opener import PreHandledMatch
+from .scanner import Scanner
+from .scan_pool import scan_ranges, scan_task
+from .scheme_costs import SchemeCost, add_scheme_costs, take_scheme_costs
+from .stat_cache import add_looked_up_directories, looked_up_directories
+
+# Results of a scheme sent by the worker: the lane, the start and end of
+# each match, and the pre_handled match (None if the pre_handlers are not
+# called)
+SchemeResult = list[tuple[int,int,int,PreHandledMatch|None]]
+
+# Header of the messages of the worker: length of the pickled message
+HEADER_FORMAT = "!Q"
+HEADER_SIZE = 8
+
+_scheme_budget:float = 0 # seconds; 0 if disabled
+_deadline:float|None = None # monotonic time at which the total budget is exceeded
+_enabled:bool = False
+# Schemes skipped in this invocation: their tags and the reason
+_skipped:dict[int,tuple[tuple[str,...],str]] = {}
+
+def start_scan_guard(total_budget:float, scheme_budget:float) -> None:
+    """Start the budgets of the scans of an invocation, in seconds; 0 disables a budget."""
+    global _scheme_budget, _deadline, _enabled
+    _enabled = total_budget > 0 or scheme_budget > 0
+    _scheme_budget = scheme_budget
+    _deadline = time.monotonic() + total_budget if total_budget > 0 else None
+    _skipped.clear()
+
+def skip_scheme(scanner:Scanner, scheme_index:int, reason:str) -> None:
+    _skipped[scheme_index] = (tuple(scanner.schemes[scheme_index]["tags"]), reason,)
+
+def skipped_schemes() -> set[int]:
+    """Return the indexes of the schemes skipped in this invocation."""
+    return set(_skipped)
+
+def report_skipped_schemes() -> None:
+    """Warn once about the schemes skipped in this invocation."""
+    if _skipped:
+        names = ", ".join(f"[{'/'.join(tags)}] ({reason})" for _, (tags, reason) in sorted(_skipped.items()))
+        logging.getLogger().warning(f"warning: the links of some schemes are missing: {names}")
+
+def _write_message(fd:int, message:object) -> None:
+    import pickle
+    import struct
+
+    data = pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL)
+    data = struct.pack(HEADER_FORMAT, len(data)) + data
+    while data:
+        written = os.write(fd, data)
+        data = data[written:]
+
+def _run_worker(fd:int, scanner:Scanner, content:str, runs:list[tuple[int,int]], schemes:list[tuple[int,set[int]]], pre_handle:bool) -> None:
+    """Scan the lanes of each scheme and send the results; never returns."""
+    try:
+        # The costs accounted by the parent process so far
+        take_scheme_costs()
+        for scheme_index, lanes in schemes:
+            known = len(looked_up_directories())
+            result:SchemeResult = []
+            try:
+                if pre_handle:
+                    memo = {}
+                    for pos, endpos in runs:
+                        result.extend(
+                            (idx, match.start(), match.end(), pre_handled_match,)
+                            for idx, match, pre_handled_match in scan_task(scanner, content, (pos, endpos, lanes,), memo)
+                        )
+                else:
+                    for pos, endpos in runs:
+                        for idx, matches in enumerate(scanner.scan_lanes(content, pos, endpos, lanes)):
+                            result.extend((idx, match.start(), match.end(), None,) for match in matches)
+            except Exception as e:
+                _write_message(fd, (scheme_index, None, f"{e}", [], take_scheme_costs(),))
+                continue
+            # The directories looked up by the pre_handlers (see `stat_cache.py`),
+            # and the costs of the scheme (see `scheme_costs.py`)
+            _write_message(fd, (scheme_index, result, "", list(looked_up_directories().items())[known:], take_scheme_costs(),))
+    finally:
+        os._exit(0)
+
+class _Worker:
+    """Forked process scanning the given schemes in order."""
+
+    def __init__(self, scanner:Scanner, content:str, runs:list[tuple[int,int]], schemes:list[tuple[int,set[int]]], pre_handle:bool):
+        read_fd, write_fd = os.pipe()
+        self.pid = os.fork()
+        if self.pid == 0:
+            os.close(read_fd)
+            _run_worker(write_fd, scanner, content, runs, schemes, pre_handle)
+        os.close(write_fd)
+        self.fd = read_fd
+        self.buffer = b""
+
+    def receive(self, deadline:float|None) -> tuple[int,SchemeResult|None,str,list[tuple[str,int|None]],list[SchemeCost]]|None:
+        """Return the next message, or None if the deadline is reached first."""
+        import pickle
+        import select
+        import struct
+
+        while True:
+            if len(self.buffer) >= HEADER_SIZE:
+                (length,) = struct.unpack_from(HEADER_FORMAT, self.buffer)
+                if len(self.buffer) >= HEADER_SIZE + length:
+                    message = pickle.loads(self.buffer[HEADER_SIZE:HEADER_SIZE + length])
+                    self.buffer = self.buffer[HEADER_SIZE + length:]
+                    return message
+
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+            if not select.select([self.fd], [], [], timeout)[0]:
+                return None
+            data = os.read(self.fd, 1 << 20)
+            if not data:
+                raise EOFError()
+            self.buffer += data
+
+    def close(self) -> None:
+        import signal
+
+        os.close(self.fd)
+        try:
+            os.kill(self.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        os.waitpid(self.pid, 0)
+
+def _guarded_results(scanner:Scanner, content:str, runs:list[tuple[int,int]], lanes:set[int], pre_handle:bool) -> Iterator[tuple[int,SchemeResult]]:
+    """Yield the results of each scheme that completes within the budgets."""
+    # Lanes of each scheme, in the order of the schemes
+    pending:list[tuple[int,set[int]]] = []
+    for idx in sorted(lanes):
+        scheme_index = scanner.lane_owners[idx][0]
+        if scheme_index in _skipped:
+            continue
+        if pending and pending[-1][0] == scheme_index:
+            pending[-1][1].add(idx)
+        else:
+            pending.append((scheme_index, {idx},))
+
+    while pending:
+        if _deadline is not None and time.monotonic() >= _deadline:
+            for scheme_index, _ in pending:
+                skip_scheme(scanner, scheme_index, "total scan budget exceeded")
+            return
+
+        worker = _Worker(scanner, content, runs, pending, pre_handle)
+        try:
+            while pending:
+                scheme_index, _ = pending.pop(0)
+                deadline = _deadline
+                if _scheme_budget > 0:
+                    scheme_deadline = time.monotonic() + _scheme_budget
+                    deadline = scheme_deadline if deadline is None else min(deadline, scheme_deadline)
+
+                try:
+                    message = worker.receive(deadline)
+                except EOFError:
+                    # e.g., killed by the system for lack of memory
+                    skip_scheme(scanner, scheme_index, "the scan worker exited")
+                    break
+                if message is None:
+                    # The worker is killed; a new one continues with the next schemes
+                    if _deadline is not None and time.monotonic() >= _deadline:
+                        skip_scheme(scanner, scheme_index, "total scan budget exceeded")
+                    else:
+                        skip_scheme(scanner, scheme_index, "timed out")
+                    break
+
+                _, result, error, directories, costs = message
+                add_looked_up_directories(directories)
+                add_scheme_costs(costs)
+                if result is None:
+                    skip_scheme(scanner, scheme_index, f"failed: {error}")
+                    continue
+                yield (scheme_index, result,)
+        finally:
+            worker.close()
+
+def _rebuild_matches(scanner:Scanner, content:str, runs:list[tuple[int,int]], scheme_index:int, result:SchemeResult) -> list[tuple[int,Match[str],PreHandledMatch|None]]|None:
+    """Return the lane, the match and the pre_handled match of each result of a scheme, or None if a match cannot be rebuilt."""
+    run_starts = [pos for pos, _ in runs]
+    rebuilt:list[tuple[int,Match[str],PreHandledMatch|None]] = []
+    for idx, start, end, pre_handled_match in result:
+        # Matching the regex where `finditer` found the match, within the same
+        # run, yields the same match
+        endpos = runs[bisect_right(run_starts, start) - 1][1]
+        match = scanner.lane_owners[idx][1].match(content, start, endpos)
+        if match is None or match.end() != end:
+            # Not expected; the scheme is skipped rather than showing wrong links
+            skip_scheme(scanner, scheme_index, "its matches could not be rebuilt")
+            return None
+        rebuilt.append((idx, match, pre_handled_match,))
+    return rebuilt
+
+def guarded_scan_ranges(scanner:Scanner, content:str, runs:list[tuple[int,int]], lanes:set[int], processes:int = 0) -> list[list[tuple[int,Match[str],PreHandledMatch]]]:
+    """Same as `scan_ranges`, within the time budgets of the invocation.
+
+    The lanes of the schemes that are skipped have no candidates.
+    """
+    if not _enabled:
+        return scan_ranges(scanner, content, runs, lanes, processes)
+
+    candidates:list[list[tuple[int,Match[str],PreHandledMatch]]] = [[] for _ in scanner.lane_owners]
+    for scheme_index, result in _guarded_results(scanner, content, runs, lanes, True):
+        for idx, match, pre_handled_match in _rebuild_matches(scanner, content, runs, scheme_index, result) or []:
+            if pre_handled_match:
+                candidates[idx].append((match.start(), match, pre_handled_match,))
+    return candidates
+
+def guarded_scan_lanes(scanner:Scanner, content:str, lanes:set[int]) -> list[list[Match[str]]]:
+    """Same as `Scanner.scan_lanes` over the whole content, within the time budgets of the invocation."""
+    if not _enabled:
+        return scanner.scan_lanes(content, lanes=lanes)
+
+    matches:list[list[Match[str]]] = [[] for _ in scanner.lane_owners]
+    runs = [(0, len(content),)]
+    for scheme_index, result in _guarded_results(scanner, content, runs, lanes, False):
+        for idx, match, _ in _rebuild_matches(scanner, content, runs, scheme_index, result) or []:
+            matches[idx].append(match)
+    return matches
+
+__all__ = ["guarded_scan_lanes", "guarded_scan_ranges", "report_skipped_schemes", "skipped_schemes", "start_scan_guard"]
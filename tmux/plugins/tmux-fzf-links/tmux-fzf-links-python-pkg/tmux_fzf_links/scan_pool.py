@@ -0,0 +1,187 @@
+#===============================================================================
+#   Author: (c) 2024 Andrea Alberti
+#===============================================================================
+
+# Scan ranges of the content and apply the pre_handlers, optionally in a pool
+# of processes for very long captures (see `@fzf-links-scan-processes`).
+#
+# The lanes whose matches in a line only depend on that line (see
+# `line_context` in `prefilter.py`) are split into chunks of whole lines;
+# their matches in each chunk are exactly those in the whole content. The
+# other lanes are scanned over the whole content by a task of their own.
+# The workers are forked for each invocation: they inherit the scanner, the
+# content, the current directory and the colors, so that only the ranges
+# are sent to them. They return the offsets of the matches accepted by the
+# pre_handlers together with their result, and the matches are rebuilt by
+# matching the regexes at those offsets. They also return the directories
+# looked up by the pre_handlers (see `stat_cache.py`).
+
+from time import perf_counter
+from typing import Iterator, Match
+
+from .opener import PreHandledMatch, SchemeEntry
+from .scanner import Scanner
+from .scheme_costs import cost_accounting_enabled, scheme_cost
+from .stat_cache import add_looked_up_directories, looked_up_directories
+
+# Captures with fewer lines are scanned in the current process, which is
+# cheaper than starting the workers
+PARALLEL_MIN_LINES = 20000
+
+# Number of chunks per worker, so that the load is balanced among workers
+# even when the matches are not evenly distributed
+CHUNKS_PER_PROCESS = 4
+
+# Chunks are never smaller than this number of characters
+MIN_CHUNK_CHARS = 64 * 1024
+
+# A task is a range of the content and the lanes to scan in it; its result
+# lists the lane, the start and end of each match, and the pre_handled match
+ScanTask = tuple[int,int,set[int]]
+TaskResult = list[tuple[int,int,int,PreHandledMatch]]
+
+# Directories looked up by a worker, with their modification time
+LookedUpDirectories = list[tuple[str,int|None]]
+
+# Results of the pre_handlers by lane and matched text
+PreHandlerMemo = dict[tuple[int,str],PreHandledMatch|None]
+
+# State inherited by the forked workers
+_worker_scanner:Scanner|None = None
+_worker_content:str = ""
+
+def pre_handle(scheme:SchemeEntry, match:Match[str]) -> PreHandledMatch|None:
+    """Extract and process the matching string."""
+    if scheme["pre_handler"]:
+        if cost_accounting_enabled():
+            cost = scheme_cost(scheme)
+            start = perf_counter()
+            pre_handled_match = scheme["pre_handler"](match)
+            cost["pre_handler_seconds"] += perf_counter() - start
+            cost["pre_handler_calls"] += 1
+            return pre_handled_match
+        return scheme["pre_handler"](match)
+    # fallback case when no pre_handler is provided for the scheme
+    return {
+        "display_text": match.group(0),
+        "tag": scheme["tags"][0]
+    }
+
+def scan_task(scanner:Scanner, content:str, task:ScanTask, memo:PreHandlerMemo|None = None) -> Iterator[tuple[int,Match[str],PreHandledMatch]]:
+    """Yield `(lane, match, pre_handled_match)` for the matches of a task accepted by the pre_handlers.
+
+    The pre_handler of a lane is called once per distinct matched text; the
+    other occurrences of the text share its result, which is kept in `memo`.
+    """
+    if memo is None:
+        memo = {}
+    pos, endpos, lanes = task
+    for idx, matches in enumerate(scanner.scan_lanes(content, pos, endpos, lanes)):
+        if not matches:
+            continue
+        scheme = scanner.schemes[scanner.lane_owners[idx][0]]
+        for match in matches:
+            key = (idx, match.group(0),)
+            try:
+                pre_handled_match = memo[key]
+            except KeyError:
+                pre_handled_match = pre_handle(scheme, match)
+                memo[key] = pre_handled_match
+            if pre_handled_match:
+                yield (idx, match, pre_handled_match,)
+
+def _run_worker_task(task:ScanTask) -> tuple[TaskResult,LookedUpDirectories]:
+    assert _worker_scanner is not None
+    known = len(looked_up_directories())
+    # Match objects cannot be sent back to the parent process
+    result:TaskResult = [
+        (idx, match.start(), match.end(), pre_handled_match,)
+        for idx, match, pre_handled_match in scan_task(_worker_scanner, _worker_content, task)
+    ]
+    return (result, list(looked_up_directories().items())[known:],)
+
+def split_runs(content:str, runs:list[tuple[int,int]], processes:int) -> list[tuple[int,int]]:
+    """Split line-aligned runs into line-aligned chunks."""
+    total_chars = sum(endpos - pos for pos, endpos in runs)
+    chunk_chars = max(MIN_CHUNK_CHARS, total_chars // (processes * CHUNKS_PER_PROCESS))
+    chunks:list[tuple[int,int]] = []
+    for pos, endpos in runs:
+        while pos < endpos:
+            chunk_end = content.find("\n", min(pos + chunk_chars, endpos), endpos)
+            chunk_end = endpos if chunk_end < 0 else chunk_end + 1
+            chunks.append((pos, chunk_end,))
+            pos = chunk_end
+    return chunks
+
+def run_tasks(scanner:Scanner, content:str, tasks:list[ScanTask], processes:int) -> list[TaskResult]:
+    global _worker_scanner, _worker_content
+
+    import multiprocessing
+    context = multiprocessing.get_context("fork")
+
+    _worker_scanner = scanner
+    _worker_content = content
+    try:
+        with context.Pool(min(processes, len(tasks))) as pool:
+            outputs = pool.map(_run_worker_task, tasks, chunksize=1)
+        results:list[TaskResult] = []
+        for result, directories in outputs:
+            add_looked_up_directories(directories)
+            results.append(result)
+        return results
+    finally:
+        _worker_scanner = None
+        _worker_content = ""
+
+def scan_ranges(scanner:Scanner, content:str, runs:list[tuple[int,int]], lanes:set[int], processes:int = 0) -> list[list[tuple[int,Match[str],PreHandledMatch]]]:
+    """Return, for each lane, `(start, match, pre_handled_match)` for the matches accepted by the pre_handlers.
+
+    The runs must start and end at line boundaries. Lanes without a line
+    context must only be requested for a single run covering the content.
+    With more than one process and long enough runs, the scan is spread
+    over a pool of processes.
+    """
+    candidates:list[list[tuple[int,Match[str],PreHandledMatch]]] = [[] for _ in scanner.lane_owners]
+
+    line_lanes = {idx for idx in lanes if scanner.line_contexts[idx] is not None}
+    other_lanes = lanes - line_lanes
+
+    parallel = processes > 1 and sum(content.count("\n", pos, endpos) for pos, endpos in runs) >= PARALLEL_MIN_LINES
+    if parallel:
+        # The tasks of each lane are in the order of the content
+        tasks:list[ScanTask] = []
+        if other_lanes:
+            tasks.extend((pos, endpos, other_lanes,) for pos, endpos in runs)
+        if line_lanes:
+            tasks.extend((pos, endpos, line_lanes,) for pos, endpos in split_runs(content, runs, processes))
+        try:
+            results = run_tasks(scanner, content, tasks, processes)
+        except OSError:
+            # The workers could not be started; e.g., too many processes
+            parallel = False
+
+    if parallel:
+        regexes = [regex for _, regex in scanner.lane_owners]
+        for (_, endpos, _), result in zip(tasks, results):
+            for idx, start, end, pre_handled_match in result:
+                # Matching the regex where `finditer` found the match yields
+                # the same match
+                match = regexes[idx].match(content, start, endpos)
+                if match is None or match.end() != end:
+                    # Not expected; scan again in the current process
+                    parallel = False
+                    break
+                candidates[idx].append((start, match, pre_handled_match,))
+            if not parallel:
+                candidates = [[] for _ in scanner.lane_owners]
+                break
+
+    if not parallel:
+        memo:PreHandlerMemo = {}
+        for pos, endpos in runs:
+            for idx, match, pre_handled_match in scan_task(scanner, content, (pos, endpos, lanes,), memo):
+                candidates[idx].append((match.start(), match, pre_handled_match,))
+
+    return candidates
+
+__all__ = ["pre_handle", "scan_ranges"]
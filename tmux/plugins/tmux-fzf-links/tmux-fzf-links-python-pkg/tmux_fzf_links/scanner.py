@@ -0,0 +1,292 @@
+#===============================================================================
+#   Author: (c) 2024 Andrea Alberti
+#===============================================================================
+
+# Scan the content for the regexes of all schemes in a single walk.
+#
+# Every regex of every scheme is a lane. The result of a lane must be exactly
+# what `regex.finditer(content)` returns, because schemes overlap on purpose
+# (e.g., the file scheme matches a whole line and each word in it). Hence each
+# lane keeps its own frontier, i.e., the position from which `finditer` would
+# resume. The lanes sharing the lowest frontier are searched together with the
+# alternation of their regexes, which finds the next position where any of
+# them matches in one pass; each lane is then matched at that position only.
+# When a single lane is behind all others, it advances with its own `finditer`
+# until it catches up. Lanes matching densely (e.g., any word may be a file
+# name) gain nothing from sharing the walk and simply run to the end.
+#
+# Before the walk, the lanes that can be prefiltered by their literals (see
+# `prefilter.py`) are run on the candidate lines only and leave the walk.
+
+import re
+from time import perf_counter
+from typing import Iterator, Match, Pattern
+try:
+    from re import _parser as sre_parse # Python 3.11 and newer
+except ImportError:
+    import sre_parse
+
+from .opener import SchemeEntry
+from .prefilter import lane_literals, line_context, scan_candidate_lines, select_prefiltered
+from .scheme_costs import cost_accounting_enabled, scheme_cost
+
+# Number of consecutive matches after which a lane running on its own is
+# considered dense and is no longer synchronized with the other lanes
+DENSE_RUN = 16
+
+# The walk pays off when matches are sparse; beyond one step per this many
+# characters, the remaining lanes are scanned on their own
+WALK_STEP_CHARS = 256
+
+# Flags that can be scoped to a lane within the combined pattern
+SCOPED_FLAGS:dict[int,str] = {
+    re.IGNORECASE: "i",
+    re.MULTILINE: "m",
+    re.DOTALL: "s",
+    re.ASCII: "a",
+}
+
+# Constructs that depend on the group numbering or that must appear at the
+# start of the pattern; regexes using them are scanned on their own
+UNSAFE_PATTERN = re.compile(r"\\[1-9]|\(\?P=|\(\?\(|\(\?[aiLmsux]+\)")
+
+def strip_capturing_groups(pattern:str) -> str:
+    """Turn the capturing groups of a pattern into non-capturing groups.
+
+    Group names would clash across lanes; the groups of the original regex
+    are recovered by matching it at the position found.
+    """
+    out:list[str] = []
+    i = 0
+    n = len(pattern)
+    in_class = False
+    while i < n:
+        char = pattern[i]
+        if char == '\\':
+            out.append(pattern[i:i+2])
+            i += 2
+            continue
+        if in_class:
+            if char == ']':
+                in_class = False
+            out.append(char)
+            i += 1
+            continue
+        if char == '[':
+            in_class = True
+            out.append(char)
+            i += 1
+            # A `]` right after `[` or `[^` is a literal
+            if pattern.startswith('^', i):
+                out.append('^')
+                i += 1
+            if pattern.startswith(']', i):
+                out.append(']')
+                i += 1
+            continue
+        if char == '(':
+            if pattern.startswith('(?P<', i):
+                out.append('(?:')
+                i = pattern.index('>', i) + 1
+                continue
+            if not pattern.startswith('(?', i):
+                out.append('(?:')
+                i += 1
+                continue
+        out.append(char)
+        i += 1
+    return "".join(out)
+
+def lane_source(regex:Pattern[str]) -> str|None:
+    """Return the source of the lane for the combined pattern, or None if it must be scanned on its own."""
+    if not isinstance(regex.pattern, str) or UNSAFE_PATTERN.search(regex.pattern):
+        return None
+
+    flags = regex.flags & ~re.UNICODE
+    scoped = ""
+    for flag, letter in SCOPED_FLAGS.items():
+        if flags & flag:
+            scoped += letter
+            flags &= ~flag
+    if flags:
+        # E.g., verbose patterns, whose comments are not parsed here
+        return None
+
+    source = f"(?{scoped}:{strip_capturing_groups(regex.pattern)})"
+
+    try:
+        min_width, _ = sre_parse.parse(source).getwidth()
+    except (re.error, AttributeError):
+        return None
+
+    # A lane matching the empty string would stop the alternation at every
+    # position; besides, `finditer` has special rules for empty matches
+    if min_width == 0:
+        return None
+
+    return source
+
+class Scanner:
+    """Scan the content for all regexes of a list of schemes."""
+
+    def __init__(self, schemes:list[SchemeEntry]):
+        self.schemes = schemes
+        # Lanes in priority order: schemes first, then the regexes of each scheme
+        self.lane_owners:list[tuple[int,Pattern[str]]] = [
+            (scheme_index, regex)
+            for scheme_index, scheme in enumerate(schemes)
+            for regex in scheme["regex"]
+        ]
+        self.sources:list[str|None] = [lane_source(regex) for _, regex in self.lane_owners]
+        # Literals of the lanes that can be prefiltered
+        self.literals:dict[int,tuple[str,...]] = {}
+        for idx, (scheme_index, regex) in enumerate(self.lane_owners):
+            literals = lane_literals(regex, schemes[scheme_index].get("literals"))
+            if literals:
+                self.literals[idx] = literals
+        # Characters before a line inspected by each lane, or None for the
+        # lanes whose matches in a line may depend on other lines
+        self.line_contexts:list[int|None] = [line_context(regex) for _, regex in self.lane_owners]
+        self._combined:dict[tuple[int,...],Pattern[str]] = {}
+
+    def combined_pattern(self, lane_indices:tuple[int,...]) -> Pattern[str]:
+        combined = self._combined.get(lane_indices)
+        if combined is None:
+            combined = re.compile("|".join(self.sources[idx] for idx in lane_indices)) # type: ignore[misc]
+            self._combined[lane_indices] = combined
+        return combined
+
+    def scan_lanes(self, content:str, pos:int = 0, endpos:int|None = None, lanes:set[int]|None = None) -> list[list[Match[str]]]:
+        """Return the matches of each lane, identical to `finditer` over the content.
+
+        With `pos` and `endpos`, only the range `[pos, endpos)` is scanned;
+        the range must start and end at line boundaries, and only the lanes
+        with a line context must be selected with `lanes`. Lanes that are not
+        selected have no matches.
+        """
+        regexes = [regex for _, regex in self.lane_owners]
+        matches:list[list[Match[str]]] = [[] for _ in regexes]
+        if endpos is None:
+            endpos = len(content)
+
+        # Position from which `finditer` would resume for each lane; lanes
+        # that are exhausted, or scanned on their own, are past the end
+        done = endpos + 1
+        frontiers:list[int] = [pos if lanes is None or idx in lanes else done for idx in range(len(regexes))]
+
+        # Time spent by each lane, if the costs of the schemes are accounted;
+        # the time of a step shared by several lanes is split among them
+        lane_seconds:list[float]|None = [0.0] * len(regexes) if cost_accounting_enabled() else None
+        step_lanes:tuple[int,...] = ()
+        step_start = perf_counter() if lane_seconds is not None else 0.0
+
+        lane_literals = {idx: literals for idx, literals in self.literals.items() if frontiers[idx] < done}
+        prefiltered = select_prefiltered(content, lane_literals, pos, endpos)
+        candidate_matches = scan_candidate_lines(content, {idx: (regexes[idx], literals) for idx, literals in prefiltered.items()}, pos, endpos)
+        for idx, lane_matches in candidate_matches.items():
+            matches[idx] = lane_matches
+            frontiers[idx] = done
+        step_lanes = tuple(candidate_matches)
+
+        for idx, source in enumerate(self.sources):
+            if source is None and frontiers[idx] < done:
+                if lane_seconds is not None:
+                    step_start = self._charge(lane_seconds, step_lanes, step_start)
+                    step_lanes = (idx,)
+                matches[idx] = list(regexes[idx].finditer(content, pos, endpos))
+                frontiers[idx] = done
+
+        steps_left = (endpos - pos) // WALK_STEP_CHARS + len(regexes)
+        while True:
+            if lane_seconds is not None:
+                step_start = self._charge(lane_seconds, step_lanes, step_start)
+                step_lanes = ()
+
+            position = min(frontiers, default=done)
+            if position >= done:
+                break
+
+            steps_left -= 1
+            if steps_left < 0:
+                for idx, frontier in enumerate(frontiers):
+                    if frontier < done:
+                        matches[idx].extend(regexes[idx].finditer(content, frontier, endpos))
+                        if lane_seconds is not None:
+                            step_start = self._charge(lane_seconds, (idx,), step_start)
+                break
+
+            behind = tuple(idx for idx, frontier in enumerate(frontiers) if frontier == position)
+            step_lanes = behind
+
+            if len(behind) == 1:
+                # Advance the lane on its own until it reaches the others
+                idx = behind[0]
+                limit = min((frontier for other, frontier in enumerate(frontiers) if other != idx), default=done)
+                frontiers[idx] = done
+                lane_matches = matches[idx]
+                found = regexes[idx].finditer(content, position, endpos)
+                count = 0
+                for match in found:
+                    lane_matches.append(match)
+                    if match.start() >= limit:
+                        frontiers[idx] = match.end()
+                        break
+                    count += 1
+                    if count >= DENSE_RUN:
+                        # Collect the remaining matches without going through Python
+                        lane_matches.extend(found)
+                        break
+                continue
+
+            hit = self.combined_pattern(behind).search(content, position, endpos)
+            if hit is None:
+                for idx in behind:
+                    frontiers[idx] = done
+                continue
+
+            # No lane behind matches before `start`; match each of them there
+            start = hit.start()
+            for idx in behind:
+                match = regexes[idx].match(content, start, endpos)
+                if match is None:
+                    frontiers[idx] = start + 1
+                else:
+                    matches[idx].append(match)
+                    frontiers[idx] = match.end()
+
+        if lane_seconds is not None:
+            for idx, seconds in enumerate(lane_seconds):
+                if seconds or matches[idx]:
+                    cost = scheme_cost(self.schemes[self.lane_owners[idx][0]])
+                    cost["regex_seconds"] += seconds
+                    cost["matches"] += len(matches[idx])
+
+        return matches
+
+    @staticmethod
+    def _charge(lane_seconds:list[float], lanes:tuple[int,...], start:float) -> float:
+        """Split the time elapsed since `start` among the lanes; return the current time."""
+        now = perf_counter()
+        if lanes:
+            share = (now - start) / len(lanes)
+            for idx in lanes:
+                lane_seconds[idx] += share
+        return now
+
+    def scan(self, content:str) -> Iterator[tuple[int,Match[str]]]:
+        """Yield `(scheme_index, match)` in the same order as looping over schemes, regexes, and `finditer`."""
+        for (scheme_index, _), lane_matches in zip(self.lane_owners, self.scan_lanes(content)):
+            for match in lane_matches:
+                yield (scheme_index, match,)
+
+# Scanner of the last schemes, whose combined patterns are compiled on demand
+_scanner:Scanner|None = None
+
+def get_scanner(schemes:list[SchemeEntry]) -> Scanner:
+    """Return the scanner for the schemes, reusing the previous one if the schemes are the same."""
+    global _scanner
+    if _scanner is None or _scanner.schemes is not schemes:
+        _scanner = Scanner(schemes)
+    return _scanner
+
+__all__ = ["Scanner", "get_scanner"]
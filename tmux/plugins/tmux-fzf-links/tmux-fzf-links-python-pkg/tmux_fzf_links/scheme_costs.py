@@ -0,0 +1,108 @@
+#===============================================================================
+#   Author: (c) 2024 Andrea Alberti
+#===============================================================================
+
+# Cost of each scheme in an invocation: time spent by its regexes, number of
+# matches, calls and time of its pre_handler and post_handler. The costs are
+# only accounted when they are reported, i.e., when the log file records
+# DEBUG messages or when `@fzf-links-scheme-time-budget` is set; otherwise
+# the scan does not read the clock.
+#
+# The regexes of several schemes are partly searched together (see
+# `scanner.py`); the time of a search shared by several regexes is split
+# evenly among them, while the time of each regex run on its own is
+# accounted to its scheme. The work done by the processes of
+# `@fzf-links-scan-processes` is not accounted. With a time budget (see
+# `scan_guard.py`), the worker scanning the schemes sends their costs along
+# with their results; the costs of a scheme whose worker is killed are lost.
+
+import logging
+from typing import TypedDict
+
+from .opener import SchemeEntry
+
+class SchemeCost(TypedDict):
+    tags: tuple[str,...]
+    regex_seconds: float
+    matches: int
+    pre_handler_calls: int
+    pre_handler_seconds: float
+    post_handler_calls: int
+    post_handler_seconds: float
+
+_enabled:bool = False
+_costs:dict[tuple[str,...],SchemeCost] = {}
+
+def start_cost_accounting(state:bool) -> None:
+    """Reset the costs, and account them in this invocation if `state` is True."""
+    global _enabled
+    _enabled = state
+    _costs.clear()
+
+def cost_accounting_enabled() -> bool:
+    return _enabled
+
+def _tags_cost(tags:tuple[str,...]) -> SchemeCost:
+    cost = _costs.get(tags)
+    if cost is None:
+        cost = {
+            "tags": tags,
+            "regex_seconds": 0.0,
+            "matches": 0,
+            "pre_handler_calls": 0,
+            "pre_handler_seconds": 0.0,
+            "post_handler_calls": 0,
+            "post_handler_seconds": 0.0,
+        }
+        _costs[tags] = cost
+    return cost
+
+def scheme_cost(scheme:SchemeEntry) -> SchemeCost:
+    """Return the costs of a scheme, identified by its tags."""
+    return _tags_cost(tuple(scheme["tags"]))
+
+def take_scheme_costs() -> list[SchemeCost]:
+    """Return the costs accounted so far and reset them, e.g., in a forked worker."""
+    costs = list(_costs.values())
+    _costs.clear()
+    return costs
+
+def add_scheme_costs(costs:list[SchemeCost]) -> None:
+    """Add the costs accounted by a forked worker."""
+    for cost in costs:
+        total = _tags_cost(cost["tags"])
+        total["regex_seconds"] += cost["regex_seconds"]
+        total["matches"] += cost["matches"]
+        total["pre_handler_calls"] += cost["pre_handler_calls"]
+        total["pre_handler_seconds"] += cost["pre_handler_seconds"]
+        total["post_handler_calls"] += cost["post_handler_calls"]
+        total["post_handler_seconds"] += cost["post_handler_seconds"]
+
+def total_seconds(cost:SchemeCost) -> float:
+    return cost["regex_seconds"] + cost["pre_handler_seconds"] + cost["post_handler_seconds"]
+
+def get_scheme_costs() -> list[SchemeCost]:
+    """Return the costs of the schemes in the last invocation, the most expensive first."""
+    return sorted(_costs.values(), key=total_seconds, reverse=True)
+
+def report_scheme_costs(time_budget:float) -> None:
+    """Log the costs at DEBUG, and warn once about the schemes exceeding the time budget in seconds."""
+    if not _enabled:
+        return
+    logger = logging.getLogger()
+
+    costs = get_scheme_costs()
+    for cost in costs:
+        logger.debug(
+            f"scheme {list(cost['tags'])}: regexes {cost['regex_seconds']*1e3:.1f} ms, {cost['matches']} matches, "
+            f"pre_handler {cost['pre_handler_calls']} calls {cost['pre_handler_seconds']*1e3:.1f} ms, "
+            f"post_handler {cost['post_handler_calls']} calls {cost['post_handler_seconds']*1e3:.1f} ms"
+        )
+
+    if time_budget > 0:
+        slow = [cost for cost in costs if total_seconds(cost) > time_budget]
+        if slow:
+            names = ", ".join(f"[{'/'.join(cost['tags'])}] {total_seconds(cost)*1e3:.0f} ms" for cost in slow)
+            logger.warning(f"warning: schemes over the time budget of {time_budget*1e3:.0f} ms: {names}")
+
+__all__ = ["SchemeCost", "add_scheme_costs", "cost_accounting_enabled", "get_scheme_costs", "report_scheme_costs", "scheme_cost", "start_cost_accounting", "take_scheme_costs"]
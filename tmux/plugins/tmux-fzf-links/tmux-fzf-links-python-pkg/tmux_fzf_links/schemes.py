@@ -5,15 +5,19 @@
 from os.path import expanduser
 from pathlib import Path
 
+from .stat_cache import cached_realpath, cached_stat
+
 def heuristic_find_file(file_path_str:str) -> Path | None:
 
     # Expand tilde (~) to the user's home directory    
     file_path = Path(expanduser(file_path_str))
-    # Check if the file exists either as is or relative to the current directory
-    if file_path.exists():
-        return file_path.resolve()  # Return the absolute resolved path
-    else:
-        # Drop the match if it corresponds to no file
-        return None
+    # Check if the file exists either as is or relative to the current directory;
+    # the metadata is cached for the rest of the invocation
+    if cached_stat(file_path) is not None:
+        resolved_path = cached_realpath(file_path)
+        if resolved_path is not None:
+            return Path(resolved_path)  # Return the absolute resolved path
+    # Drop the match if it corresponds to no file
+    return None
 
 __all__ = ["heuristic_find_file"]
\ No newline at end of file
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+
+#===============================================================================
+#   Author: (c) 2024 Andrea Alberti
+#===============================================================================
+
+# Resident server keeping the package, the user schemes and LS_COLORS warm.
+# The key binding talks to it through `client.py` over a Unix socket.
+
+import os
+import socket
+import sys
+
+from .__main__ import main as run_main, load_schemes
+from .client import FORWARDED_ENV_VARS, recv_message, send_message, stop_server
+from .scan_cache import enable_scan_cache
+from .result_cache import enable_result_cache
+
+# Interval in seconds at which the server checks whether tmux is still alive
+LIVENESS_INTERVAL = 30
+
+# Seconds to wait for a client to send its request
+REQUEST_TIMEOUT = 1
+
+def tmux_alive(tmux_pid:int) -> bool:
+    try:
+        os.kill(tmux_pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def handle_request(request:dict) -> None:
+    # Reproduce the environment of the key binding; variables not forwarded
+    # by the client must not leak from a previous request
+    env = request.get("env", {})
+    for name in FORWARDED_ENV_VARS:
+        if name in env:
+            os.environ[name] = env[name]
+        else:
+            os.environ.pop(name, None)
+
+    # Any tmux command without an explicit target, including those issued
+    # by user post-handlers, applies to the pane where the key was pressed
+    os.environ["TMUX_PANE"] = request["pane_id"]
+
+    run_main(request["args"])
+
+def serve(socket_path:str, tmux_pid:int, user_schemes_path:str = ""):
+    # Replace any server left behind by a previous configuration
+    stop_server(socket_path)
+    try:
+        os.unlink(socket_path)
+    except FileNotFoundError:
+        pass
+
+    # Repeated key presses on a pane only scan the lines that changed, or
+    # nothing at all if the pane did not change
+    enable_scan_cache()
+    enable_result_cache()
+
+    # Warm up the user schemes; errors are reported by the first request
+    try:
+        load_schemes(user_schemes_path)
+    except Exception:
+        pass
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    # Create the socket private to the user, so that no other user can
+    # connect before its permissions are set
+    umask = os.umask(0o077)
+    try:
+        server.bind(socket_path)
+    finally:
+        os.umask(umask)
+    server.listen()
+    server.settimeout(LIVENESS_INTERVAL)
+
+    # When stopped by a newer server, the socket path already belongs to it
+    replaced:bool = False
+
+    try:
+        while True:
+            try:
+                conn, _ = server.accept()
+            except socket.timeout:
+                if not tmux_alive(tmux_pid):
+                    break
+                continue
+
+            # Requests are served one at a time: `run` changes the current
+            # directory and configures process-wide singletons. The client of
+            # a request that is not accepted quickly, e.g., while the popup of
+            # another request is open, runs the plugin itself
+            try:
+                with conn, conn.makefile("rb") as reader:
+                    # A client that never sends its request must not block the others
+                    conn.settimeout(REQUEST_TIMEOUT)
+                    request = recv_message(reader)
+                    command = request.get("command")
+                    if command == "stop":
+                        replaced = True
+                        send_message(conn, {"status": "ok"})
+                    elif command == "run":
+                        # Fails if the client stopped waiting and ran the plugin itself
+                        send_message(conn, {"status": "accepted"})
+                        conn.settimeout(None)
+                        try:
+                            handle_request(request)
+                        except Exception as e:
+                            send_message(conn, {"status": "error", "message": f"{e}"})
+                            continue
+                        send_message(conn, {"status": "ok"})
+                    else:
+                        send_message(conn, {"status": "error", "message": f"unknown command: {command}"})
+            except (OSError, ValueError):
+                # The client went away or sent a malformed request
+                pass
+
+            if replaced:
+                break
+    finally:
+        server.close()
+        if not replaced:
+            try:
+                os.unlink(socket_path)
+            except FileNotFoundError:
+                pass
+
+def main(argv:list[str]):
+    socket_path = argv[0]
+    tmux_pid = int(argv[1])
+    user_schemes_path = argv[2] if len(argv) > 2 else ""
+
+    # Detach from the session of the shell that started the server
+    try:
+        os.setsid()
+    except PermissionError:
+        # Already a process group leader
+        pass
+
+    serve(socket_path, tmux_pid, user_schemes_path)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
+
+__all__ = []
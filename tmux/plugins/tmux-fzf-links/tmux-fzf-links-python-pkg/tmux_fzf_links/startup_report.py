@@ -0,0 +1,83 @@
+#===============================================================================
+#   Author: (c) 2024 Andrea Alberti
+#===============================================================================
+
+# Report the import cost of each module loaded when the plugin starts, as
+# measured by `python -X importtime` in a fresh interpreter
+
+import os
+import subprocess
+import sys
+import time
+from typing import TypedDict
+
+# Modules imported by a regular invocation, including those imported lazily
+RUN_MODULES = (
+    "tmux_fzf_links.__main__",
+    "tmux_fzf_links.default_schemes",
+    "tmux_fzf_links.fzf_handler",
+    "subprocess",
+)
+
+class ImportTime(TypedDict):
+    module: str
+    self_us: int # time spent importing the module itself in microseconds
+    cumulative_us: int # time including the imports of its dependencies
+    depth: int # nesting level of the import
+
+def measure_import_times(bundle_path:str|None = None) -> tuple[list[ImportTime],float]:
+    """Import the modules of a regular invocation in a new interpreter.
+
+    If `bundle_path` is provided, the interpreter runs in the same mode used
+    for the bundle (`-S -I`). Return the import times and the total wall time
+    in seconds of the interpreter, including its start-up and teardown.
+    """
+    code = "; ".join(f"import {module}" for module in RUN_MODULES)
+    env = dict(os.environ)
+    if bundle_path:
+        cmd = [sys.executable, "-S", "-I", "-X", "importtime", "-c", f"import sys; sys.path.insert(0, {bundle_path!r}); {code}"]
+    else:
+        package_parent = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        env["PYTHONPATH"] = os.pathsep.join(filter(None, [package_parent, env.get("PYTHONPATH", "")]))
+        cmd = [sys.executable, "-X", "importtime", "-c", code]
+
+    start = time.perf_counter()
+    result = subprocess.run(cmd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, check=True)
+    wall_time = time.perf_counter() - start
+
+    # Lines have the format: "import time: <self us> | <cumulative us> | <indented module name>"
+    import_times:list[ImportTime] = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_str, cumulative_str, name = line[len("import time:"):].split("|")
+        module = name.strip()
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        import_times.append({"module": module, "self_us": int(self_str), "cumulative_us": int(cumulative_str), "depth": depth})
+
+    return (import_times, wall_time,)
+
+def format_startup_report(import_times:list[ImportTime], wall_time:float, limit:int = 25) -> str:
+    own_modules = [item for item in import_times if item["module"].split(".")[0] == "tmux_fzf_links"]
+    top_level = [item for item in import_times if item["depth"] == 0]
+
+    lines:list[str] = []
+    lines.append(f"interpreter wall time:      {wall_time*1e3:8.1f} ms")
+    lines.append(f"imports (top level):        {sum(item['cumulative_us'] for item in top_level)/1e3:8.1f} ms")
+    lines.append(f"tmux_fzf_links (self time): {sum(item['self_us'] for item in own_modules)/1e3:8.1f} ms")
+    lines.append("")
+    lines.append(f"{'self [ms]':>10} {'cumul. [ms]':>12}  module")
+    for item in sorted(own_modules, key=lambda item: item["cumulative_us"], reverse=True):
+        lines.append(f"{item['self_us']/1e3:10.2f} {item['cumulative_us']/1e3:12.2f}  {item['module']}")
+    lines.append("")
+    lines.append(f"{limit} most expensive modules by self time:")
+    for item in sorted(import_times, key=lambda item: item["self_us"], reverse=True)[:limit]:
+        lines.append(f"{item['self_us']/1e3:10.2f} {item['cumulative_us']/1e3:12.2f}  {item['module']}")
+
+    return "\n".join(lines)
+
+def print_startup_report(bundle_path:str|None = None):
+    import_times, wall_time = measure_import_times(bundle_path)
+    print(format_startup_report(import_times, wall_time))
+
+__all__ = ["print_startup_report"]
@@ -0,0 +1,290 @@
+#===============================================================================
+#   Author: (c) 2024 Andrea Alberti
+#===============================================================================
+
+# Per-run cache of file metadata. The file scheme checks hundreds of candidate
+# paths, and each of them used to be examined by several calls of the `stat`
+# family: to check that it exists, to resolve it, to pick its tag and its
+# color, and once more after the selection. Here, each distinct path is
+# examined by a single `lstat` (followed by a `stat` for symbolic links only),
+# and the resolution of paths reuses the metadata of their components, which
+# are mostly shared among the candidates. The cache is cleared at the start
+# of every invocation, as files may change between two key presses.
+#
+# Most candidates of the file scheme are words that are not files. Once a
+# directory has been looked up a few times, it is listed with `os.scandir`;
+# the names missing from the listing are then known not to exist without a
+# system call, and the type reported by the listing (`d_type`) tells which
+# entries are symbolic links while resolving paths. Listings are only used
+# for names that a case-insensitive or normalizing file system could not
+# match differently (see `list_directory`).
+#
+# Relative paths are resolved against the directory set with
+# `set_current_directory`, by default the current directory of the process,
+# so that the candidates of several panes are each resolved against the
+# current path of their pane (see `@fzf-links-panes`). The metadata is
+# cached by absolute path and is shared among the panes.
+#
+# The resident server keeps the results of the pre_handlers across key
+# presses (see `scan_cache.py`). It then tracks the directories containing
+# the paths looked up, with their modification time when first looked up:
+# creating or deleting a file changes the modification time of its
+# directory, and removing or renaming any parent of the directory makes it
+# disappear. The parents themselves are not tracked, so that a busy
+# directory such as `/tmp` does not invalidate the paths below it.
+
+import os
+import stat
+
+# Maximum number of symbolic links followed while resolving a path
+MAX_SYMLINKS = 40
+
+# A directory is listed when this many paths in it have been looked up
+LISTING_MIN_LOOKUPS = 3
+
+# Directories with more entries are not kept in memory
+MAX_LISTING_ENTRIES = 20000
+
+# Listing of a directory: whether each entry is a symbolic link. A directory
+# that does not exist (or is not a directory) has an empty listing
+Listing = dict[str,bool]
+
+_lstat_cache:dict[str,os.stat_result|None] = {}
+_stat_cache:dict[str,os.stat_result|None] = {}
+_readlink_cache:dict[str,str|None] = {}
+_realpath_cache:dict[str,str|None] = {}
+_listing_cache:dict[str,Listing|None] = {}
+_lookups:dict[str,int] = {}
+_cwd:str|None = None
+
+# Modification time of the directories in which paths were looked up, None
+# if they do not exist
+_directories:dict[str,int|None] = {}
+_track_directories:bool = False
+
+def clear_stat_cache() -> None:
+    """Forget the metadata collected so far; called at the start of every invocation."""
+    global _cwd
+    _lstat_cache.clear()
+    _stat_cache.clear()
+    _readlink_cache.clear()
+    _realpath_cache.clear()
+    _listing_cache.clear()
+    _lookups.clear()
+    _directories.clear()
+    _cwd = None
+
+def track_directories(state:bool = True) -> None:
+    """Record the directories in which paths are looked up (see `looked_up_directories`)."""
+    global _track_directories
+    _track_directories = state
+    _directories.clear()
+
+def looked_up_directories() -> dict[str,int|None]:
+    """Return the directories in which paths were looked up in this invocation, with their modification time at that moment."""
+    return _directories
+
+def add_looked_up_directories(directories:list[tuple[str,int|None]]) -> None:
+    """Add the directories looked up by a forked worker."""
+    for directory, mtime_ns in directories:
+        _directories.setdefault(directory, mtime_ns)
+
+def directory_state(directory:str) -> int|None:
+    """Return the modification time of a directory, or None if it does not exist."""
+    try:
+        return os.stat(directory).st_mtime_ns
+    except (OSError, ValueError):
+        return None
+
+def _note_directory(directory:str) -> None:
+    if directory not in _directories:
+        _directories[directory] = directory_state(directory)
+
+def set_current_directory(path:str|None) -> None:
+    """Resolve relative paths against `path`, or against the current directory of the process if None."""
+    global _cwd
+    _cwd = path
+
+def absolute_path(path:str|os.PathLike[str]) -> str:
+    """Return the path joined to the directory against which relative paths are resolved."""
+    global _cwd
+    key = os.fspath(path)
+    if key.startswith("/"):
+        return key
+    if _cwd is None:
+        _cwd = os.getcwd()
+    return os.path.join(_cwd, key)
+
+def list_directory(directory:str) -> Listing|None:
+    """List a directory, or return None if its listing cannot be used.
+
+    The listing cannot be used if the directory cannot be read, if it is too
+    large, or if the file system ignores the case of names.
+    """
+    listing:Listing = {}
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if len(listing) >= MAX_LISTING_ENTRIES:
+                    return None
+                # Answered from `d_type` on most file systems
+                listing[entry.name] = entry.is_symlink()
+    except (FileNotFoundError, NotADirectoryError):
+        return {}
+    except (OSError, ValueError):
+        return None
+
+    # A name with its case swapped is found on case-insensitive file systems
+    for name in listing:
+        swapped = name.swapcase()
+        if swapped != name and swapped not in listing:
+            try:
+                os.lstat(os.path.join(directory, swapped))
+                return None
+            except OSError:
+                pass
+            break
+
+    return listing
+
+def _listing_of(path:str) -> tuple[Listing,str]|None:
+    """Return the listing of the directory containing a path and the name of the path in it."""
+    directory, name = os.path.split(path)
+    # Non-ASCII names may be normalized by the file system (e.g., on macOS)
+    if not name or name == "." or name == ".." or not name.isascii():
+        return None
+    directory = directory or "."
+
+    try:
+        listing = _listing_cache[directory]
+    except KeyError:
+        lookups = _lookups.get(directory, 0) + 1
+        _lookups[directory] = lookups
+        if lookups < LISTING_MIN_LOOKUPS:
+            return None
+        listing = list_directory(directory)
+        _listing_cache[directory] = listing
+
+    if listing is None:
+        return None
+    return (listing, name,)
+
+def cached_lstat(path:str|os.PathLike[str]) -> os.stat_result|None:
+    """Return the result of `os.lstat`, or None if the path does not exist."""
+    key = absolute_path(path)
+    try:
+        return _lstat_cache[key]
+    except KeyError:
+        pass
+    if _track_directories:
+        _note_directory(os.path.dirname(key))
+    return _lstat(key, _listing_of(key))
+
+def _lstat(key:str, listed:tuple[Listing,str]|None) -> os.stat_result|None:
+    result:os.stat_result|None = None
+    if listed is None or listed[1] in listed[0]:
+        try:
+            result = os.lstat(key)
+        except (OSError, ValueError):
+            pass
+    _lstat_cache[key] = result
+    return result
+
+def cached_stat(path:str|os.PathLike[str]) -> os.stat_result|None:
+    """Return the result of `os.stat`, or None if the path does not exist."""
+    key = absolute_path(path)
+    try:
+        return _stat_cache[key]
+    except KeyError:
+        pass
+    result = cached_lstat(key)
+    if result is not None and stat.S_ISLNK(result.st_mode):
+        try:
+            result = os.stat(key)
+        except (OSError, ValueError):
+            result = None
+    _stat_cache[key] = result
+    return result
+
+def path_mode(path:str|os.PathLike[str], follow_symlinks:bool = True) -> int:
+    """Return the mode bits of a path (see the `stat` module), or 0 if it does not exist."""
+    result = cached_stat(path) if follow_symlinks else cached_lstat(path)
+    return result.st_mode if result is not None else 0
+
+def _readlink(path:str) -> str|None:
+    try:
+        return _readlink_cache[path]
+    except KeyError:
+        pass
+    target:str|None
+    try:
+        target = os.readlink(path)
+    except (OSError, ValueError):
+        target = None
+    _readlink_cache[path] = target
+    return target
+
+def cached_realpath(path:str|os.PathLike[str]) -> str|None:
+    """Return the canonical path of an existing path, like `os.path.realpath`.
+
+    Return None if the path cannot be resolved, e.g., if one of its
+    components does not exist or in case of a loop of symbolic links.
+    """
+    key = absolute_path(path)
+    try:
+        return _realpath_cache[key]
+    except KeyError:
+        pass
+
+    # Components left to be resolved, in reverse order
+    pending = key.split("/")
+    pending.reverse()
+    resolved = "/"
+    links_left = MAX_SYMLINKS
+    result:str|None = None
+    while True:
+        if not pending:
+            result = resolved
+            break
+        name = pending.pop()
+        if not name or name == ".":
+            continue
+        if name == "..":
+            resolved = os.path.dirname(resolved)
+            continue
+        candidate = os.path.join(resolved, name)
+        if candidate in _lstat_cache:
+            metadata = _lstat_cache[candidate]
+            if metadata is None:
+                break
+            is_symlink = stat.S_ISLNK(metadata.st_mode)
+        else:
+            listed = _listing_of(candidate)
+            if listed is not None and name in listed[0]:
+                is_symlink = listed[0][name]
+            else:
+                metadata = _lstat(candidate, listed)
+                if metadata is None:
+                    break
+                is_symlink = stat.S_ISLNK(metadata.st_mode)
+        if is_symlink:
+            links_left -= 1
+            target = _readlink(candidate)
+            if target is None or links_left < 0:
+                break
+            if target.startswith("/"):
+                resolved = "/"
+            # The target is relative to the directory containing the link
+            pending.extend(reversed(target.split("/")))
+            continue
+        resolved = candidate
+
+    if _track_directories:
+        _note_directory(os.path.dirname(key))
+        if result is not None:
+            # The target of a symbolic link
+            _note_directory(os.path.dirname(result))
+    _realpath_cache[key] = result
+    return result
+
+__all__ = ["clear_stat_cache", "track_directories", "looked_up_directories", "add_looked_up_directories", "directory_state", "set_current_directory", "absolute_path", "list_directory", "cached_lstat", "cached_stat", "path_mode", "cached_realpath"]
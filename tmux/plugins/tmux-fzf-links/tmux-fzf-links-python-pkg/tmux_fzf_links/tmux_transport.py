@@ -0,0 +1,339 @@
+#===============================================================================
+#   Author: (c) 2024 Andrea Alberti
+#===============================================================================
+
+# Transports used to run tmux commands. The subprocess transport starts one
+# `tmux` process per command, and runs independent commands concurrently.
+# The control-mode transport keeps a single `tmux -C` client connected to
+# the server and pipelines commands over it.
+
+import os
+from typing import TYPE_CHECKING
+
+from .errors_types import CommandFailed
+from .tracing import span
+
+# `subprocess` is imported where it is used, as it is slow to import and
+# not needed until a tmux command is run
+if TYPE_CHECKING:
+    import subprocess
+
+# Environment variable with the name of the client where the key was pressed
+# (the key binding sets it to `#{client_name}`)
+CLIENT_ENV_VAR = "FZF_LINKS_CLIENT"
+
+# Commands acting on a client rather than on a pane, with the flag used to
+# target the client explicitly. Over control mode, the current client is the
+# control client itself, hence the flag must be added or the command must be
+# run as a subprocess.
+CLIENT_FLAGS:dict[str,str] = {
+    "display-message": "-c",
+    "display": "-c",
+    "set-buffer": "-t",
+}
+
+CLIENT_COMMANDS = {
+    "display-popup", "popup", "display-menu", "menu", "display-panes", "displayp",
+    "switch-client", "switchc", "detach-client", "detach", "refresh-client", "refresh",
+    "command-prompt", "confirm-before", "confirm", "choose-tree", "choose-buffer",
+    "choose-client", "suspend-client", "suspendc", "show-messages", "showmsgs",
+}
+
+def split_command_list(args:list[str]) -> list[list[str]]:
+    """Split the arguments of `tmux` at the `;` separators."""
+    commands:list[list[str]] = [[]]
+    for arg in args:
+        if arg == ';':
+            commands.append([])
+        else:
+            commands[-1].append(arg)
+    return [command for command in commands if command]
+
+def quote_arg(arg:str) -> str:
+    # Arguments in single quotes are taken literally by the tmux parser
+    return "'" + arg.replace("'", "'\\''") + "'"
+
+class TmuxTransport:
+    """Run tmux commands; `args` are the arguments that follow `tmux`."""
+
+    def run(self, args:list[str]) -> str:
+        raise NotImplementedError
+
+    def run_many(self, commands:list[list[str]]) -> list[str]:
+        """Run independent commands, whose order of execution does not matter."""
+        return [self.run(args) for args in commands]
+
+    def can_pipeline(self, args:list[str]) -> bool:
+        """Whether the command is run over a persistent connection."""
+        return False
+
+    def set_target(self, pane_id:str|None) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+class SubprocessTransport(TmuxTransport):
+    def run(self, args:list[str]) -> str:
+        import subprocess
+
+        try:
+            return subprocess.check_output(
+                ['tmux', *args],
+                shell=False,
+                text=True,
+                stderr=subprocess.PIPE,
+            )
+        except subprocess.CalledProcessError as e:
+            raise CommandFailed(f"tmux command failed: {(e.stderr or '').strip()}")
+        except OSError as e:
+            raise CommandFailed(f"tmux could not be executed: {e}")
+
+    def run_many(self, commands:list[list[str]]) -> list[str]:
+        import subprocess
+
+        # Start all processes before waiting for any of them
+        processes:list[subprocess.Popen[str]] = []
+        error:str = ""
+        for args in commands:
+            try:
+                processes.append(subprocess.Popen(
+                    ['tmux', *args],
+                    shell=False,
+                    text=True,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                ))
+            except OSError as e:
+                error = f"tmux could not be executed: {e}"
+                break
+
+        outputs:list[str] = []
+        for process in processes:
+            stdout, stderr = process.communicate()
+            if process.returncode != 0 and not error:
+                error = f"tmux command failed: {(stderr or '').strip()}"
+            outputs.append(stdout)
+        if error:
+            raise CommandFailed(error)
+        return outputs
+
+class ControlModeTransport(TmuxTransport):
+    def __init__(self):
+        self._process:"subprocess.Popen[str]|None" = None
+        self._target:str|None = None
+        self._sync_counter:int = 0
+        self._fallback = SubprocessTransport()
+
+    def _connect(self) -> "subprocess.Popen[str]":
+        import subprocess
+
+        if self._process is not None and self._process.poll() is None:
+            return self._process
+
+        cmd = ['tmux', '-C', 'attach-session', '-f', 'no-output,ignore-size']
+        if self._target:
+            cmd.extend(['-t', self._target])
+        self._process = subprocess.Popen(
+            cmd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            encoding="utf-8",
+            errors="replace",
+        )
+        return self._process
+
+    def _disconnect(self) -> None:
+        if self._process is not None:
+            try:
+                if self._process.stdin:
+                    self._process.stdin.close()
+                self._process.wait(timeout=1)
+            except Exception:
+                self._process.kill()
+            self._process = None
+
+    def close(self) -> None:
+        self._disconnect()
+
+    def set_target(self, pane_id:str|None) -> None:
+        if pane_id == self._target:
+            return
+        self._target = pane_id
+        if pane_id and self._process is not None and self._process.poll() is None:
+            # Make the pane current for the control client, so that commands
+            # without an explicit target apply to it
+            try:
+                self.run(['switch-client', '-t', pane_id])
+            except CommandFailed:
+                self._disconnect()
+
+    def _prepare(self, args:list[str]) -> list[str]|None:
+        """Return the command list to be sent over control mode, or None if it cannot be."""
+        if any('\n' in arg for arg in args):
+            # Commands are sent one per line
+            return None
+
+        client = os.environ.get(CLIENT_ENV_VAR, "")
+        prepared:list[str] = []
+        for command in split_command_list(args):
+            name = command[0]
+            flag = CLIENT_FLAGS.get(name)
+            if flag:
+                needs_client = not (name.startswith("display") and "-p" in command) and \
+                    not (name == "set-buffer" and "-w" not in command)
+                if needs_client and flag not in command:
+                    if not client:
+                        return None
+                    command = [name, flag, client, *command[1:]]
+            elif name in CLIENT_COMMANDS and name != "switch-client":
+                return None
+            if prepared:
+                prepared.append(';')
+            prepared.extend(command)
+        return prepared
+
+    def can_pipeline(self, args:list[str]) -> bool:
+        return self._prepare(args) is not None
+
+    def _read_block(self, process:"subprocess.Popen[str]") -> tuple[bool,list[str]]:
+        """Read the next reply to one of our commands; return its success and output lines."""
+        assert process.stdout is not None
+        guard:list[str]|None = None
+        lines:list[str] = []
+        while True:
+            line = process.stdout.readline()
+            if not line:
+                raise ConnectionError("tmux control mode connection closed")
+            line = line[:-1] if line.endswith('\n') else line
+
+            if guard is None:
+                if line.startswith("%begin "):
+                    fields = line.split(" ")
+                    guard = fields[1:3]
+                    # Flags 0 mark the reply to the `attach-session` command itself
+                    from_client = fields[3] != "0" if len(fields) > 3 else True
+                    lines = []
+                elif line.startswith("%exit"):
+                    raise ConnectionError("tmux control mode client exited")
+                # Any other line is a notification
+                continue
+
+            if (line.startswith("%end ") or line.startswith("%error ")) and line.split(" ")[1:3] == guard:
+                guard = None
+                if from_client:
+                    return (line.startswith("%end "), lines)
+                continue
+
+            lines.append(line)
+
+    def _pipeline(self, prepared_commands:list[list[str]]) -> list[tuple[bool,str]]:
+        process = self._connect()
+        assert process.stdin is not None
+
+        # Each command list is followed by a synchronization marker, because the
+        # number of replies is not known in advance: tmux stops at the first error
+        markers:list[str] = []
+        request:list[str] = []
+        for prepared in prepared_commands:
+            self._sync_counter += 1
+            marker = f"fzf-links-sync-{os.getpid()}-{self._sync_counter}"
+            markers.append(marker)
+            request.append(" ".join(arg if arg == ';' else quote_arg(arg) for arg in prepared))
+            request.append(f"display-message -p {marker}")
+        process.stdin.write("\n".join(request) + "\n")
+        process.stdin.flush()
+
+        results:list[tuple[bool,str]] = []
+        for marker in markers:
+            success = True
+            output:list[str] = []
+            while True:
+                block_success, lines = self._read_block(process)
+                if block_success and lines == [marker]:
+                    break
+                success = success and block_success
+                output.extend(lines)
+            results.append((success, "".join(f"{line}\n" for line in output),))
+        return results
+
+    def run_many(self, commands:list[list[str]]) -> list[str]:
+        outputs:list[str] = []
+        pending:list[list[str]] = []
+
+        def flush():
+            if not pending:
+                return
+            try:
+                results = self._pipeline(pending)
+            except (OSError, ConnectionError, ValueError):
+                # The connection could not be established or was lost;
+                # the next call will try to reconnect
+                self._disconnect()
+                results = []
+                for prepared in pending:
+                    try:
+                        results.append((True, self._fallback.run(prepared),))
+                    except CommandFailed as e:
+                        results.append((False, f"{e}",))
+            pending.clear()
+            for success, output in results:
+                if not success:
+                    raise CommandFailed(f"tmux command failed: {output.strip()}")
+                outputs.append(output)
+
+        for args in commands:
+            prepared = self._prepare(args)
+            if prepared is None:
+                flush()
+                outputs.append(self._fallback.run(args))
+            else:
+                pending.append(prepared)
+        flush()
+
+        return outputs
+
+    def run(self, args:list[str]) -> str:
+        return self.run_many([args])[0]
+
+TRANSPORT_TYPES:dict[str,type[TmuxTransport]] = {
+    "subprocess": SubprocessTransport,
+    "control": ControlModeTransport,
+}
+
+_transport:TmuxTransport = SubprocessTransport()
+
+def set_transport(kind:str) -> TmuxTransport:
+    """Select the transport; an existing connection is kept if the type does not change."""
+    global _transport
+    transport_type = TRANSPORT_TYPES.get(kind, SubprocessTransport)
+    if type(_transport) is not transport_type:
+        _transport.close()
+        _transport = transport_type()
+    return _transport
+
+def _forget_connection() -> None:
+    # A forked child (e.g., a scan worker) must not talk over the
+    # connection of its parent, nor close it
+    global _transport
+    if not isinstance(_transport, SubprocessTransport):
+        _transport = SubprocessTransport()
+
+os.register_at_fork(after_in_child=_forget_connection)
+
+def get_transport() -> TmuxTransport:
+    return _transport
+
+def run_tmux(args:list[str]) -> str:
+    """Run a tmux command with the current transport and return its output."""
+    with span("tmux", command=args[0]):
+        return _transport.run(args)
+
+def run_tmux_many(commands:list[list[str]]) -> list[str]:
+    """Run several independent tmux commands, concurrently or pipelined depending on the transport."""
+    with span("tmux", command=";".join(args[0] for args in commands)):
+        return _transport.run_many(commands)
+
+__all__ = ["TmuxTransport", "SubprocessTransport", "ControlModeTransport", "set_transport", "get_transport", "run_tmux", "run_tmux_many"]
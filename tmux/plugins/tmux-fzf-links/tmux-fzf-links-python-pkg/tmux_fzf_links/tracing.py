@@ -0,0 +1,134 @@
+#===============================================================================
+#   Author: (c) 2024 Andrea Alberti
+#===============================================================================
+
+# Timed spans around the stages of an invocation (see `@fzf-links-trace-filename`).
+# The spans are kept in memory and appended to the trace file at the end of
+# the invocation, either in the Chrome trace-event format, which can be
+# opened in Perfetto (https://ui.perfetto.dev) or chrome://tracing, or as
+# JSON lines if the file name ends with `.jsonl`.
+#
+# The Chrome format is a JSON array whose closing bracket may be omitted, so
+# that the invocations, including those served by the daemon, are appended
+# to the same file. Times are taken with the monotonic clock, which is
+# shared by all processes, so that the spans of the daemon and of the
+# processes it starts are on the same timeline.
+#
+# When tracing is disabled, `span` returns a shared object whose methods do
+# nothing, and no time is taken.
+
+import os
+import time
+from typing import Iterable, Iterator, TypeVar
+
+T = TypeVar("T")
+
+# Category of the events in the Chrome format
+CATEGORY = "fzf-links"
+
+_trace_filename:str = ""
+_events:list[dict] = []
+
+class Span:
+    """Record the time spent in a `with` block."""
+
+    __slots__ = ("name", "args", "start_ns",)
+
+    def __init__(self, name:str, args:dict):
+        self.name = name
+        self.args = args
+        self.start_ns = 0
+
+    def __enter__(self) -> "Span":
+        self.start_ns = time.monotonic_ns()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        add_span(self.name, self.start_ns, time.monotonic_ns(), self.args)
+
+    def set(self, **args) -> None:
+        """Attach arguments known at the end of the span, e.g., a number of items."""
+        self.args.update(args)
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self) -> "_NoSpan":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        pass
+
+    def set(self, **args) -> None:
+        pass
+
+_NO_SPAN = _NoSpan()
+
+def start_tracing(trace_filename:str) -> None:
+    """Enable tracing for the current invocation, or disable it with an empty file name."""
+    global _trace_filename
+    _trace_filename = trace_filename
+    _events.clear()
+
+def tracing_enabled() -> bool:
+    return bool(_trace_filename)
+
+def span(name:str, **args) -> Span|_NoSpan:
+    """Return a context manager timing a stage."""
+    if not _trace_filename:
+        return _NO_SPAN
+    return Span(name, args)
+
+def add_span(name:str, start_ns:int, end_ns:int, args:dict|None = None) -> None:
+    """Record a span whose start and end were taken with `time.monotonic_ns`."""
+    if not _trace_filename:
+        return
+    import threading
+
+    _events.append({
+        "name": name,
+        "cat": CATEGORY,
+        "ph": "X",
+        "ts": start_ns / 1e3, # microseconds
+        "dur": (end_ns - start_ns) / 1e3,
+        "pid": os.getpid(),
+        "tid": threading.get_native_id(),
+        "args": args or {},
+    })
+
+def span_steps(name:str, iterable:Iterable[T]) -> Iterator[T]:
+    """Yield the items of an iterable, recording a span for the production of each one.
+
+    Useful for generators that do their work lazily, e.g., while fzf runs.
+    """
+    if not _trace_filename:
+        yield from iterable
+        return
+    iterator = iter(iterable)
+    while True:
+        with span(name):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+def write_trace() -> None:
+    """Append the spans of the invocation to the trace file and disable tracing."""
+    global _trace_filename
+    if not _trace_filename:
+        return
+
+    import json
+
+    trace_filename = _trace_filename
+    _trace_filename = ""
+    chrome_format = not trace_filename.endswith(".jsonl")
+    with open(trace_filename, "a") as trace_file:
+        if chrome_format and trace_file.tell() == 0:
+            trace_file.write("[\n")
+        for event in _events:
+            trace_file.write(json.dumps(event, default=str) + (",\n" if chrome_format else "\n"))
+    _events.clear()
+
+__all__ = ["add_span", "span", "span_steps", "start_tracing", "tracing_enabled", "write_trace"]
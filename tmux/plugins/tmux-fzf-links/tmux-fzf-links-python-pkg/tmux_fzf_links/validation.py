@@ -0,0 +1,136 @@
+#===============================================================================
+#   Author: (c) 2024 Andrea Alberti
+#===============================================================================
+
+# Two-phase validation of the candidates (see `@fzf-links-async-validation`).
+# The pre_handlers of the schemes marked as `slow` (e.g., those of the file
+# scheme, which resolve paths and look up their colors) are not called by
+# the scan. Their matches are first offered as they are, with the first tag
+# of their scheme, and are validated while fzf is displayed; the list shown
+# by fzf is then reloaded, without the matches rejected by the pre_handlers
+# and with the text and tag returned by them.
+#
+# The outcome is the same as calling every pre_handler during the scan: a
+# text is offered with the first scheme, in the order of the schemes and of
+# their regexes, whose pre_handler accepts it. The items keep their index
+# across reloads, so that the index of a selected item always refers to the
+# same text.
+
+import logging
+import time
+from typing import Generator, Literal, Match, TypedDict
+
+from .candidate_index import IndexedCandidate
+from .opener import PreHandledMatch, SchemeEntry
+from .scanner import Scanner
+from .scan_cache import scan_lane_candidates
+from .scan_guard import guarded_scan_lanes
+from .scan_pool import pre_handle
+
+# The list shown by fzf is reloaded after validating for this long
+VALIDATION_BATCH_SECONDS = 0.1
+
+class LaneCandidate(TypedDict):
+    scheme_index: int
+    match: Match[str] # first occurrence in the lane
+    state: Literal["pending","accepted","rejected"]
+    pre_handled_match: PreHandledMatch|None # None while pending or if rejected
+    positions: set[int] # start of every occurrence in the lane
+
+def slow_lanes(scanner:Scanner) -> set[int]:
+    """Return the lanes whose pre_handler is marked as slow."""
+    return {
+        idx for idx, (scheme_index, _) in enumerate(scanner.lane_owners)
+        if scanner.schemes[scheme_index].get("slow", False)
+    }
+
+class Validation:
+    """Candidates of the texts found in the content, validated on demand."""
+
+    def __init__(self, schemes:list[SchemeEntry], scanner:Scanner, content:str, pane_id:str, current_path:str, processes:int = 0):
+        self.schemes = schemes
+        deferred = slow_lanes(scanner)
+
+        # The lanes whose pre_handler is cheap are scanned as usual; the
+        # pre_handlers of the other lanes are not called yet
+        lanes = scan_lane_candidates(scanner, content, pane_id, current_path, processes, lanes=set(range(len(scanner.lane_owners))) - deferred)
+        deferred_matches = guarded_scan_lanes(scanner, content, deferred) if deferred else []
+
+        # Candidates of each text by lane, in the order of the lanes
+        self.texts:dict[str,dict[int,LaneCandidate]] = {}
+        for idx, (scheme_index, _) in enumerate(scanner.lane_owners):
+            if idx in deferred:
+                found = [(match, None,) for match in deferred_matches[idx]]
+            else:
+                found = [(match, pre_handled_match,) for _, match, pre_handled_match in lanes[idx]]
+            for match, pre_handled_match in found:
+                text_lanes = self.texts.setdefault(match.group(0), {})
+                candidate = text_lanes.get(idx)
+                if candidate is None:
+                    text_lanes[idx] = {
+                        "scheme_index": scheme_index,
+                        "match": match,
+                        "state": "pending" if pre_handled_match is None else "accepted",
+                        "pre_handled_match": pre_handled_match,
+                        "positions": {match.start()},
+                    }
+                else:
+                    candidate["positions"].add(match.start())
+
+    def validate(self, text:str) -> None:
+        """Call the pending pre_handlers of a text."""
+        for candidate in self.texts[text].values():
+            if candidate["state"] == "pending":
+                pre_handled_match = pre_handle(self.schemes[candidate["scheme_index"]], candidate["match"])
+                candidate["state"] = "accepted" if pre_handled_match else "rejected"
+                candidate["pre_handled_match"] = pre_handled_match
+
+    def resolve(self, text:str) -> IndexedCandidate|None:
+        """Return the candidate offered for a text, or None if the text is rejected.
+
+        A pending candidate is offered with its match as display text and
+        with the first tag of its scheme.
+        """
+        logger = logging.getLogger()
+        offered:IndexedCandidate|None = None
+        for candidate in self.texts[text].values():
+            if candidate["state"] == "rejected":
+                continue
+            if offered is not None:
+                # Other lanes finding the same text
+                offered["positions"].update(candidate["positions"])
+                continue
+
+            scheme = self.schemes[candidate["scheme_index"]]
+            pre_handled_match = candidate["pre_handled_match"]
+            if pre_handled_match is None:
+                pre_handled_match = {"display_text": text, "tag": scheme["tags"][0]}
+            elif pre_handled_match["tag"] not in scheme["tags"]:
+                logger.warning(f"the tag returned dynamically '{pre_handled_match['tag']}' is not included in: {scheme['tags']}")
+                candidate["state"] = "rejected"
+                continue
+
+            offered = {
+                "scheme_index": candidate["scheme_index"],
+                "pre_handled_match": pre_handled_match,
+                "match": candidate["match"],
+                "position": candidate["match"].start(),
+                "positions": set(candidate["positions"]),
+            }
+        return offered
+
+    def validate_batches(self, texts:list[str]) -> Generator[None,None,None]:
+        """Validate the texts in the given order, pausing after each batch."""
+        deadline = time.monotonic() + VALIDATION_BATCH_SECONDS
+        validated = False
+        for text in texts:
+            self.validate(text)
+            validated = True
+            if time.monotonic() >= deadline:
+                yield
+                deadline = time.monotonic() + VALIDATION_BATCH_SECONDS
+                validated = False
+        if validated:
+            yield
+
+__all__ = ["Validation", "slow_lanes"]